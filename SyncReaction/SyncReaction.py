@@ -5,17 +5,36 @@ import websockets
 import signal
 import argparse
 import time
-import ssl
-from python_mpv_jsonipc import MPV
-from urllib.parse import urlparse, parse_qs
+import ipaddress
+import secrets
+import stat
+import contextvars
+from async_mpv import AsyncMPV, PropertyMirror
+from mpv_events import EventChannel
+from osd_status import OsdStatus
+from hub import Viewer, ViewerGroup
+from profiler import Profiler, Capture
+from sync_controller import SyncAction, controllers
+from delay_map import DelayMap
+import wire
+from metrics import Metrics, DRIFT_BUCKETS, DURATION_BUCKETS, LATENCY_BUCKETS
+from http import HTTPStatus
+from urllib.parse import urlparse, parse_qs, unquote, urlencode
 from pathlib import Path
 from enum import Enum
+from collections import Counter, deque
+from itertools import count
 
 from typing import Any, TYPE_CHECKING, ClassVar, Literal
 from collections.abc import Callable
 
 if TYPE_CHECKING:
     from uuid import UUID
+    from ssl import SSLContext
+    from python_mpv_jsonipc import MPV
+    from delay_store import DelayStore
+    from session_trace import TraceRecorder
+    from websockets.http11 import Request, Response
 
 # Uncomment the following 4 lines to monitor websocket connection
 
@@ -25,17 +44,38 @@ if TYPE_CHECKING:
 # logger.setLevel(logging.DEBUG)
 # logger.addHandler(logging.StreamHandler())
 
-parser = argparse.ArgumentParser()
-parser.add_argument("-c", "--cache", action="store_true", default=False)
-parser.add_argument("-s", "--subprocess", action="store_true", default=False)
-parser.add_argument("--socket", default=None)
-parser.add_argument("--ssl", action="store_true", default=False)
-
-args = parser.parse_args()
-useCached: bool = args.cache
-subprocess: bool = args.subprocess
-SOCKET: str | None = args.socket
-use_ssl: bool = args.ssl
+useCached: bool = False
+subprocess: bool = False
+SOCKET: str = "/tmp/mpvsocket"  # noqa: S108
+SOCKETS: list[str] = []  # every mpv to sync, SOCKET if none is given
+socket_dir: Path | None = None  # mpv sockets appearing here are synced as well
+use_ssl: bool = False
+daemon: bool = False
+profile: bool = False
+HANDED_OVER: int = 3  # exit status once another server took over the mpv, see main.lua
+
+
+def parse_args() -> None:
+    global useCached, subprocess, SOCKETS, socket_dir, use_ssl, daemon, profile  # noqa: PLW0603
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-c", "--cache", action="store_true", default=False)
+    parser.add_argument("-s", "--subprocess", action="store_true", default=False)
+    parser.add_argument("--socket", action="append", default=[])
+    parser.add_argument("--socket-dir", type=Path, default=None)
+    parser.add_argument("--ssl", action="store_true", default=False)
+    parser.add_argument("-d", "--daemon", action="store_true", default=False)
+    parser.add_argument("--profile", action="store_true", default=False)
+
+    args = parser.parse_args()
+    useCached = args.cache
+    subprocess = args.subprocess
+    SOCKETS = args.socket
+    socket_dir = args.socket_dir
+    if not SOCKETS and socket_dir is None:
+        SOCKETS = [SOCKET]
+    use_ssl = args.ssl
+    daemon = args.daemon
+    profile = args.profile
 
 
 class Options:
@@ -43,152 +83,423 @@ class Options:
     PORT: int = 8001  # PORT used for websocket server
     pause_to_sync: bool = True
     cache_size:int = 20
+    sync_controller: str = "ladder"  # "ladder" or "pi"
+    send_queue_size: int = 32  # frames waiting for a slow client before dropping
+    send_queue_policy: str = "drop-oldest"  # "drop-oldest" or "coalesce"
+    report_interval: int = 0  # ms between playback reports while converging, 0 = every timeupdate
+    heartbeat_interval: int = 5000  # ms between playback reports once synced
+    prefetch_entries: int = 3  # upcoming playlist entries whose delays are looked up in daemon mode
+    record_trace: bool = False  # write a session trace to script-opts/SyncReaction/traces
+    auto_delay: bool = False  # detect the delay from the audio instead of a manual sync, needs numpy
+    audio_decoder: str = "mpv"  # mpv executable used to decode the audio of the open file
+    learn_segments: bool = False  # a browser seek that holds starts a new delay segment instead of being undone
+    hub: bool = False  # watch party: accept remote browsers as passive viewers
+    hub_host: str = "0.0.0.0"  # noqa: S104  # address the server binds in hub mode
+    resume_grace: float = 30  # seconds a dropped client can reconnect and keep its state, 0 disables
+    schedule_sync: bool = True  # userscripts that can correct their own drift against the mpv timeline do
+
+
+class MpvSession:
+    """The mpv player of a session."""
+
+    seek_debounce: float = 0.15  # seconds without seeking events before a scrub is over
+
+    def __init__(self, socket: str) -> None:
+        self.socket = socket
+        self.queue_priority = 0
+        self.eof = False
+        self.mpvQ = asyncio.PriorityQueue()  # (priority, sequence, message)
+        self.sequence = count()  # tie breaker, also identifies the newest message for a key
+        self.latest: dict[tuple["UUID", str], int] = {}
+        self.coalesced: Counter[str] = Counter()  # superseded messages dropped, per property
+        self.ipc: AsyncMPV  # non-blocking connection used from the event loop
+        self.jsonipc: "MPV | None" = None  # blocking connection for key bindings and observers
+        self.events: EventChannel  # jsonipc callbacks, delivered on the event loop
+        self.state = PropertyMirror()
+        self.timeline: tuple[float, float, float] | None = None  # mpv time, rate and monotonic time of the last schedule
+        # Messages and the status of every client share one overlay, redrawn by the "osd" task
+        self.osd = OsdStatus(draw_osd)
+        self.observers_bound = False
+        self.current_file: str | None = None
+        self.upcoming: dict[str, DelayMap] = {}  # cache key -> delays of the next playlist entries
+        self.fingerprints: dict[str, asyncio.Task] = {}  # path -> audio envelope of the file
+
+
+class SyncSession:
+    """The browsers of a session."""
+
+    def __init__(self, *, use_cached: bool, daemon: bool) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.use_cached = use_cached
+        self.daemon = daemon
+        self.player_focus: "UUID"
+        self.current_speed: float = 1
+        self.clients: dict["UUID", "PlayerClient"] = {}
+        self.tasks: dict[str, asyncio.Task] = {}
+        self.onboarding = asyncio.Lock()
+        self.ready = asyncio.Event()  # set once mpv bindings are in place, clients are routed here after
+        self.joining: set["UUID"] = set()  # connections routed here, onboarded or not
+        self.barrier: "ResumeBarrier | None" = None  # set while a paused seek waits for the players
+        self.viewers: dict["UUID", Viewer] = {}  # watch party, not part of the sync control
+        self.groups: dict[str, ViewerGroup] = {}  # video id -> its viewers
+        # resume token -> dropped client, the file it was synced to and its expiry
+        self.suspended: dict[str, tuple["PlayerClient", str, asyncio.TimerHandle]] = {}
+
+
+class Session:
+    """One mpv player and the browsers synced to it, a server can drive several."""
+
+    def __init__(self, socket: str, *, use_cached: bool, daemon: bool) -> None:
+        self.mpv = MpvSession(socket)
+        self.sync = SyncSession(use_cached=use_cached, daemon=daemon)
+
+
+class SessionView:
+    """Attributes of one part of the session the running code belongs to.
+
+    Every task and callback runs in the context of a session, tasks inherit
+    it from the code that created them, so the sync code reads
+    MpvContext.state or SyncContext.clients without passing the session
+    around. Only connections (routed in handler) and code handling every
+    session have to choose one.
+    """
+
+    __slots__ = ("_part",)
+
+    def __init__(self, part: str) -> None:
+        object.__setattr__(self, "_part", part)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(getattr(current_session.get(), self._part), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(getattr(current_session.get(), self._part), name, value)
+
+
+current_session: contextvars.ContextVar[Session] = contextvars.ContextVar("session")
+sessions: list[Session] = []  # in the order they were attached
+MpvContext: MpvSession = SessionView("mpv")  # type: ignore[assignment]
+SyncContext: SyncSession = SessionView("sync")  # type: ignore[assignment]
+
+
+def in_session(session: Session, func: Callable[..., Any], *args: Any) -> Any:
+    """Call func in the context of session, the tasks it creates stay in it."""
+    context = contextvars.copy_context()
+    context.run(current_session.set, session)
+    return context.run(func, *args)
+
+
+class Startup:
+    """Time spent reaching each startup stage, reported once the script is ready."""
+
+    started = time.perf_counter()
+    stages: list[tuple[str, float]] = []  # noqa: RUF012
+    ready = asyncio.Event()  # set once mpv bindings and the cache are available
 
+    @staticmethod
+    def mark(stage: str) -> None:
+        Startup.stages.append((stage, time.perf_counter() - Startup.started))
 
-class MpvContext:
-    current_osd: str = ""
-    queue_priority: int = 0
-    eof: bool = False
-    mpvQ = asyncio.PriorityQueue()
-    mpv_pause_binding = None
-
-
-class SyncContext:
-    loop: asyncio.AbstractEventLoop
-    player_focus: "UUID"
-    current_speed: float = 1
-    clients: dict["UUID", "PlayerClient"] = {}  # noqa: RUF012
-    tasks: dict[str, asyncio.Task] = {}  # noqa: RUF012
-
+    @staticmethod
+    def report() -> None:
+        text = ", ".join(f"{stage} {elapsed * 1000:.0f} ms" for stage, elapsed in Startup.stages)
+        print(f"startup: {text}", flush=True)
+        # main.lua adds the time since the keypress
+        MpvContext.ipc.command_nowait("script-message", "SyncReaction-ready", text)
+
+
+directory: Path
+ssl_context: "SSLContext | None" = None
+cache: "DelayStore | None" = None
+tracer: "TraceRecorder | None" = None
+profiler = Profiler()  # idle until a window is opened with Alt+Ctrl+p or --profile
+stopping: bool = False  # stop_server ran, the tasks are being cancelled
+attach_key: str | None = None  # written for hand_over, only this user can read it
+
+telemetry = Metrics()
+telemetry.counter("messages_received_total", "Websocket messages received, by type")
+telemetry.counter("corrections_total", "Corrections decided by the sync controller, by client and action")
+telemetry.counter("dropped_frames_total", "Frames dropped from a full client outbox")
+telemetry.counter("malformed_frames_total", "Received frames that are not a message, skipped")
+telemetry.histogram("drift_seconds", "Absolute drift of a client at each playback report", DRIFT_BUCKETS)
+telemetry.histogram("convergence_seconds", "Time from the first correction to synced", DURATION_BUCKETS)
+telemetry.histogram("mpv_ipc_seconds", "Round trip of mpv IPC commands", LATENCY_BUCKETS)
+telemetry.histogram("send_seconds", "Time to write a frame to a client websocket", LATENCY_BUCKETS)
+telemetry.gauge("mpv_queue_depth", "Messages waiting in the mpv queues", lambda: sum(s.mpv.mpvQ.qsize() for s in sessions))
+telemetry.gauge("outbox_depth", "Frames waiting in the client outboxes", lambda: sum(len(c.outbox) for s in sessions for c in s.sync.clients.values()))
+telemetry.gauge("clients", "Connected clients", lambda: sum(len(s.sync.clients) for s in sessions))
+telemetry.gauge("viewers", "Connected watch party viewers", lambda: sum(len(s.sync.viewers) for s in sessions))
+telemetry.gauge("sessions", "mpv players being synced", lambda: len(sessions))
+telemetry.counter("osd_frames_total", "Status overlay redraws sent to mpv")
+telemetry.counter("sessions_resumed_total", "Clients that reconnected with a resume token")
 
 # ------------- Connect to mpv -------------------------------------
 
-if SOCKET is None:
-    SOCKET = "/tmp/mpvsocket"  # noqa: S108
-
-while True:
-    try:
-        mpv = MPV(start_mpv=False, ipc_socket=SOCKET)
-        break
-    except Exception as e:
-        if subprocess:
-            print("Failed to start mpv.", flush=True)
-            raise SystemExit(e) from e
-        input(
-            f"Open video with mpv (or mpv based player) using the option --input-ipc-server={SOCKET}, then press ENTER"
-        )
-
-mpv.keep_open = "always"  # Leave the player on the last frame rather then closing or moving to the next file
-mpv.video_sync = "audio"
-
-# ------- Get script directory -----------------------------
-
-directory = Path(mpv.expand_path("~~/script-opts/SyncReaction"))
-
-if not directory.is_dir():
-    directory.mkdir(parents=True)
+async def connect_mpv() -> None:
+    # main.lua starts the script right after setting input-ipc-server, retry
+    # with backoff until mpv has created the socket
+    backoff = 0.05
+    while True:
+        try:
+            MpvContext.ipc = await AsyncMPV.connect(MpvContext.socket)
+            MpvContext.ipc.on_latency = lambda seconds: telemetry.observe("mpv_ipc_seconds", seconds)
+            return
+        except OSError as e:
+            if not subprocess:
+                await asyncio.to_thread(
+                    input,
+                    f"Open video with mpv (or mpv based player) using the option --input-ipc-server={MpvContext.socket}, then press ENTER",
+                )
+            elif backoff > 5:  # noqa: PLR2004
+                print("Failed to start mpv.", flush=True)
+                raise SystemExit(e) from e
+            else:
+                await asyncio.sleep(backoff)
+                backoff *= 2
+
+
+def attach_jsonipc() -> None:
+    """Blocking jsonipc connection used for key bindings and observers, run in a thread."""
+    from python_mpv_jsonipc import MPV  # noqa: PLC0415
+
+    mpv = MPV(start_mpv=False, ipc_socket=MpvContext.socket)
+    mpv.quit_callback = MpvContext.events.key_binding(stopScript)
+    MpvContext.jsonipc = mpv
+    bind_keys()
 
 # ------- Setup SSL certificate if needed --------------------
 
-if use_ssl:
+def load_ssl() -> None:
+    global ssl_context  # noqa: PLW0603
+    if not use_ssl:
+        return
+    import ssl  # noqa: PLC0415
+
     ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
 
     ssl_cert = directory / "fullchain.pem"
     ssl_key = directory / "cert-key.pem"
 
     ssl_context.load_cert_chain(ssl_cert, keyfile=ssl_key)
-else:
-    ssl_context = None
 
-# ------- Load Cache ----------------------------------------
+# ------- Load Options ----------------------------------------
 
-if not (directory / "SyncReaction_cache.json").is_file():
-    with open(directory / "SyncReaction_cache.json", "w") as f:
-        json.dump({}, f)
+def load_options() -> None:
+    if not (directory / "SyncReaction_options.json").is_file():
+        with open(directory / "SyncReaction_options.json", "w") as f:
+            options = {
+                "PORT": 8001,
+                "cache_size": 20,
+                "pauseToSync": True,
+                "syncController": "ladder",
+                "sendQueueSize": 32,
+                "sendQueuePolicy": "drop-oldest",
+                "reportInterval": 0,
+                "heartbeatInterval": 5000,
+                "prefetchEntries": 3,
+                "recordTrace": False,
+                "autoDelay": False,
+                "audioDecoder": "mpv",
+                "learnSegments": False,
+                "hub": False,
+                "hubHost": "0.0.0.0",
+                "resumeGrace": 30,
+                "scheduleSync": True,
+            }
+            json.dump(options, f, indent=4)
+
+    with open(directory / "SyncReaction_options.json") as f:
+        try:
+            options = json.load(f)
+            Options.PORT = options["PORT"]  # PORT used for websocket server
+            Options.pause_to_sync = options["pauseToSync"]
+            Options.cache_size = options["cache_size"]
+            Options.sync_controller = options.get("syncController", Options.sync_controller)
+            Options.send_queue_size = options.get("sendQueueSize", Options.send_queue_size)
+            Options.send_queue_policy = options.get("sendQueuePolicy", Options.send_queue_policy)
+            Options.report_interval = options.get("reportInterval", Options.report_interval)
+            Options.heartbeat_interval = options.get("heartbeatInterval", Options.heartbeat_interval)
+            Options.prefetch_entries = options.get("prefetchEntries", Options.prefetch_entries)
+            Options.record_trace = options.get("recordTrace", Options.record_trace)
+            Options.auto_delay = options.get("autoDelay", Options.auto_delay)
+            Options.audio_decoder = options.get("audioDecoder", Options.audio_decoder)
+            Options.learn_segments = options.get("learnSegments", Options.learn_segments)
+            Options.hub = options.get("hub", Options.hub)
+            Options.hub_host = options.get("hubHost", Options.hub_host)
+            Options.resume_grace = options.get("resumeGrace", Options.resume_grace)
+            Options.schedule_sync = options.get("scheduleSync", Options.schedule_sync)
+        except ValueError:
+            pass
 
-with open(directory / "SyncReaction_cache.json") as f:
-    try:
-        cache = json.load(f)
-    except ValueError:
-        cache = {}
-        # json.dump(cache, f, indent=4)
+# ------- Load Cache ----------------------------------------
 
-# ------- Load Options ----------------------------------------
+def load_cache() -> None:
+    global cache  # noqa: PLW0603
+    from delay_store import DelayStore  # noqa: PLC0415
 
-if not (directory / "SyncReaction_options.json").is_file():
-    with open(directory / "SyncReaction_options.json", "w") as f:
-        options = {
-            "PORT": 8001,
-            "cache_size": 20,
-            "pauseToSync": True
-        }
-        json.dump(options, f, indent=4)
+    # An existing SyncReaction_cache.json is imported on first start
+    cache = DelayStore(directory, Options.cache_size)
 
-with open(directory / "SyncReaction_options.json") as f:
+def load_trace() -> None:
+    global tracer  # noqa: PLW0603
+    if not Options.record_trace:
+        return
+    from session_trace import TraceRecorder  # noqa: PLC0415
+
+    traces = directory / "traces"
+    traces.mkdir(exist_ok=True)
+    tracer = TraceRecorder(traces / f"{time.strftime('%Y%m%d-%H%M%S')}.ndjson.gz", {
+        "controller": Options.sync_controller,
+        "max_diff": PlayerClient.max_diff,
+        "mid_diff": PlayerClient.mid_diff,
+        "accuracy": PlayerClient.accuracy,
+        "pause_to_sync": Options.pause_to_sync,
+        "report_interval": Options.report_interval,
+        "heartbeat_interval": Options.heartbeat_interval,
+    })
+    print(f"recording trace to {tracer.path}", flush=True)
+
+async def reference_envelope() -> Any:
+    """Audio envelope of the open file, decoded once per file in a thread."""
+    from audio_sync import FingerprintIndex  # noqa: PLC0415
+
+    path = await MpvContext.ipc.get_property("path")
+    if "://" not in path and not os.path.isabs(path):
+        path = os.path.join(await MpvContext.ipc.get_property("working-directory"), path)
+    if path not in MpvContext.fingerprints:
+        index = FingerprintIndex(directory / "fingerprints", Options.audio_decoder)
+        MpvContext.fingerprints[path] = asyncio.create_task(asyncio.to_thread(index.envelope, path))
+    return await asyncio.shield(MpvContext.fingerprints[path])
+
+async def prepare_auto_delay() -> None:
+    # start decoding before the first client asks for it
     try:
-        options = json.load(f)
-        Options.PORT = options["PORT"]  # PORT used for websocket server
-        Options.pause_to_sync = options["pauseToSync"]
-        Options.cache_size = options["cache_size"]
-    except ValueError:
-        pass
+        await reference_envelope()
+    except ImportError:
+        print("autoDelay needs numpy (pip install numpy), using manual sync", flush=True)
+        Options.auto_delay = False
+    except (OSError, RuntimeError) as e:
+        print(f"autoDelay: could not decode the audio: {e}", flush=True)
 
 # -------------------------------------------------------------
 
-if subprocess:
-    # If the script is being run as a subprocess, sync info will be
-    # displayed on the player OSD
+def draw_osd(text: str) -> None:
+    # a single ASS event, \N breaks its lines
+    data = "{\\pos(25, 25)}" + text.replace("\n", "\\N") if text else ""
+    MpvContext.ipc.command_nowait("osd-overlay", 5, "ass-events", data)
+    telemetry.inc("osd_frames_total")
 
-    async def osd_output(text: str, duration: int) -> None:
-        MpvContext.current_osd = text
-        mpv.osd_overlay(5, "ass-events", "{\\pos(25, 25)}"+text)
-        if duration > -1:
-            await asyncio.sleep(duration)
-            if MpvContext.current_osd == text:
-                mpv.osd_overlay(5, "ass-events", "")
 
-    def show_info(text: str, duration: int = -1, method: Literal["osd", "show-text"] = "osd") -> None:
-        if method == "osd":
-            asyncio.create_task(osd_output(text, duration))  # noqa: RUF006
-        elif method == "show-text":
-            mpv.show_text(text, duration)
+def show_info(text: str, duration: float = -1, method: Literal["osd", "show-text"] = "osd") -> None:
+    if not subprocess:
+        print(text, flush=True)
+    # If the script is being run as a subprocess, sync info will be
+    # displayed on the player OSD
+    elif method == "osd":
+        MpvContext.osd.show(text, duration)
+    elif method == "show-text":
+        MpvContext.ipc.command_nowait("show-text", text, duration)
+
+
+def follow_mpv(name: str, value: Any) -> None:
+    """Follow mpv into new delay segments, send the schedules again once mpv leaves their timeline."""
+    if tracer is not None:
+        tracer.record("mpv", None, {name: value})
+    if name == "playback-time":
+        mpv_time = MpvContext.state.playback_time()
+        for client in list(SyncContext.clients.values()):
+            client.follow_segments(mpv_time)
+    timeline = MpvContext.timeline
+    if timeline is None:
+        return
+    position, rate, stamp = timeline
+    state = MpvContext.state
+    now = time.monotonic()
+    if state.rate() != rate or abs(state.playback_time(now) - position - rate * (now - stamp)) > PlayerClient.schedule_tolerance:
+        MpvContext.timeline = None
+        for client in SyncContext.clients.values():
+            client.publish_schedule()
 
-else:
 
-    def show_info(text: str, duration: int = -1, method: Literal["osd", "show-text"] = "osd") -> None:
-        print(text, flush=True)
+def set_mpv_property(name: str, value: Any) -> None:
+    """Write an mpv property and mirror it locally until mpv confirms it."""
+    MpvContext.ipc.set_property(name, value)
+    MpvContext.state.update(name, value)
+    if tracer is not None:
+        tracer.record("mpv", None, {"set": name, "value": value})
 
 
-# If full, delete the oldest entry before updating cache file
-def updateCache(current: str, delay: float) -> None:
-    if len(cache) > Options.cache_size:
-        # delete oldest entry
-        cache.pop(next(iter(cache)))
-    currtime = time.strftime("%Y-%m-%d %H:%M", time.localtime(time.time()))
-    cache[current] = [delay, currtime]
-    with open(directory / "SyncReaction_cache.json", "w") as f:
-        json.dump(cache, f, indent=4)
+# If full, the least recently used entry is evicted, the write happens in the background
+def updateCache(current: str, delays: DelayMap) -> None:
+    cache.put(current, delays)
 
 # -------------- mpv callbacks ------------------------------------
+# delivered on the event loop by MpvContext.events
 
 def syncPause(name: str, value: bool) -> None:  # noqa: FBT001
     """Update clients playback state to match mpv player."""
     if MpvContext.eof:
         return
+    if not value and SyncContext.barrier is not None:
+        return  # resumed by release_barrier once every player is ready
+    if any(client.sleeping for client in SyncContext.clients.values()):
+        return  # mpv waits for the main player, the others keep going
+    broadcast_viewers("pause", value)
     for client in SyncContext.clients.values():
         client.setProperty_sync("pause", value)
         if value:
             client.setProperty_sync("removeListener", "playback-time")
         else:
-            client.setProperty_sync("addListener", "playback-time")
-            client.accuracy = 0.05
+            client.request_reports()
+            client.controller.tighten()
+            if tracer is not None:
+                tracer.record("control", client.trace_id, "tighten")
+
 
+def syncSeeking(name: str, value: bool) -> None:  # noqa: FBT001
+    """Pause while mpv seeks, then move the clients to the new position."""
+    # scrubbing is debounced: the first seek holds playback, the last one moves the clients
+    if value:
+        hold_playback(resume=not MpvContext.state["pause"])
+        set_mpv_property("pause", True)
+    else:
+        seek_clients(MpvContext.state.playback_time())
 
-def syncSeeking(name: str, value: float) -> None:
-    """Update clients playback-time to match mpv player."""
-    mpv.pause = True
+
+def hold_playback(*, resume: bool) -> "ResumeBarrier":
+    """Start or join the barrier of a paused seek, mpv is one of its players."""
+    barrier = SyncContext.barrier
+    if barrier is None:
+        barrier = SyncContext.barrier = ResumeBarrier(resume=resume)
+        barrier.add("mpv")
+        SyncContext.tasks["barrier"] = asyncio.create_task(release_barrier(barrier))
+    else:
+        barrier.resume = barrier.resume or resume
+    return barrier
+
+
+def seek_clients(playback_time: float) -> None:
+    barrier = SyncContext.barrier
     for client in SyncContext.clients.values():
-        client.setProperty_sync("playback-time", mpv.playback_time + client.delay)
+        client.reset_segment(playback_time)
+        client.seek(playback_time, barrier)
+    # viewers are not waited for, they catch up after the resume
+    lead = 0 if barrier is not None else SeekLatency.initial * (MpvContext.state["speed"] or 1)
+    for group in SyncContext.groups.values():
+        group.seek(playback_time + group.delays.at(playback_time) + lead)
+    if barrier is not None:
+        barrier.ready("mpv")
+
+
+async def release_barrier(barrier: "ResumeBarrier") -> None:
+    late = await barrier.wait()
+    if late:
+        ids = ", ".join(str(SyncContext.clients[key].id) for key in late if key in SyncContext.clients)
+        print(f"resuming without: {ids or 'mpv'}", flush=True)
+    SyncContext.barrier = None
+    if barrier.resume:
+        # core-idle follows, syncPause resumes every client in the same step
+        set_mpv_property("pause", False)
 
 
 def syncSpeed(name: str, value: float) -> None:
@@ -197,12 +508,14 @@ def syncSpeed(name: str, value: float) -> None:
     if abs(value - SyncContext.current_speed) > 0.15:  # noqa: PLR2004
         # round speed to a value available in the youtube player
         rounded_speed = min(round(value / 0.25) * 0.25, 2)
-        mpv.speed = max(rounded_speed, 0.25)
-        SyncContext.current_speed = mpv.speed
-        print(f"set speed to {mpv.speed}", flush=True)
+        speed = max(rounded_speed, 0.25)
+        set_mpv_property("speed", speed)
+        SyncContext.current_speed = speed
+        print(f"set speed to {speed}", flush=True)
+        broadcast_viewers("speed", speed)
         for client in SyncContext.clients.values():
-            client.setProperty_sync("speed", mpv.speed)
-            client.speed = mpv.speed
+            client.setProperty_sync("speed", speed)
+            client.speed = speed
 
 
 def handle_eof(name: str, value: bool) -> None:  # noqa: FBT001
@@ -212,68 +525,223 @@ def handle_eof(name: str, value: bool) -> None:  # noqa: FBT001
 
         for client in SyncContext.clients.values():
             client.setProperty_sync("pause", False, priority=MpvContext.queue_priority + 100)
+        broadcast_viewers("pause", False)
 
-        stopScript()
+        if not SyncContext.daemon:
+            stopScript()
+
+
+# ---------- daemon mode -----------------------------------
+
+def playlist_filename(path: str) -> str:
+    """Name mpv's filename property will have once the playlist entry is loaded."""
+    if os.name == "nt":
+        path = path.replace("\\", "/")
+    name = path.rsplit("/", 1)[-1]
+    return unquote(name) if "://" in path else name
+
+
+def handle_file_change(name: str, value: str | None) -> None:
+    """Keep the connected clients on the new file instead of restarting."""
+    if value is None or value == MpvContext.current_file:
+        return
+    MpvContext.current_file = value
+    MpvContext.eof = False
+    SyncContext.tasks["rekey"] = asyncio.create_task(rekey_clients(value))
+
+
+async def rekey_clients(filename: str) -> None:
+    # delays looked up ahead are applied at once, the client ids are confirmed afterwards
+    for client in list(SyncContext.clients.values()):
+        await apply_file_delay(client, filename)
+    rekey_viewers()
+
+    async def confirm_id(client: "PlayerClient") -> None:
+        previous = client.id
+        await client.find_id()
+        if client.id != previous and MpvContext.current_file == filename:
+            await apply_file_delay(client, filename)
+
+    await asyncio.gather(
+        *(confirm_id(client) for client in list(SyncContext.clients.values())),
+        return_exceptions=True,
+    )
+    schedule_prefetch()
+
+
+async def apply_file_delay(client: "PlayerClient", filename: str) -> None:
+    key = filename + client.id
+    delays = MpvContext.upcoming.pop(key, None)
+    if delays is not None and key in cache:
+        cache.touch(key)  # prefetched with peek, in use from now on
+    if delays is None:
+        try:
+            delays = cache.get(key)
+        except KeyError:
+            show_info(f"Delay not found in cache for {client.id}. Manually sync the videos, then click the Sync button on your Browser", 10)
+            await drop_client(client)
+            return
+    client.delays = delays
+    client.segment = delays.index(MpvContext.state.playback_time())
+    client.controller.reset()
+    if tracer is not None:
+        tracer.record("control", client.trace_id, "reset")
+    client.seek(MpvContext.state.playback_time())
+    client.request_reports()
+    print("current: ", key, flush=True)
+
+
+async def prefetch_upcoming() -> None:
+    """Look up the cached delays of the next playlist entries for every client."""
+    playlist = await MpvContext.ipc.get_property("playlist") or []
+    current = next((i for i, entry in enumerate(playlist) if entry.get("current")), -1)
+    upcoming = {}
+    for entry in playlist[current + 1:current + 1 + Options.prefetch_entries]:
+        filename = playlist_filename(entry["filename"])
+        for client in SyncContext.clients.values():
+            try:
+                # peek: looking ahead must not evict delays that are in use
+                upcoming[filename + client.id] = cache.peek(filename + client.id)
+            except KeyError:
+                continue
+    MpvContext.upcoming = upcoming
+
+
+def schedule_prefetch() -> None:
+    if SyncContext.daemon and SyncContext.clients:
+        SyncContext.tasks["prefetch"] = asyncio.create_task(prefetch_upcoming())
 
 
 # ---------- handle connections -----------------------------
 
-async def add_client(websocket: websockets.ServerConnection) -> None:
-    new_player = PlayerClient(websocket)
-    await new_player.find_id()
-    await new_player.find_delay()
+def bind_mpv_observers() -> None:
+    # jsonipc observers block until mpv answers, run them off the event loop
+    if MpvContext.observers_bound:
+        return
+    MpvContext.observers_bound = True
+    events = MpvContext.events
+    mpv = MpvContext.jsonipc
+    mpv.bind_property_observer("core-idle", events.observer("core-idle", syncPause))
+    mpv.bind_property_observer("speed", events.observer("speed", syncSpeed))
+    mpv.bind_property_observer("eof-reached", events.observer("eof-reached", handle_eof))
+    mpv.bind_property_observer("seeking", events.observer("seeking", syncSeeking, debounce=MpvContext.seek_debounce))
+
+
+async def add_client(new_player: "PlayerClient") -> None:
+    state = MpvContext.state
+    try:
+        if new_player.id is None:
+            await new_player.find_id()
+        await new_player.find_delay()
+    except BaseException:
+        new_player.close()
+        raise
+
+    # tabs are onboarded concurrently, only one of them may become the main player
+    async with SyncContext.onboarding:
+        await register_client(new_player)
+
+    print("current: ", state["filename"] + new_player.id, flush=True)
+    if Options.resume_grace > 0:
+        issue_token(new_player)
+    show_info("Connected", 1)
+    schedule_prefetch()
 
+async def register_client(new_player: "PlayerClient") -> None:
+    state = MpvContext.state
+    websocket = new_player.socket
+    speed = state["speed"]
     if len(SyncContext.clients) == 0:
         new_player.set_main(True)
         SyncContext.player_focus = websocket.id
 
-        MpvContext.mpv_pause_binding = mpv.bind_property_observer("core-idle", syncPause)
-        mpv.bind_property_observer("speed", syncSpeed)
-        mpv.bind_property_observer("eof-reached", handle_eof)
-        mpv.bind_property_observer("seeking", syncSeeking)
+        await asyncio.to_thread(bind_mpv_observers)
 
-        rounded_speed = min(round(mpv.speed / 0.25) * 0.25, 2)
-        mpv.speed = max(rounded_speed, 0.25)
-
-        SyncContext.tasks["sync_check"] = asyncio.create_task(periodicSyncCheck())
+        rounded_speed = min(round(speed / 0.25) * 0.25, 2)
+        speed = max(rounded_speed, 0.25)
+        set_mpv_property("speed", speed)
     elif len(SyncContext.clients) == 1:
         SyncContext.clients[next(iter(SyncContext.clients))].set_main(False)
 
-    await new_player.setProperty("speed", mpv.speed)
-    mpv.playback_time += 0.001
+    new_player.speed = speed
+    await new_player.setProperty("speed", speed)
+    set_mpv_property("playback-time", state.playback_time() + 0.001)
 
     SyncContext.clients[websocket.id] = new_player
 
-    print("current: ", mpv.filename + new_player.id, flush=True)
-    show_info("Connected", 1)
-
 def handle_set_pause(player: "PlayerClient", msg: Any) -> None:
     if player.delay is None:
         return
-
-    if PlayerStatus(msg["value"]) == PlayerStatus.PLAYING:
-        mpv.pause = False
+    status = PlayerStatus(msg["value"])
+    player.state = status
+    # answers to the pause values the server sent are not user actions, applying them to mpv
+    # broadcasts them again and late answers flip mpv back and forth
+    stale = player.is_stale(status)
+    if status == PlayerStatus.PLAYING:
         player.buffering_resume_attempts = 0
-    elif PlayerStatus(msg["value"]) == PlayerStatus.BUFFERING and player.buffering_resume_attempts < PlayerClient.max_resume_attempts:
+    if stale or SyncContext.barrier is not None:
+        # players stay paused until the seek barrier lets everyone go
+        return
+
+    if status == PlayerStatus.PLAYING:
+        set_mpv_property("pause", False)
+    elif status == PlayerStatus.BUFFERING and player.buffering_resume_attempts < PlayerClient.max_resume_attempts:
         player.setProperty_sync("pause", False)
         player.buffering_resume_attempts += 1
     else:
-        mpv.pause = True
+        set_mpv_property("pause", True)
         player.buffering_resume_attempts = 0
 
-    player.state = PlayerStatus(msg["value"])
-
 def handle_set_speed(player: "PlayerClient", msg: Any) -> None:
-    mpv.speed = float(msg["value"])
+    set_mpv_property("speed", float(msg["value"]))
 
 def handle_clientStop(player: "PlayerClient", msg: Any) -> None:
-    if len(SyncContext.clients) == 1:
+    if len(SyncContext.clients) == 1 and not SyncContext.daemon:
         stopScript(notifyClient=False)
         return
 
-    SyncContext.clients.pop(player.socket.id)
+    remove_client(player)
+
+def remove_client(player: "PlayerClient") -> None:
+    SyncContext.clients.pop(player.socket.id, None)
+    player.close()
+    MpvContext.osd.remove(player.socket.id)
+    if SyncContext.barrier is not None:
+        SyncContext.barrier.ready(player.socket.id)
     if len(SyncContext.clients) == 1:
         SyncContext.clients[next(iter(SyncContext.clients))].set_main(True)
+    if SyncContext.player_focus == player.socket.id and SyncContext.clients:
+        SyncContext.player_focus = next(iter(SyncContext.clients))
+
+async def drop_client(player: "PlayerClient") -> None:
+    """Disconnect a single client, it can rejoin with the Sync button."""
+    remove_client(player)
+    msg = {"type": "notice", "property": None, "value": "stopping server"}
+    try:
+        await player.socket.send(json.dumps(msg))
+        await player.socket.close()
+    except websockets.ConnectionClosed:
+        pass
+
+def handle_ready(player: "PlayerClient", msg: Any) -> None:
+    """The client landed on the last seek target and can play.
+
+    Userscripts that report it also send one when they connect.
+    """
+    player.reports_ready = True
+    player.seek_latency.seek_ready(player.clock.rtt)
+    if SyncContext.barrier is not None:
+        SyncContext.barrier.ready(player.socket.id)
+
+def handle_schedule(player: "PlayerClient", msg: Any) -> None:
+    """The client corrects its own drift against a schedule of mpv.
+
+    Sent when it connects, once the client is synced it gets the schedule
+    instead of speed corrections.
+    """
+    player.follows_schedule = Options.schedule_sync
+    if player.socket.id in SyncContext.clients:
+        player.request_reports()
 
 def handle_focus(player: "PlayerClient", msg: Any) -> None:
     if SyncContext.player_focus == player.socket.id:
@@ -291,58 +759,557 @@ msg_handler_notice: dict[str, Callable[["PlayerClient", Any], None]] = {
 }
 
 async def handler(websocket: websockets.ServerConnection) -> None:
-    # Code executed the first time a client connect to the server
-    if websocket not in SyncContext.clients.values():
-        try:
-            await add_client(websocket)
-        except (KeyError, IndexError):
-            return
+    await Startup.ready.wait()
+    try:
+        session, url = await route(websocket)
+    except (ConnectionError, asyncio.TimeoutError, websockets.ConnectionClosed):
+        return
+    current_session.set(session)
+    SyncContext.joining.add(websocket.id)
+    try:
+        await connect_client(websocket, url)
+    finally:
+        SyncContext.joining.discard(websocket.id)
+
+async def route(websocket: websockets.ServerConnection) -> tuple[Session, str | None]:
+    """Session a new connection belongs to, and the url of the browser if it had to be asked.
+
+    A resume token or a video already synced in a session decides, then a
+    delay in cache for the file of a session. Otherwise it is the newest
+    session without browsers: the one whose Sync button is clicked next.
+    """
+    ready = [session for session in sessions if session.sync.ready.is_set()]
+    if len(ready) == 1:
+        return ready[0], None
+    if not ready:
+        raise ConnectionError("no mpv to sync")
+    token = resume_token(websocket)
+    if token is not None:
+        for session in ready:
+            if token in session.sync.suspended or any(c.token == token for c in session.sync.clients.values()):
+                return session, None
+    url = await asyncio.wait_for(ask_url(websocket), PlayerClient.request_timeout)
+    video_id = PlayerClient.get_id_from_url(url)
+    ready = [session for session in ready if session in sessions]
+    for session in reversed(ready):
+        if video_id in session.sync.groups or any(c.id == video_id for c in session.sync.clients.values()):
+            return session, url
+    for session in reversed(ready):
+        if video_id is not None and session.mpv.state["filename"] + video_id in cache:
+            return session, url
+    waiting = [session for session in ready if not session.sync.joining]
+    if not waiting and not ready:
+        raise ConnectionError("no mpv to sync")
+    return (waiting or ready)[-1], url
+
+async def connect_client(websocket: websockets.ServerConnection, url: str | None) -> None:
+    if Options.hub and is_viewer(websocket):
+        await watch(websocket, url)
+        return
 
+    player = resume_client(websocket)
+    resumed = player is not None
+    if player is None:
+        player = PlayerClient(websocket)
+        if url is not None:
+            player.url, player.id = url, PlayerClient.get_id_from_url(url)
+    # The answers to the onboarding requests arrive through the message
+    # loop, so it has to be running while add_client waits for them
+    messages = asyncio.create_task(receive_messages(player))
+    try:
+        if not resumed:
+            await add_client(player)
+        await messages
+    except (KeyError, IndexError, ConnectionError, asyncio.TimeoutError, websockets.ConnectionClosed):
+        return
+    finally:
+        messages.cancel()
+        # clientStop already removed it, a resumed connection took it over
+        if SyncContext.clients.get(websocket.id) is player:
+            if player.token is not None:
+                suspend_client(player)
+            else:
+                # it can't come back without a token, the tab left like with a clientStop
+                handle_clientStop(player, None)
+
+def decode(message: str | bytes, websocket: websockets.ServerConnection) -> dict | None:
+    """The message of a frame, None for a malformed one, which is logged and skipped."""
+    try:
+        return wire.decode(message)
+    except wire.DecodeError as e:
+        telemetry.inc("malformed_frames_total")
+        print(f"skipping malformed frame from {websocket.remote_address}: {e}", flush=True)
+        return None
+
+async def receive_messages(player: "PlayerClient") -> None:
     # Handling incoming messages from client
-    async for message in websocket:
-        player = SyncContext.clients[websocket.id]
-        msg = json.loads(message)
-
-        if msg["type"] == "playbackSync":
-            client_sent_time = msg["time"]
-            time_adjustment = time.time() - client_sent_time
-            player.playback_time = float(msg["value"]) + time_adjustment
-            await player.check_sync()
-        elif msg["type"] == "set":
-            msg_handler_set[msg["property"]](player, msg)
-        elif msg["type"] == "notice":
-            msg_handler_notice[msg["value"]](player, msg)
-
-# ---------- monitoring funcitons -----------------------------
+    try:
+        async for message in player.socket:
+            started = time.perf_counter()
+            msg = decode(message, player.socket)
+            if msg is None:
+                continue
+            telemetry.inc("messages_received_total", type=msg["type"])
+            if tracer is not None:
+                tracer.record("in", player.trace_id, msg)
+
+            if msg["type"] == "get-property":
+                player.resolve_request(msg)
+            elif msg["type"] == "pong":
+                player.add_clock_sample(msg["value"], msg["time"], time.monotonic())
+            elif msg["type"] == "audioEnvelope":
+                player.envelopes.put_nowait(msg)
+            elif msg["type"] == "notice" and msg["value"] == "ready":
+                handle_ready(player, msg)
+            elif msg["type"] == "notice" and msg["value"] == "schedule":
+                handle_schedule(player, msg)
+            elif player.socket.id not in SyncContext.clients:
+                continue  # still onboarding
+            elif msg["type"] == "playbackSync":
+                player.playback_time = float(msg["value"]) + player.clock.elapsed_since(msg["time"])
+                checked = time.perf_counter()
+                await player.check_sync()
+                profiler.record(player.check_sync.__name__, checked)
+            elif msg["type"] == "set":
+                msg_handler_set[msg["property"]](player, msg)
+            elif msg["type"] == "notice":
+                msg_handler_notice[msg["value"]](player, msg)
+            profiler.record(f"handler {msg['type']}", started)
+    finally:
+        player.fail_requests(ConnectionError("client disconnected"))
+
+# ---------- session resume -----------------------------
+
+def issue_token(player: "PlayerClient") -> None:
+    """Let the client come back after a reload or a dropped connection."""
+    if player.token is None:
+        player.token = secrets.token_urlsafe(16)
+    player.send({"type": "session", "property": "resume", "value": player.token, "grace": Options.resume_grace})
+
+
+def suspend_client(player: "PlayerClient") -> None:
+    """Keep the state of a dropped client for resume_grace seconds."""
+    remove_client(player)
+    expiry = SyncContext.loop.call_later(Options.resume_grace, expire_session, player.token)
+    SyncContext.suspended[player.token] = (player, MpvContext.state["filename"], expiry)
+    print(f"client_id:{player.id} disconnected, it can resume within {Options.resume_grace} s", flush=True)
+
+
+def expire_session(token: str) -> None:
+    player, _, _ = SyncContext.suspended.pop(token)
+    print(f"client_id:{player.id} did not resume", flush=True)
+    # the tab was closed, like a clientStop
+    if not SyncContext.daemon and not SyncContext.clients and not SyncContext.suspended:
+        stopScript(notifyClient=False)
 
-async def monitorMPV(queue: asyncio.Queue) -> None:
+
+def resume_token(websocket: websockets.ServerConnection) -> str | None:
+    return parse_qs(urlparse(websocket.request.path).query).get("resume", [None])[0]
+
+
+def resume_client(websocket: websockets.ServerConnection) -> "PlayerClient | None":
+    """Reattach a client that reconnects with its token, None if it has to onboard.
+
+    The delays, sync controller, clock estimate and seek latency of the
+    client are kept, it only gets the current speed and pause state.
+    """
+    token = resume_token(websocket)
+    if token is None:
+        return None
+    player = next((client for client in SyncContext.clients.values() if client.token == token), None)
+    if player is not None:
+        # the client noticed the drop before the server did
+        remove_client(player)
+        asyncio.create_task(player.socket.close())  # noqa: RUF006
+    elif token in SyncContext.suspended:
+        player, filename, expiry = SyncContext.suspended.pop(token)
+        expiry.cancel()
+        if filename != MpvContext.state["filename"]:
+            return None  # the daemon moved to another file meanwhile
+    else:
+        return None
+
+    player.attach(websocket)
+    if len(SyncContext.clients) == 0:
+        player.set_main(True)
+        SyncContext.player_focus = websocket.id
+    else:
+        player.set_main(False)
+        if len(SyncContext.clients) == 1:
+            SyncContext.clients[next(iter(SyncContext.clients))].set_main(False)
+    SyncContext.clients[websocket.id] = player
+
+    player.speed = max(min(round(MpvContext.state["speed"] / 0.25) * 0.25, 2), 0.25)
+    player.setProperty_sync("speed", player.speed)
+    player.setProperty_sync("pause", MpvContext.state["pause"])
+    player.controller.tighten()
+    player.request_reports()
+    issue_token(player)
+    telemetry.inc("sessions_resumed_total")
+    if tracer is not None:
+        tracer.record("control", player.trace_id, "resume")
+    print(f"client_id:{player.id} resumed", flush=True)
+    show_info("Reconnected", 1)
+    return player
+
+def serve_http(connection: websockets.ServerConnection, request: "Request") -> "Response | None":
+    """Answer plain HTTP requests for the metrics or from hand_over, websocket handshakes go through."""
+    path = request.path.split("?", 1)[0]
+    if path == "/attach":
+        return attach_request(connection, request)
+    if path in ("/metrics", "/metrics.json") and not is_local(connection):
+        # client ids and queue state stay on this machine, the hub port is public
+        return connection.respond(HTTPStatus.FORBIDDEN, "Forbidden\n")
+    if path == "/metrics":
+        return connection.respond(HTTPStatus.OK, telemetry.prometheus())
+    if path == "/metrics.json":
+        response = connection.respond(HTTPStatus.OK, json.dumps(telemetry.snapshot()))
+        del response.headers["Content-Type"]
+        response.headers["Content-Type"] = "application/json"
+        return response
+    return None
+
+# ---------- several mpv players -----------------------------
+
+def attach_session(socket: str, *, use_cached: bool, daemon: bool) -> None:
+    """Sync another mpv as well, its browsers share the server with the others."""
+    if any(session.mpv.socket == socket for session in sessions):
+        return
+    session = Session(socket, use_cached=use_cached, daemon=daemon)
+    sessions.append(session)
+    in_session(session, asyncio.create_task, join_session())  # noqa: RUF006
+
+
+async def join_session() -> None:
+    try:
+        MpvContext.ipc = await AsyncMPV.connect(MpvContext.socket)
+    except OSError as e:
+        print(f"could not connect to {MpvContext.socket}: {e}", flush=True)
+        sessions.remove(current_session.get())
+        return
+    MpvContext.ipc.on_latency = lambda seconds: telemetry.observe("mpv_ipc_seconds", seconds)
+    try:
+        await start_session()
+    except (ConnectionError, asyncio.TimeoutError, RuntimeError) as e:
+        print(f"could not sync {MpvContext.socket}: {e}", flush=True)
+        end_session(notifyClient=False)
+        return
+    print(f"syncing {MpvContext.socket}, {len(sessions)} players", flush=True)
+    MpvContext.ipc.command_nowait("script-message", "SyncReaction-ready", "attached")
+
+
+def end_session(*, notifyClient: bool = True) -> None:
+    """Stop syncing the mpv of the current session, the others go on."""
+    session = current_session.get()
+    if session not in sessions:
+        return
+    sessions.remove(session)
+    for task in SyncContext.tasks.values():
+        task.cancel()
+    for _, _, expiry in SyncContext.suspended.values():
+        expiry.cancel()
+    SyncContext.suspended.clear()
+    players = list(SyncContext.clients.values())
+    SyncContext.clients.clear()
+    sockets = [player.socket for player in players] + [viewer.socket for viewer in SyncContext.viewers.values()]
+    for player in players:
+        player.close()
+    if notifyClient:
+        websockets.broadcast(sockets, json.dumps({"type": "notice", "property": None, "value": "stopping server"}))
+    for socket in sockets:
+        asyncio.create_task(socket.close())  # noqa: RUF006
+    if MpvContext.jsonipc is not None:
+        SyncContext.loop.run_in_executor(None, MpvContext.jsonipc.terminate)
+    asyncio.create_task(release_mpv())  # noqa: RUF006
+    print(f"stopped syncing {MpvContext.socket}, {len(sessions)} players left", flush=True)
+
+
+async def release_mpv() -> None:
+    """Clear the overlay and tell main.lua the player is free again."""
+    ipc = MpvContext.ipc
+    try:
+        await asyncio.gather(
+            ipc.command("osd-overlay", 5, "none", ""),
+            ipc.command("script-message", "SyncReaction-stopped"),
+        )
+    except (ConnectionError, asyncio.TimeoutError, RuntimeError):
+        pass  # mpv is gone
+    ipc.close()
+
+
+def handle_client_message(event: dict) -> None:
+    # main.lua stops syncing its player (stopScript, or the end of the file outside of daemon mode)
+    if event.get("args") == ["SyncReaction-stop"]:
+        stopScript()
+
+
+def mpv_sockets(path: Path) -> list[tuple[str, float]]:
+    """IPC sockets in path and when they were created, oldest first."""
+    found = []
+    for entry in os.scandir(path):
+        try:
+            info = entry.stat()
+        except OSError:
+            continue
+        if stat.S_ISSOCK(info.st_mode):
+            found.append((entry.path, info.st_mtime))
+    return sorted(found, key=lambda item: item[1])
+
+
+async def first_socket(path: Path, interval: float = 1) -> str:
+    path.mkdir(parents=True, exist_ok=True)
+    print(f"waiting for an mpv socket in {path}", flush=True)
+    while not (found := mpv_sockets(path)):
+        await asyncio.sleep(interval)
+    return found[-1][0]
+
+
+async def watch_socket_dir(path: Path, interval: float = 1) -> None:
+    """Sync every mpv that opens its IPC socket in path."""
+    tried: dict[str, float] = {}  # socket -> creation time, a stale socket is only tried once
     while True:
-        msg = await queue.get()
-        if "client" in msg[1]:
-            client = SyncContext.clients[msg[1]["client"]]
-            msg[1].pop("client")
-            await client.socket.send(json.dumps(msg[1]))
+        for socket, created in mpv_sockets(path):
+            if tried.get(socket) != created:
+                tried[socket] = created
+                attach_session(socket, use_cached=useCached, daemon=daemon)
+        await asyncio.sleep(interval)
+
+
+async def hand_over(socket: str) -> bool:
+    """Pass the mpv to a copy of the script serving on the port already, True if it took it."""
+    try:
+        _, writer = await asyncio.open_connection("localhost", Options.PORT)
+    except OSError:
+        return False  # nothing listening, this copy is the server
+    writer.close()
+    return await asyncio.to_thread(request_attach, socket)
+
+
+def write_attach_key() -> None:
+    """Secret of this run that hand_over sends with /attach, a page in a browser can't read it."""
+    global attach_key  # noqa: PLW0603
+    attach_key = secrets.token_urlsafe(16)
+    path = directory / "SyncReaction_attach.key"
+    path.unlink(missing_ok=True)  # os.open keeps the mode of a file that exists
+    with os.fdopen(os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+        f.write(attach_key)
+
+
+def request_attach(socket: str) -> bool:
+    import urllib.request  # noqa: PLC0415
+
+    try:
+        key = (directory / "SyncReaction_attach.key").read_text()
+    except OSError:
+        return False  # the server is not a copy of the script
+    context = None
+    if use_ssl:
+        import ssl  # noqa: PLC0415
+
+        # the certificate is issued for the name browsers use, not localhost
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    query = urlencode({"socket": socket, "cache": int(useCached), "daemon": int(daemon)})
+    url = f"{'https' if use_ssl else 'http'}://localhost:{Options.PORT}/attach?{query}"
+    request = urllib.request.Request(url, headers={"X-SyncReaction-Key": key})  # noqa: S310
+    try:
+        with urllib.request.urlopen(request, timeout=2, context=context) as response:  # noqa: S310
+            return response.status == HTTPStatus.OK
+    except OSError:
+        return False  # not a copy of the script, or one that can't take it
+
+
+def attach_request(connection: websockets.ServerConnection, request: "Request") -> "Response":
+    # pages open in a browser can reach localhost too, their requests carry these headers
+    from_browser = "Origin" in request.headers or "Sec-Fetch-Site" in request.headers
+    key = request.headers.get("X-SyncReaction-Key", "")
+    if (
+        not is_local(connection) or from_browser or attach_key is None
+        or not secrets.compare_digest(key.encode(), attach_key.encode())
+    ):
+        return connection.respond(HTTPStatus.FORBIDDEN, "Forbidden\n")
+    query = parse_qs(urlparse(request.path).query)
+    if "socket" not in query:
+        return connection.respond(HTTPStatus.BAD_REQUEST, "socket missing\n")
+    attach_session(query["socket"][0], use_cached=query.get("cache") == ["1"], daemon=query.get("daemon") == ["1"])
+    return connection.respond(HTTPStatus.OK, "attached\n")
+
+# ---------- watch party hub -----------------------------
+
+def is_local(websocket: websockets.ServerConnection) -> bool:
+    address = ipaddress.ip_address(websocket.remote_address[0])
+    if address.version == 6 and address.ipv4_mapped is not None:
+        address = address.ipv4_mapped
+    return address.is_loopback
+
+
+def is_viewer(websocket: websockets.ServerConnection) -> bool:
+    """Remote browsers only ever watch, local tabs choose with the path."""
+    return websocket.request.path.split("?", 1)[0] == "/watch" or not is_local(websocket)
+
+
+def party_delays(video_id: str) -> DelayMap:
+    """Delays of a video, from the local player watching it or the cache."""
+    for client in SyncContext.clients.values():
+        if client.id == video_id and client.delays is not None:
+            return client.delays
+    return cache.get(MpvContext.state["filename"] + video_id)
+
+
+def broadcast_viewers(name: str, value: Any) -> None:
+    for group in SyncContext.groups.values():
+        group.set(name, value)
+
+
+def rekey_viewers() -> None:
+    """Move the viewers to the new file of the playlist, or let them go."""
+    mpv_time = MpvContext.state.playback_time()
+    for video_id, group in list(SyncContext.groups.items()):
+        try:
+            group.delays = party_delays(video_id)
+        except KeyError:
+            del SyncContext.groups[video_id]
+            group.broadcast({"type": "notice", "property": None, "value": "stopping server"})
             continue
-        for client in SyncContext.clients.values():
-            await client.socket.send(json.dumps(msg[1]))
+        group.seek(mpv_time + group.delays.at(mpv_time) + SeekLatency.initial * (MpvContext.state["speed"] or 1))
+
 
-async def periodicSyncCheck() -> None:
+def show_party() -> None:
+    if subprocess:
+        MpvContext.osd.show(f"watch party: {len(SyncContext.viewers)} viewers" if SyncContext.viewers else "", key="party")
+
+
+async def ask_url(websocket: websockets.ServerConnection) -> str:
+    await websocket.send(json.dumps({"type": "get", "property": "url", "value": None, "id": 0}))
     while True:
-        await asyncio.sleep(60)
-        if mpv.pause:
+        msg = decode(await websocket.recv(), websocket)
+        if msg is not None and msg["type"] == "get-property" and msg["property"] == "url":
+            return msg["value"]
+
+
+async def join_party(websocket: websockets.ServerConnection, url: str | None) -> Viewer:
+    if url is None:
+        url = await asyncio.wait_for(ask_url(websocket), PlayerClient.request_timeout)
+    video_id = PlayerClient.get_id_from_url(url)
+    delays = party_delays(video_id)
+    group = SyncContext.groups.get(video_id)
+    if group is None:
+        group = SyncContext.groups[video_id] = ViewerGroup(video_id, delays)
+    viewer = Viewer(websocket, group)
+
+    # No await from reading the state to joining the group, so no broadcast is missed
+    state = MpvContext.state
+    mpv_time = state.playback_time()
+    lead = 0 if state["pause"] else SeekLatency.initial * (state["speed"] or 1)
+    viewer.set("speed", SyncContext.current_speed)
+    viewer.set("pause", state["pause"])
+    viewer.set("playback-time", mpv_time + group.delays.at(mpv_time) + lead)
+    viewer.set("reportInterval", Options.heartbeat_interval)
+    viewer.set("addListener", "playback-time")
+    viewer.ping()
+    viewer.corrected = time.monotonic()
+    group.add(viewer)
+    SyncContext.viewers[websocket.id] = viewer
+    return viewer
+
+
+def check_viewer(viewer: Viewer, msg: Any) -> None:
+    state = MpvContext.state
+    now = time.monotonic()
+    if state["pause"] or SyncContext.barrier is not None or viewer.settling(now):
+        return
+    mpv_time = state.playback_time()
+    delay = viewer.group.delays.at(mpv_time)
+    diff = float(msg["value"]) + viewer.elapsed_since(msg["time"]) - mpv_time - delay
+    telemetry.observe("drift_seconds", abs(diff), client="viewers")
+    if abs(diff) > Viewer.tolerance:
+        viewer.corrected = now
+        telemetry.inc("corrections_total", client="viewers", action="seek")
+        viewer.set("playback-time", mpv_time + delay + SeekLatency.initial * (state["speed"] or 1))
+
+
+async def watch(websocket: websockets.ServerConnection, url: str | None) -> None:
+    """Follow mpv as a viewer, anything the browser sets is ignored."""
+    try:
+        viewer = await join_party(websocket, url)
+    except KeyError:
+        # nobody synced this video yet
+        await websocket.send(json.dumps({"type": "notice", "property": None, "value": "stopping server"}))
+        return
+    except (ConnectionError, asyncio.TimeoutError, websockets.ConnectionClosed):
+        return
+    show_party()
+    try:
+        async for message in websocket:
+            msg = decode(message, websocket)
+            if msg is None:
+                continue
+            telemetry.inc("messages_received_total", type=msg["type"])
+            if msg["type"] == "playbackSync":
+                checked = time.perf_counter()
+                check_viewer(viewer, msg)
+                profiler.record("check_viewer", checked)
+            elif msg["type"] == "pong":
+                viewer.add_clock_sample(msg["value"], msg["time"], time.monotonic())
+            elif msg["type"] == "notice" and msg["value"] == "clientStop":
+                break
+    except websockets.ConnectionClosed:
+        pass
+    finally:
+        del SyncContext.viewers[websocket.id]
+        group = viewer.group
+        group.discard(viewer)
+        if not group and SyncContext.groups.get(group.video_id) is group:
+            del SyncContext.groups[group.video_id]
+        show_party()
+
+async def monitorMPV(queue: asyncio.Queue) -> None:
+    # Only dispatches, every client has its own writer task so a slow
+    # browser never delays the others
+    while True:
+        _, sequence, msg = await queue.get()
+        started = time.perf_counter()
+        if "client" in msg:
+            coalesce_key = msg.pop("coalesce_key")
+            if coalesce_key is not None:
+                if MpvContext.latest.get(coalesce_key) != sequence:
+                    # a newer value for the same client and property is queued
+                    MpvContext.coalesced[coalesce_key[1]] += 1
+                    continue
+                del MpvContext.latest[coalesce_key]
+            client = SyncContext.clients.get(msg.pop("client"))
+            if client is not None:
+                client.send(msg)
+            profiler.record("monitorMPV send", started)
             continue
+        if tracer is not None:
+            tracer.record("out", None, msg)
+        # serialize once per encoding in use
+        frames: dict[str | None, str | bytes] = {}
+        key = (msg["type"], msg.get("property"))
         for client in SyncContext.clients.values():
-            await client.setProperty("addListener", "playback-time")
+            subprotocol = client.socket.subprotocol
+            if subprotocol not in frames:
+                frames[subprotocol] = wire.encode(msg, subprotocol)
+            client.queue_frame(frames[subprotocol], key)
+        for group in SyncContext.groups.values():
+            group.broadcast(msg)
+        profiler.record("monitorMPV broadcast", started)
 
 async def check_connection() -> None:
     while True:
         try:
-            mpv.command("client_name")
+            await MpvContext.ipc.command("client_name")
             await asyncio.sleep(5)
-        except BrokenPipeError:  # noqa: PERF203
+        except (ConnectionError, asyncio.TimeoutError):  # noqa: PERF203
             import sys  # noqa: PLC0415
+            if len(sessions) > 1:
+                print(f"Connection to {MpvContext.socket} dropped.", flush=True)
+                end_session(notifyClient=True)
+                return
             print("Connection to mpv dropped. Terminating script...", flush=True)
-            mpv.terminate()
+            MpvContext.jsonipc.terminate()
             sys.exit()
 
 # ---------------------------------------------------------------
@@ -356,49 +1323,354 @@ class PlayerStatus(Enum):
     def _missing_(cls, value):
         return cls.PAUSED
 
+class ClockEstimate:
+    """NTP style estimate of a browser clock relative to time.monotonic().
+
+    Each ping/pong exchange gives an offset sample whose error is bounded by
+    half its round trip time, so the sample with the lowest RTT among the most
+    recent ones is trusted.
+    """
+
+    window: int = 8
+    burst: int = 5  # pings sent right after connecting
+    interval: float = 30  # seconds between pings afterwards
+
+    def __init__(self) -> None:
+        self.samples: deque[tuple[float, float]] = deque(maxlen=ClockEstimate.window)
+        self.rtt: float | None = None
+        self.offset: float | None = None  # client clock - server clock
+
+    def add_sample(self, sent: float, client_time: float, received: float) -> None:
+        rtt = received - sent
+        self.samples.append((rtt, client_time - (sent + rtt / 2)))
+        self.rtt, self.offset = min(self.samples)
+
+    def elapsed_since(self, client_time: float) -> float:
+        """Seconds passed since the client read its clock at client_time."""
+        if self.offset is None:
+            # no estimate yet, assume both wall clocks agree
+            return time.time() - client_time
+        return time.monotonic() - (client_time - self.offset)
+
+    def to_client(self, server_time: float) -> float:
+        """Client clock reading at the time.monotonic() value server_time."""
+        if self.offset is None:
+            return server_time + time.time() - time.monotonic()
+        return server_time + self.offset
+
+
+class SeekLatency:
+    """Rolling estimate of the time a client takes from a seek request to
+    being able to play at the target.
+
+    Smoothed like TCP's round trip time: an exponential moving average of
+    the samples and of their deviation from it.
+    """
+
+    gain: float = 0.25
+    initial: float = 0.3  # seconds, until the first sample
+    max_sample: float = 10  # longer waits are stalls, not seeks
+
+    def __init__(self) -> None:
+        self.mean: float | None = None
+        self.deviation = 0.0
+        self.sent: float | None = None
+
+    def seek_sent(self) -> None:
+        self.sent = time.monotonic()
+
+    def in_flight(self) -> bool:
+        """A seek was sent and is not expected to be done yet."""
+        if self.sent is None:
+            return False
+        limit = 1 if self.mean is None else self.mean + 4 * self.deviation
+        return time.monotonic() - self.sent < min(max(limit, 0.5), SeekLatency.max_sample)
+
+    def seek_ready(self, rtt: float | None) -> None:
+        if self.sent is None:
+            return
+        # the ready notice took half a round trip to arrive
+        latency = time.monotonic() - self.sent - (rtt or 0) / 2
+        self.sent = None
+        if not 0 <= latency <= SeekLatency.max_sample:
+            return
+        if self.mean is None:
+            self.mean, self.deviation = latency, latency / 2
+        else:
+            self.deviation += SeekLatency.gain * (abs(latency - self.mean) - self.deviation)
+            self.mean += SeekLatency.gain * (latency - self.mean)
+
+    def predict(self) -> float:
+        return SeekLatency.initial if self.mean is None else self.mean
+
+
+class ResumeBarrier:
+    """Keep mpv paused until every player that is seeking can play.
+
+    Players are added as their seek is sent and leave once they report
+    ready, the barrier opens when the last one does, or after timeout
+    without news from any of them. Only clients that report ready are
+    added: older userscripts are not waited for and resume with mpv.
+    """
+
+    timeout: float = 5
+
+    def __init__(self, *, resume: bool) -> None:
+        self.resume = resume  # mpv was playing before the seek
+        self.pending: set[Any] = set()
+        self.changed = asyncio.Event()
+
+    def add(self, key: Any) -> None:
+        self.pending.add(key)
+        self.changed.set()
+
+    def ready(self, key: Any) -> None:
+        self.pending.discard(key)
+        self.changed.set()
+
+    async def wait(self) -> set[Any]:
+        """Wait for the players, return the ones that did not make it in time."""
+        while self.pending:
+            self.changed.clear()
+            try:
+                await asyncio.wait_for(self.changed.wait(), ResumeBarrier.timeout)
+            except asyncio.TimeoutError:
+                break
+        return self.pending
+
+
 class PlayerClient:
 
     max_diff: float = 2
     mid_diff: float = 0.2
     max_resume_attempts: int = 5
+    echo_window: float = 1.0  # seconds a player has to answer a pause sent to it
+    # accuracy (0.06-0.19): deviation from sync before the script starts small correction
+    accuracy: float = 0.15
+    request_timeout: float = 5
     failed_find_cache: ClassVar[set[str]] = set()
+    failed_detection: ClassVar[set[str]] = set()
+    segment_hold: float = 1.5  # seconds a browser jump has to hold to become a delay segment
+    # seconds mpv may leave the schedule before it is sent again, its position only moves once per frame
+    schedule_tolerance: float = 0.05
+    clock_tolerance: float = 0.005  # change of the clock estimate that is sent in a new schedule
 
     def __init__(self, websocket: websockets.ServerConnection) -> None:
         self.socket = websocket
         self.url: str
         self.id: str | None = None
-        self.delay: float | None = None
+        self.delays: DelayMap | None = None
+        self.segment = 0  # index of the delay segment of the last sync check
+        self.checked = (0.0, time.monotonic())  # mpv time of the last sync check or frame, and when
+        self.jump: tuple[float, float, float] | None = None  # mpv time, new delay, since
         self.state = None
         self.playback_time = None
         self.speed = 1
         self.main_player = False
         self.sleeping = False
-        self.accuracy = 0.15  # (0.06-0.19) deviation from sync before the script starts small correction
-        self.original_accuracy = self.accuracy
+        self.controller = controllers[Options.sync_controller](PlayerClient.max_diff, PlayerClient.mid_diff, PlayerClient.accuracy)
+        self.trace_id = websocket.id.hex[:8]
         self.buffering_resume_attempts = 0
+        self.pushed_pause: deque[tuple[bool, float]] = deque(maxlen=8)  # pause values sent and when, see is_stale
+        self.clock = ClockEstimate()
+        self.seek_latency = SeekLatency()
+        self.reports_ready = False  # sends a ready notice after seeks
+        self.token: str | None = None  # resume token, once onboarded
+        self.requests: dict[int, tuple[str, asyncio.Future]] = {}
+        self.envelopes: asyncio.Queue = asyncio.Queue()  # audio chunks while detecting the delay
+        self.request_ids = count()
+        self.report_interval = Options.report_interval
+        self.outbox: deque[tuple[tuple[str, Any], str | bytes]] = deque()
+        self.outbox_ready = asyncio.Event()
+        self.dropped_frames = 0
+        self.follows_schedule = False  # corrects its own drift, see publish_schedule
+        self.schedule_offset: float | None = None  # clock offset the last schedule was sent with
+        self.schedule_timer: asyncio.TimerHandle | None = None  # next delay segment
 
         self.check_sync = self.check_sync_sub
+        self.attach(websocket)
+
+    def attach(self, websocket: websockets.ServerConnection) -> None:
+        """Talk to the client over websocket, a new one when it resumes."""
+        self.socket = websocket
+        self.outbox.clear()
+        self.sender_task = asyncio.create_task(self.send_loop())
+        # started right away, so the estimate is ready once onboarding is done
+        self.clock_task = asyncio.create_task(self.sync_clock())
+
+    def close(self) -> None:
+        self.sender_task.cancel()
+        self.clock_task.cancel()
+        self.fail_requests(ConnectionError("client closed"))
+        if self.schedule_timer is not None:
+            self.schedule_timer.cancel()
+
+    def queue_frame(self, frame: str | bytes, key: tuple[str, Any]) -> None:
+        if len(self.outbox) >= Options.send_queue_size:
+            if Options.send_queue_policy == "coalesce":
+                # replace a queued frame for the same property, its value is stale
+                for i, (queued_key, _) in enumerate(self.outbox):
+                    if queued_key == key:
+                        del self.outbox[i]
+                        break
+                else:
+                    self.outbox.popleft()
+            else:
+                self.outbox.popleft()
+            self.dropped_frames += 1
+            telemetry.inc("dropped_frames_total")
+        self.outbox.append((key, frame))
+        self.outbox_ready.set()
+
+    def send(self, msg: dict) -> None:
+        if tracer is not None:
+            tracer.record("out", self.trace_id, msg)
+        if msg["type"] == "set" and msg.get("property") == "pause":
+            self.pushed_pause.append((bool(msg["value"]), time.monotonic()))
+        self.queue_frame(wire.encode(msg, self.socket.subprotocol), (msg["type"], msg.get("property")))
+
+    async def send_loop(self) -> None:
+        try:
+            while True:
+                if not self.outbox:
+                    self.outbox_ready.clear()
+                    await self.outbox_ready.wait()
+                    continue
+                _, frame = self.outbox.popleft()
+                start = time.perf_counter()
+                await self.socket.send(frame)
+                telemetry.observe("send_seconds", time.perf_counter() - start)
+        except websockets.ConnectionClosed:
+            pass
 
     async def setProperty(self, name: str, value: Any) -> None:
-        msg = {"type": "set", "property": name, "value": value}
-        await self.socket.send(json.dumps(msg))
+        self.send({"type": "set", "property": name, "value": value})
+
+    def seek(self, mpv_time: float, barrier: ResumeBarrier | None = None) -> None:
+        """Seek to the position matching mpv_time.
+
+        Without a barrier mpv keeps playing, so the target is moved ahead by
+        the time the client is expected to take to get there.
+        """
+        target = mpv_time + self.delay
+        if barrier is None:
+            target += self.seek_latency.predict() * (MpvContext.state["speed"] or 1)
+        elif self.reports_ready:
+            barrier.add(self.socket.id)
+        self.seek_latency.seek_sent()
+        self.setProperty_sync("playback-time", target)
 
     async def getProperty(self, name: str) -> Any:
-        msg = {"type": "get", "property": name, "value": None}
+        request_id = next(self.request_ids)
+        future = SyncContext.loop.create_future()
+        self.requests[request_id] = (name, future)
+        msg = {"type": "get", "property": name, "value": None, "id": request_id}
+        if tracer is not None:
+            tracer.record("out", self.trace_id, msg)
+        try:
+            await self.socket.send(json.dumps(msg))
+            return await asyncio.wait_for(future, PlayerClient.request_timeout)
+        finally:
+            self.requests.pop(request_id, None)
+
+    def resolve_request(self, msg: Any) -> None:
+        request_id = msg.get("id")
+        if request_id is None:
+            # older userscripts answer in order and without the id
+            request_id = next((i for i, (name, _) in self.requests.items() if name == msg["property"]), None)
+        _, future = self.requests.pop(request_id, (None, None))
+        if future is not None and not future.done():
+            future.set_result(msg["value"])
+
+    def fail_requests(self, error: Exception) -> None:
+        for _, future in self.requests.values():
+            if not future.done():
+                future.set_exception(error)
+        self.requests.clear()
+
+    async def ping(self) -> None:
+        msg = {"type": "ping", "value": time.monotonic()}
         await self.socket.send(json.dumps(msg))
-        while True:
-            answer = await self.socket.recv()
-            loadedAnswer = json.loads(answer)
-            if loadedAnswer["type"] == "get-property":
-                break
-        return loadedAnswer["value"]
+
+    async def sync_clock(self) -> None:
+        try:
+            for _ in range(ClockEstimate.burst):
+                await self.ping()
+                await asyncio.sleep(0.1)
+            while True:
+                await asyncio.sleep(ClockEstimate.interval)
+                await self.ping()
+        except websockets.ConnectionClosed:
+            pass
 
     def setProperty_sync(self, name: str, value: Any, priority: int | None = None) -> None:
+        # add/removeListener toggle the same listener, only the last one matters
+        key = "listener" if name in ("addListener", "removeListener") else name
+        self.queue_message({"type": "set", "property": name, "value": value}, f"{key}:{value}" if key == "listener" else key, priority)
+
+    def queue_message(self, msg: dict, key: str, priority: int | None = None) -> None:
+        """Send msg in order with the mpv callbacks, a newer message with the same key replaces it.
+
+        Call on the event loop, in the session of the client: MpvContext is per session and
+        the jsonipc thread has none, its callbacks get here through MpvContext.events.
+        A message with an explicit priority is never replaced.
+        """
+        sequence = next(MpvContext.sequence)
         if priority is None:
             priority = MpvContext.queue_priority
-        msg = (priority, {"type": "set", "property": name, "value": value, "client": self.socket.id})
+            coalesce_key = (self.socket.id, key)
+            MpvContext.latest[coalesce_key] = sequence
+        else:
+            coalesce_key = None
+        msg.update(client=self.socket.id, coalesce_key=coalesce_key)
         MpvContext.queue_priority += 1
-        SyncContext.loop.call_soon_threadsafe(MpvContext.mpvQ.put_nowait, msg)
+        MpvContext.mpvQ.put_nowait((priority, sequence, msg))
+
+    @property
+    def predictive(self) -> bool:
+        """The client follows the schedule, the server only handles what it reports.
+
+        The main player is corrected through mpv, so it keeps reporting.
+        """
+        return self.follows_schedule and not self.main_player
+
+    def publish_schedule(self) -> None:
+        """Send the mpv timeline to a client that corrects its own drift.
+
+        The client plays at ``value + speed * (now - time) + delay``, in its
+        own clock, and adjusts its playbackRate locally. It only reports
+        when it is more than max_diff off, to be seeked. Sent again when mpv
+        changes or leaves the schedule (follow_mpv), at the next delay segment
+        and when the clock estimate improves, a main player gets None and stops.
+        """
+        if self.schedule_timer is not None:
+            self.schedule_timer.cancel()
+            self.schedule_timer = None
+        if not self.follows_schedule or self.socket.id not in SyncContext.clients:
+            return
+        if not self.predictive:
+            self.schedule_offset = None
+            self.queue_message({"type": "schedule", "property": None, "value": None}, "schedule")
+            return
+        state = MpvContext.state
+        now = time.monotonic()
+        mpv_time = state.playback_time(now)
+        rate = state.rate()
+        MpvContext.timeline = (mpv_time, rate, now)
+        self.schedule_offset = self.clock.offset
+        segment = self.delays.index(mpv_time)
+        self.queue_message({
+            "type": "schedule", "property": None, "value": mpv_time, "speed": rate,
+            "time": self.clock.to_client(now), "delay": self.delays.delays[segment],
+        }, "schedule")
+        if rate > 0 and segment + 1 < len(self.delays):
+            wait = (self.delays.starts[segment + 1] - mpv_time) / rate
+            self.schedule_timer = SyncContext.loop.call_later(wait, self.publish_schedule)
+
+    def add_clock_sample(self, sent: float, client_time: float, received: float) -> None:
+        self.clock.add_sample(sent, client_time, received)
+        if self.predictive and (self.schedule_offset is None or abs(self.clock.offset - self.schedule_offset) > PlayerClient.clock_tolerance):
+            self.publish_schedule()
 
     def set_main(self, value: bool) -> None:  # noqa: FBT001
         self.main_player = value
@@ -406,6 +1678,9 @@ class PlayerClient:
             self.check_sync = self.check_sync_main
         else:
             self.check_sync = self.check_sync_sub
+        if self.follows_schedule:
+            # start or stop the schedule, with the report rate that goes with it
+            self.request_reports()
 
     # async def check_sync(self) -> None:
     #     if len(SyncContext.clients) == 1:
@@ -433,7 +1708,8 @@ class PlayerClient:
             raise ValueError("id is None")
         # if mpv.filename + self.id in cache:
         try:
-            self.delay = cache[mpv.filename + self.id][0]
+            self.delays = cache.get(MpvContext.state["filename"] + self.id)
+            self.reset_segment(MpvContext.state.playback_time())
         except (KeyError, IndexError):
         # else:
             PlayerClient.failed_find_cache.add(self.id)
@@ -448,107 +1724,296 @@ class PlayerClient:
     async def set_delay(self) -> None:
         if self.id is None:
             raise ValueError("id is None")
-        self.delay = await self.getProperty("playback-time") - mpv.playback_time
+        self.delays = DelayMap(await self.getProperty("playback-time") - MpvContext.state.playback_time())
         print(f"client_id:{self.id}, delay:{self.delay}", flush=True)
-        updateCache(mpv.filename + self.id, self.delay)
+        self.store_delay()
+
+    @property
+    def delay(self) -> float | None:
+        """Delay of the segment mpv is playing."""
+        if self.delays is None:
+            return None
+        return self.delays.at(MpvContext.state.playback_time())
+
+    def store_delay(self) -> None:
+        updateCache(MpvContext.state["filename"] + self.id, self.delays)
         PlayerClient.failed_find_cache.discard(self.id)
+        PlayerClient.failed_detection.discard(self.id)
         show_info(f"delay: {int(self.delay // 60)}:{round(self.delay % 60, 3)}", 2)
 
-    async def find_delay(self) -> None:
-        if not useCached or self.id in PlayerClient.failed_find_cache:
+    async def detect_delay(self) -> None:
+        """Find the delay by correlating the browser audio with the open file."""
+        if self.id is None:
+            raise ValueError("id is None")
+        show_info("Detecting delay, play the video on your Browser")
+        try:
+            from audio_sync import DelayDetector  # noqa: PLC0415
+            detector = DelayDetector(await reference_envelope())
+        except (ImportError, OSError, RuntimeError) as e:
+            print(f"autoDelay: {e}, using manual sync", flush=True)
+            show_info(f"Manually sync the videos, then click the Sync button on your Browser (use_ssl: {use_ssl})")
             await self.set_delay()
-        else:
+            return
+        result = None
+        deadline = time.monotonic() + DelayDetector.max_window + 5
+        self.send({"type": "set", "property": "addListener", "value": "audio"})
+        try:
+            while result is None:
+                msg = await asyncio.wait_for(self.envelopes.get(), deadline - time.monotonic())
+                detector.add(msg["time"], msg["rate"], msg["value"])
+                result = await asyncio.to_thread(detector.estimate)
+        except asyncio.TimeoutError:
+            PlayerClient.failed_detection.add(self.id)
+            show_info(
+                text = f"Delay not detected. Manually sync the videos, then click the Sync button on your Browser (use_ssl: {use_ssl})",
+                duration = -1 if len(SyncContext.clients) == 0 else 10,
+            )
+            raise KeyError(self.id) from None
+        finally:
+            self.send({"type": "set", "property": "removeListener", "value": "audio"})
+
+        delay, confidence = result
+        self.delays = DelayMap(delay)
+        print(f"client_id:{self.id}, detected delay:{delay} (confidence {confidence:.2f})", flush=True)
+        self.store_delay()
+
+    async def find_delay(self) -> None:
+        if SyncContext.use_cached and self.id not in PlayerClient.failed_find_cache:
             await self.find_cached_delay()
+        elif Options.auto_delay and self.id not in PlayerClient.failed_detection:
+            await self.detect_delay()
+        else:
+            await self.set_delay()
 
     async def check_sync_main(self) -> None:
 
-        if self.sleeping:
+        if self.sleeping or (self.reports_ready and self.seek_latency.in_flight()):
             return
 
-        diff = self.playback_time - mpv.playback_time - self.delay
-
-        if Options.pause_to_sync and -PlayerClient.max_diff < diff < -self.accuracy:
-            show_info("Syncing...", round(abs(diff)) * 1000)
-            if MpvContext.mpv_pause_binding in mpv.property_bindings:
-                mpv.unbind_property_observer(MpvContext.mpv_pause_binding)
-            self.sleeping = True
-            mpv.pause = True
-            await asyncio.sleep(abs(diff))
-            mpv.pause = False
-            if mpv.property_bindings:
-                MpvContext.mpv_pause_binding = mpv.bind_property_observer("pause", syncPause)
+        state = MpvContext.state
+        mpv_time = state.playback_time()
+        if self.cross_segment(mpv_time) or self.learn_segment(mpv_time):
+            return
+
+        diff = self.playback_time - mpv_time - self.delay
+        action, value = self.controller.update(diff, time.monotonic(), can_pause=Options.pause_to_sync)
+        self.adapt_report_interval(action)
+        self.record_decision("main", diff, action, value, can_pause=Options.pause_to_sync)
+
+        if action == SyncAction.PAUSE:
+            await self.pause_mpv(value)
+        elif action == SyncAction.SEEK:
+            self.show_status("main", diff, "seeking")
+            self.seek(state.playback_time())
+        elif action == SyncAction.SPEED:
+            speed = self.speed + value
+            set_mpv_property("speed", speed)
+            self.show_status("main", diff, f"speed: {speed}")
+        elif action == SyncAction.SYNCED:
+            set_mpv_property("speed", self.speed)
+            self.show_status("main", diff, f"synced within ~{value} sec", 2)
+            self.report_convergence()
+
+    async def pause_mpv(self, seconds: float) -> None:
+        self.show_status("main", None, f"pausing mpv {seconds:.1f} sec", seconds)
+        # syncPause leaves the other players alone meanwhile
+        self.sleeping = True
+        try:
+            set_mpv_property("pause", True)
+            await asyncio.sleep(seconds)
+            set_mpv_property("pause", False)
+        finally:
             self.sleeping = False
-            self.accuracy = 0.05
-        elif abs(diff) > PlayerClient.max_diff:
-            mpv.pause = True
-            show_info(f"diff: {round(diff, 6)} seeking")
-            await self.setProperty("playback-time", mpv.playback_time + self.delay)
-        elif abs(diff) > PlayerClient.mid_diff:
-            speed_modifier = (diff / abs(diff)) * 0.05
-            mpv.speed = self.speed + speed_modifier
-            show_info(f"diff: {round(diff, 6)};   speed: {mpv.speed}")
-            self.accuracy = 0.05
-        elif abs(diff) > self.accuracy:
-            speed_modifier = (diff / abs(diff)) * 0.01
-            mpv.speed = self.speed + speed_modifier
-            show_info(f"diff: {round(diff, 6)};   speed: {mpv.speed}")
-            self.accuracy = 0.05
-        elif self.accuracy != self.original_accuracy:
-            mpv.speed = self.speed
-            show_info(f"Synced within ~{self.accuracy} sec;  speed: {mpv.speed}", 2)
-            self.accuracy = self.original_accuracy
-        else:
-            await self.setProperty("removeListener", "playback-time")
 
     async def check_sync_sub(self) -> None:
 
-        diff = mpv.playback_time + self.delay - self.playback_time
-
-        if abs(diff) > PlayerClient.max_diff:
-            mpv.pause = True
-            show_info(f"sub_player diff: {round(diff, 6)} seeking")
-            await self.setProperty("playback-time", mpv.playback_time + self.delay)
-        elif abs(diff) > PlayerClient.mid_diff:
-            speed_modifier = (diff / abs(diff)) * 0.05
-            await self.setProperty("speedOffset", speed_modifier)
-            show_info(f"sub_player diff: {round(diff, 6)};   speed: {mpv.speed+speed_modifier}")
-            self.accuracy = 0.05
-        elif abs(diff) > self.accuracy:
-            speed_modifier = (diff / abs(diff)) * 0.01
-            await self.setProperty("speedOffset", speed_modifier)
-            show_info(f"sub_player diff: {round(diff, 6)};   speed: {mpv.speed+speed_modifier}")
-            self.accuracy = 0.05
-        elif self.accuracy != self.original_accuracy:
+        if self.reports_ready and self.seek_latency.in_flight():
+            return
+
+        state = MpvContext.state
+        mpv_time = state.playback_time()
+        if self.cross_segment(mpv_time) or self.learn_segment(mpv_time):
+            return
+
+        diff = mpv_time + self.delay - self.playback_time
+        if self.predictive and abs(diff) <= PlayerClient.max_diff:
+            # a heartbeat, the client corrects this much on its own
+            telemetry.observe("drift_seconds", abs(diff), client=self.id)
+            return
+        action, value = self.controller.update(diff, time.monotonic())
+        self.adapt_report_interval(action)
+        self.record_decision("sub", diff, action, value, can_pause=False)
+
+        if action == SyncAction.SEEK:
+            self.show_status("sub", diff, "seeking")
+            self.seek(state.playback_time())
+        elif action == SyncAction.SPEED:
+            await self.setProperty("speedOffset", value)
+            self.show_status("sub", diff, f"speed: {self.speed+value}")
+        elif action == SyncAction.SYNCED:
             await self.setProperty("speed", self.speed)
-            show_info(f"Synced sub_player within ~{self.accuracy} sec;  speed: {self.speed}", 2)
-            self.accuracy = self.original_accuracy
+            self.show_status("sub", diff, f"synced within ~{value} sec", 2)
+            self.report_convergence()
+
+    def crossed_segment(self, mpv_time: float) -> float:
+        """Delay step if mpv played into the next segment since the last check, else 0."""
+        now = time.monotonic()
+        segment = self.delays.index(mpv_time)
+        previous, self.segment = self.segment, segment
+        (last, stamp), self.checked = self.checked, (mpv_time, now)
+        # mpv time played since the last check, a seek moves it further
+        state = MpvContext.state
+        played = state.rate() * (now - max(stamp, state.stamps.get("pause", 0), state.stamps.get("core-idle", 0)))
+        if segment != previous + 1 or abs(mpv_time - last - played) > PlayerClient.mid_diff:
+            return 0  # seek, or a new map
+        return self.delays.delays[segment] - self.delays.delays[previous]
+
+    def reset_segment(self, mpv_time: float) -> None:
+        """Start over from the segment at mpv_time, after a seek or a new map."""
+        self.segment = self.delays.index(mpv_time)
+        self.checked = (mpv_time, time.monotonic())
+
+    def cross_segment(self, mpv_time: float) -> bool:
+        """Follow mpv into the next segment, True if the step was handled here.
+
+        Steps within max_diff are left to the controller.
+        """
+        step = self.crossed_segment(mpv_time)
+        if abs(step) <= PlayerClient.max_diff:
+            return False
+        if not self.main_player:
+            self.seek(mpv_time)
+        elif step > 0 and Options.pause_to_sync:
+            # the source pauses in the reaction, wait for it
+            asyncio.create_task(self.pause_mpv(step))  # noqa: RUF006
+        elif step < 0:
+            # the reaction cuts part of the source, skip it
+            set_mpv_property("playback-time", mpv_time - step)
         else:
-            await self.setProperty("removeListener", "playback-time")
+            self.seek(mpv_time)
+        return True
+
+    def follow_segments(self, mpv_time: float) -> None:
+        """Check for a crossing on every mpv frame, reports come only every heartbeat once synced."""
+        if self.delays is None or len(self.delays) == 1 or self.sleeping:
+            return
+        self.cross_segment(mpv_time)
+
+    def learn_segment(self, mpv_time: float) -> bool:
+        """Keep a browser jump that holds as a new delay segment.
+
+        True while a jump is being watched, the controller leaves it alone
+        until then.
+        """
+        delay = self.playback_time - mpv_time
+        if not Options.learn_segments or abs(delay - self.delay) <= PlayerClient.max_diff:
+            self.jump = None
+            return False
+        now = time.monotonic()
+        if self.jump is None or abs(delay - self.jump[1]) > PlayerClient.mid_diff:
+            self.jump = (mpv_time, delay, now)
+            return True
+        start, _, since = self.jump
+        if now - since < PlayerClient.segment_hold:
+            return True
+        self.jump = None
+        self.delays.set(start, delay)
+        self.reset_segment(mpv_time)
+        print(f"client_id:{self.id}, segment at {start:.3f}, delay:{delay}", flush=True)
+        self.store_delay()
+        self.publish_schedule()
+        return False
+
+    def adapt_report_interval(self, action: SyncAction) -> None:
+        # Once in sync the client only sends a heartbeat, any drift it
+        # reveals brings back the fast rate until the controller settles
+        interval = Options.heartbeat_interval if action == SyncAction.IDLE or self.predictive else Options.report_interval
+        if interval != self.report_interval:
+            self.report_interval = interval
+            self.send({"type": "set", "property": "reportInterval", "value": interval})
+
+    def is_stale(self, status: PlayerStatus) -> bool:
+        """Whether a playing/paused report was sent before the player got the pause values sent to it.
+
+        Players answer each pause value in order, buffering answers the oldest one.
+        A player already in the sent state may not answer, so values expire after echo_window.
+        """
+        expired = time.monotonic() - PlayerClient.echo_window
+        while self.pushed_pause and self.pushed_pause[0][1] < expired:
+            self.pushed_pause.popleft()
+        if not self.pushed_pause:
+            return False
+        if status == PlayerStatus.BUFFERING:
+            self.pushed_pause.popleft()
+            return False
+        paused = status == PlayerStatus.PAUSED
+        if any(value == paused for value, _ in self.pushed_pause):
+            while self.pushed_pause.popleft()[0] != paused:
+                pass
+        return True
+
+    def request_reports(self) -> None:
+        """Turn fast playback reports back on, safe to call from mpv callbacks.
+
+        A client following the schedule gets the new one and keeps to heartbeats.
+        """
+        self.setProperty_sync("addListener", "playback-time")
+        self.publish_schedule()
+        interval = Options.heartbeat_interval if self.predictive else Options.report_interval
+        if self.report_interval != interval:
+            self.report_interval = interval
+            self.setProperty_sync("reportInterval", self.report_interval)
+
+    def record_decision(self, role: str, diff: float, action: SyncAction, value: float, *, can_pause: bool) -> None:
+        if tracer is not None:
+            tracer.record("sync", self.trace_id, {
+                "role": role, "diff": diff, "action": action.name, "value": value, "can_pause": can_pause,
+            })
+        telemetry.observe("drift_seconds", abs(diff), client=self.id)
+        if action in (SyncAction.SPEED, SyncAction.SEEK, SyncAction.PAUSE):
+            telemetry.inc("corrections_total", client=self.id, action=action.name.lower())
+        elif self.controller.stats.closed is not None:
+            telemetry.observe("convergence_seconds", self.controller.stats.closed[0], client=self.id)
+
+    def show_status(self, role: str, diff: float | None, state: str, duration: float = -1) -> None:
+        """Set the line of this client in the status overlay."""
+        label = self.id if role == "main" else f"{self.id} (sub)"
+        if not subprocess:
+            print(f"{label}: diff: {diff if diff is None else round(diff, 6)};   {state}", flush=True)
+            return
+        MpvContext.osd.update(self.socket.id, label, delay=self.delay, drift=diff, state=state, duration=duration)
+
+    def report_convergence(self) -> None:
+        if self.controller.stats.closed is None:
+            return  # synced without a correction
+        duration, overshoot, speed_changes = self.controller.stats.closed
+        print(
+            f"client_id:{self.id}, converged in {duration:.2f}s, "
+            f"overshoot:{overshoot:.3f}s, speed changes:{speed_changes}",
+            flush=True,
+        )
 
 
 # ------ Setup Key Bindings -------------------------------
 
 def changeDelay(offSet: float, client: "PlayerClient", *, show_msg: bool = True):
-    if client.delay is None:
+    if client.delays is None:
         return
-    client.delay += offSet
+    client.delays.shift(MpvContext.state.playback_time(), offSet)
     client_id = f" {client.id}" if len(SyncContext.clients) > 1 else ""
     if show_msg:
         show_info(f"delay{client_id}: {int(client.delay // 60)}:{round(client.delay % 60, 3)}", 1000, "show-text")
-    client.setProperty_sync("addListener", "playback-time")
+    client.request_reports()
 
 
-@mpv.on_key_press("ALT+m", forced=True)
 def addDelay() -> None:
     changeDelay(0.05, SyncContext.clients[SyncContext.player_focus])
 
 
-@mpv.on_key_press("ALT+n", forced=True)
 def lessDelay() -> None:
     changeDelay(-0.05, SyncContext.clients[SyncContext.player_focus])
 
 
-@mpv.on_key_press("ALT+Shift+m", forced=True)
 def addDelayAll() -> None:
     msg = ""
     for client in SyncContext.clients.values():
@@ -559,7 +2024,6 @@ def addDelayAll() -> None:
     show_info(msg, 1000, "show-text")
 
 
-@mpv.on_key_press("ALT+Shift+n", forced=True)
 def lessDelayAll() -> None:
     msg = ""
     for client in SyncContext.clients.values():
@@ -570,61 +2034,186 @@ def lessDelayAll() -> None:
     show_info(msg, 1000, "show-text")
 
 
-@mpv.on_key_press("ALT+CTRL+x", forced=True)
 def manualSyncCheck() -> None:
     for client in SyncContext.clients.values():
-        client.setProperty_sync("addListener", "playback-time")
+        client.request_reports()
+
+
+def toggle_profile() -> None:
+    if not profiler.active:
+        profiler.start()
+        show_info("Profiling, press Alt+Ctrl+p again to stop", 2000, "show-text")
+        return
+    SyncContext.tasks["profile"] = asyncio.create_task(write_profile(profiler.stop()))
+
+
+async def write_profile(capture: Capture) -> None:
+    folded, report = await asyncio.to_thread(capture.write, directory / "profiles")
+    print(f"profile written to {folded} and {report}", flush=True)
+    show_info(f"Profile written to {folded.parent}", 3000, "show-text")
 
 
-@mpv.on_key_press("ESC", forced=True)
 def stopScript(*, notifyClient: bool = True) -> None:
-    if notifyClient:
-        msg = {"type": "notice", "property": None, "value": "stopping server"}
-        SyncContext.loop.call_soon_threadsafe(MpvContext.mpvQ.put_nowait, (0, msg))
-    with open(directory / "SyncReaction_cache.json", "w") as f:
-        json.dump(cache, f, indent=4)
-    for task in asyncio.all_tasks(loop=SyncContext.loop):
+    """Stop syncing the current mpv, the script exits with the last one."""
+    if current_session.get() not in sessions:
+        # stopped already: end_session closing jsonipc calls its quit_callback,
+        # stopping the server here would end the sessions left
+        return
+    if len(sessions) > 1:
+        end_session(notifyClient=notifyClient)
+    else:
+        stop_server(notifyClient=notifyClient)
+
+
+def stop_server(*, notifyClient: bool = True) -> None:
+    global stopping  # noqa: PLW0603
+    # terminating jsonipc runs its quit_callback, stopScript again
+    if stopping:
+        return
+    stopping = True
+    msg = json.dumps({"type": "notice", "property": None, "value": "stopping server"})
+    for session in sessions:
+        if notifyClient:
+            # written right away, the send queues stop with the tasks cancelled below
+            sockets = [player.socket for player in session.sync.clients.values()]
+            websockets.broadcast(sockets + [viewer.socket for viewer in session.sync.viewers.values()], msg)
+        if session.mpv.coalesced:
+            print(f"superseded messages dropped: {dict(session.mpv.coalesced)}", flush=True)
+    if cache is not None and not cache.close(cache.close_timeout):
+        print("delay cache: still writing, finishing before exit", flush=True)
+    if tracer is not None:
+        tracer.close()
+    if profiler.active:
+        profiler.stop().write(directory / "profiles")
+    for task in asyncio.all_tasks():
         task.cancel()
 
 
-async def main() -> None:
+key_bindings: dict[str, Callable[[], None]] = {
+    "ALT+m": addDelay,
+    "ALT+n": lessDelay,
+    "ALT+Shift+m": addDelayAll,
+    "ALT+Shift+n": lessDelayAll,
+    "ALT+CTRL+x": manualSyncCheck,
+    "ALT+CTRL+p": toggle_profile,
+    "ESC": stopScript,
+}
 
-    SyncContext.tasks["conn_check"] = asyncio.create_task(check_connection())
 
-    SyncContext.loop = asyncio.get_running_loop()
+def bind_keys() -> None:
+    for key, callback in key_bindings.items():
+        MpvContext.jsonipc.on_key_press(key, forced=True)(MpvContext.events.key_binding(callback))
+
+
+async def start_session() -> None:
+    """Take over the mpv of the current session, browsers are routed to it once it is ready."""
+    ipc = MpvContext.ipc
+    # Leave the player on the last frame rather then closing or moving to the next file,
+    # a daemon follows the playlist and only holds the last one
+    ipc.set_property("keep-open", "yes" if SyncContext.daemon else "always")
+    ipc.set_property("video-sync", "audio")
+    ipc.on_event("client-message", handle_client_message)
+    MpvContext.events = EventChannel(SyncContext.loop)
+    MpvContext.events.on_deliver = lambda callback, started: profiler.record(f"mpv {callback.__name__}", started)
+    MpvContext.state.on_change = follow_mpv
+
+    SyncContext.tasks["conn_check"] = asyncio.create_task(check_connection())
+    if subprocess:
+        SyncContext.tasks["osd"] = asyncio.create_task(MpvContext.osd.run())
+    if Options.auto_delay:
+        SyncContext.tasks["fingerprint"] = asyncio.create_task(prepare_auto_delay())
 
-    if useCached:
+    if SyncContext.use_cached:
         show_info(f"Click the Sync button on your Browser (use_ssl: {use_ssl})")
     else:
         show_info(
             f"Manually sync the videos, then click the Sync button on your Browser (use_ssl: {use_ssl})",
         )
+    SyncContext.tasks["main"] = asyncio.create_task(monitorMPV(MpvContext.mpvQ))
+
+    await asyncio.gather(asyncio.to_thread(attach_jsonipc), MpvContext.state.start(ipc))
+    if SyncContext.daemon:
+        MpvContext.current_file = MpvContext.state["filename"]
+        await ipc.observe_property("filename", handle_file_change)
+        await ipc.observe_property("playlist-count", lambda name, value: schedule_prefetch())
+    SyncContext.ready.set()
+
+
+def terminate_jsonipc() -> None:
+    for session in sessions:
+        if session.mpv.jsonipc is not None:
+            session.mpv.jsonipc.terminate()
 
+
+async def main() -> None:
+    global directory  # noqa: PLW0603
+
+    first = Session(SOCKETS[0] if SOCKETS else await first_socket(socket_dir), use_cached=useCached, daemon=daemon)
+    sessions.append(first)
+    current_session.set(first)  # main and everything it starts run in the first session
+    await connect_mpv()
+    Startup.mark("mpv connected")
+    ipc = MpvContext.ipc
+
+    directory = Path(await ipc.command("expand-path", "~~/script-opts/SyncReaction"))
+    if not directory.is_dir():
+        directory.mkdir(parents=True)
+    load_options()
+    if len(SOCKETS) == 1 and await hand_over(MpvContext.socket):
+        print(f"{MpvContext.socket} is synced by the script already running on port {Options.PORT}", flush=True)
+        ipc.close()
+        raise SystemExit(HANDED_OVER)
+    load_ssl()
+    write_attach_key()
+    load_trace()
+    if profile:
+        profiler.start()
+    Startup.mark("options")
+
+    # Everything the server doesn't need to bind runs while it starts
+    background = asyncio.gather(start_session(), asyncio.to_thread(load_cache))
+
+    host = Options.hub_host if Options.hub else "localhost"
     try:
-        async with websockets.serve(handler, "localhost", Options.PORT, ssl=ssl_context):
+        async with websockets.serve(
+            handler, host, Options.PORT, ssl=ssl_context, select_subprotocol=wire.select_subprotocol,
+            process_request=serve_http,
+            # compression works per connection, it would encode each broadcast once per viewer
+            compression=None if Options.hub else "deflate",
+        ):
+            Startup.mark("listening")
+            if Options.hub:
+                print(f"watch party hub on {host}:{Options.PORT}", flush=True)
+            for socket in SOCKETS[1:]:
+                attach_session(socket, use_cached=useCached, daemon=daemon)
+            if socket_dir is not None:
+                asyncio.create_task(watch_socket_dir(socket_dir))  # noqa: RUF006
+
+            await background
+            Startup.mark("ready")
+            Startup.ready.set()
+            Startup.report()
 
             def exit_handler(signal, frame):
-                stopScript()
-                mpv.terminate()
+                stop_server()
+                terminate_jsonipc()
 
             if os.name == "nt":
                 signal.signal(signal.SIGBREAK, exit_handler)
             signal.signal(signal.SIGINT, exit_handler)
             signal.signal(signal.SIGTERM, exit_handler)
 
-            mpv.quit_callback = stopScript
-
-            main_task = asyncio.create_task(monitorMPV(MpvContext.mpvQ))
-            SyncContext.tasks["main"] = main_task
             try:  # noqa: SIM105
-                await main_task
+                # until stop_server cancels every task, this one included
+                await asyncio.get_running_loop().create_future()
             except asyncio.CancelledError:
                 pass
-            mpv.terminate()
+            terminate_jsonipc()
 
     except OSError as error:
         print(error.strerror, flush=True)
 
 
 if __name__ == "__main__":
+    parse_args()
     asyncio.run(main())
@@ -0,0 +1,203 @@
+import asyncio
+import json
+import os
+import time
+
+from functools import partial
+from typing import Any
+from collections.abc import Callable
+
+
+class AsyncMPV(asyncio.Protocol):
+    """asyncio-native client for the mpv JSON IPC.
+
+    Commands are written to the socket immediately and tagged with a
+    ``request_id``; the matching reply resolves a future, so any number of
+    requests can be in flight without blocking the event loop.
+    """
+
+    def __init__(self) -> None:
+        self.transport: asyncio.Transport | None = None
+        self.closed: asyncio.Future = asyncio.get_running_loop().create_future()
+        self._buffer = b""
+        self._request_id = 0
+        self._observer_id = 0
+        self._pending: dict[int, asyncio.Future] = {}
+        self._sent_at: dict[int, float] = {}
+        # called with the round trip time of every reply, in seconds
+        self.on_latency: Callable[[float], None] | None = None
+        self._observers: dict[int, Callable[[str, Any], None]] = {}
+        self._event_handlers: dict[str, list[Callable[[dict], None]]] = {}
+
+    @classmethod
+    async def connect(cls, ipc_socket: str) -> "AsyncMPV":
+        loop = asyncio.get_running_loop()
+        if os.name == "nt":
+            _, client = await loop.create_pipe_connection(cls, "\\\\.\\pipe\\" + ipc_socket)  # type: ignore[attr-defined]
+        else:
+            _, client = await loop.create_unix_connection(cls, ipc_socket)
+        return client
+
+    # ------- asyncio.Protocol -------------------------------------
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore[assignment]
+
+    def data_received(self, data: bytes) -> None:
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            if line:
+                self._dispatch(json.loads(line))
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.transport = None
+        error = exc or ConnectionError("Connection to mpv closed")
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        self._sent_at.clear()
+        if not self.closed.done():
+            self.closed.set_result(exc)
+
+    def _dispatch(self, data: dict) -> None:
+        if "request_id" in data:
+            future = self._pending.pop(data["request_id"], None)
+            sent_at = self._sent_at.pop(data["request_id"], None)
+            if sent_at is not None and self.on_latency is not None:
+                self.on_latency(time.monotonic() - sent_at)
+            if future is None or future.done():
+                return
+            if data.get("error") in ("success", "property unavailable"):
+                future.set_result(data.get("data"))
+            else:
+                future.set_exception(RuntimeError(f"mpv: {data.get('error')}"))
+        elif data.get("event") == "property-change":
+            callback = self._observers.get(data.get("id"))
+            if callback is not None:
+                callback(data["name"], data.get("data"))
+        elif "event" in data:
+            for callback in self._event_handlers.get(data["event"], ()):
+                callback(data)
+
+    # ------- Commands ---------------------------------------------
+
+    def send(self, *command: Any) -> asyncio.Future:
+        """Write a command without waiting for its reply."""
+        future = asyncio.get_running_loop().create_future()
+        if self.transport is None:
+            future.set_exception(ConnectionError("Not connected to mpv"))
+            return future
+        self._request_id += 1
+        self._pending[self._request_id] = future
+        self._sent_at[self._request_id] = time.monotonic()
+        # a command that timed out or was cancelled never gets its reply dispatched
+        future.add_done_callback(partial(self._forget, self._request_id))
+        payload = {"command": list(command), "request_id": self._request_id}
+        self.transport.write(json.dumps(payload).encode() + b"\n")
+        return future
+
+    def _forget(self, request_id: int, future: asyncio.Future) -> None:
+        self._pending.pop(request_id, None)
+        self._sent_at.pop(request_id, None)
+
+    async def command(self, *command: Any, timeout: float = 5) -> Any:
+        return await asyncio.wait_for(self.send(*command), timeout)
+
+    def command_nowait(self, *command: Any) -> None:
+        """Fire-and-forget command, errors are reported but never raised."""
+        self.send(*command).add_done_callback(_report_error)
+
+    async def get_property(self, name: str) -> Any:
+        return await self.command("get_property", name)
+
+    def set_property(self, name: str, value: Any) -> None:
+        self.command_nowait("set_property", name, value)
+
+    async def observe_property(self, name: str, callback: Callable[[str, Any], None]) -> int:
+        self._observer_id += 1
+        observer_id = self._observer_id
+        self._observers[observer_id] = callback
+        await self.command("observe_property", observer_id, name)
+        return observer_id
+
+    async def unobserve_property(self, observer_id: int) -> None:
+        self._observers.pop(observer_id, None)
+        await self.command("unobserve_property", observer_id)
+
+    def on_event(self, name: str, callback: Callable[[dict], None]) -> None:
+        self._event_handlers.setdefault(name, []).append(callback)
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+
+
+class PropertyMirror:
+    """Local copy of observed mpv properties.
+
+    Every value carries the monotonic time it was received at, and
+    ``playback_time()`` extrapolates the last reported position with the
+    current speed, so reading mpv state never needs an IPC round trip.
+    """
+
+    observed = ("playback-time", "speed", "pause", "core-idle", "filename")
+
+    def __init__(self) -> None:
+        self.values: dict[str, Any] = {}
+        self.stamps: dict[str, float] = {}
+        # (position, speed, monotonic stamp, running) swapped as one object so
+        # readers on other threads never see a half updated snapshot
+        self._clock: tuple[float, float, float, bool] = (0, 1, time.monotonic(), False)
+        # called with every change reported by mpv, after the mirror is updated
+        self.on_change: Callable[[str, Any], None] | None = None
+
+    async def start(self, ipc: AsyncMPV) -> None:
+        initial = await asyncio.gather(*(ipc.get_property(name) for name in self.observed))
+        for name, value in zip(self.observed, initial):
+            self.update(name, value)
+        for name in self.observed:
+            await ipc.observe_property(name, self._changed)
+
+    def _changed(self, name: str, value: Any) -> None:
+        self.update(name, value)
+        if self.on_change is not None:
+            self.on_change(name, value)
+
+    def update(self, name: str, value: Any) -> None:
+        now = time.monotonic()
+        if name == "playback-time":
+            _, speed, _, running = self._clock
+            self._clock = (value or 0, speed, now, running)
+        elif name in ("speed", "pause", "core-idle"):
+            # rebase the extrapolation before the rate changes
+            position = self.playback_time(now)
+            self.values[name] = value
+            self.stamps[name] = now
+            running = not (self.values.get("pause") or self.values.get("core-idle"))
+            self._clock = (position, self.values.get("speed") or 1, now, running)
+            return
+        self.values[name] = value
+        self.stamps[name] = now
+
+    def __getitem__(self, name: str) -> Any:
+        return self.values.get(name)
+
+    def playback_time(self, now: float | None = None) -> float:
+        position, speed, stamp, running = self._clock
+        if not running:
+            return position
+        if now is None:
+            now = time.monotonic()
+        return position + speed * (now - stamp)
+
+    def rate(self) -> float:
+        """Seconds of mpv time per second, 0 while mpv is not playing."""
+        _, speed, _, running = self._clock
+        return speed if running else 0
+
+
+def _report_error(future: asyncio.Future) -> None:
+    if not future.cancelled() and future.exception() is not None:
+        print(f"mpv command failed: {future.exception()}", flush=True)
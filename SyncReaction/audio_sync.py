@@ -0,0 +1,172 @@
+"""Find the delay between a browser tab and mpv by correlating audio.
+
+Both sides are reduced to a loudness envelope (RMS every 10 ms, log
+scaled so a different volume only shifts it). The browser streams its
+envelope in short chunks, mpv's is computed once per file by decoding the
+audio with a separate mpv process and kept as a fingerprint index on disk.
+The position of the browser window inside the file is the peak of their
+normalized cross-correlation, computed with NumPy FFTs.
+
+Requires NumPy, which is optional: importing this module raises
+ImportError without it.
+"""
+import hashlib
+import os
+import subprocess
+import tempfile
+
+from pathlib import Path
+
+import numpy as np
+
+RATE = 100  # envelope samples per second
+DECODE_RATE = 8000  # audio sample rate used to build the index
+FRAME = DECODE_RATE // RATE
+
+
+class DecodeError(RuntimeError):
+    pass
+
+
+def log_envelope(rms: np.ndarray) -> np.ndarray:
+    return np.log(np.asarray(rms, dtype=np.float64) + 1e-4)
+
+
+def decode_envelope(decoder: str, path: str) -> np.ndarray:
+    """Decode the audio of path to mono PCM with mpv and return its envelope."""
+    fd, pcm = tempfile.mkstemp(suffix=".pcm")
+    os.close(fd)
+    try:
+        result = subprocess.run(
+            [
+                decoder, "--no-config", "--really-quiet", "--untimed", "--vid=no", "--vo=null",
+                "--ao=pcm", f"--ao-pcm-file={pcm}", "--ao-pcm-waveheader=no", "--audio-format=s16",
+                "--audio-channels=mono", f"--audio-samplerate={DECODE_RATE}", path,
+            ],
+            check=False, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+        )
+        if result.returncode != 0:
+            raise DecodeError(f"{decoder} exited with {result.returncode}: {result.stderr.decode(errors='replace').strip()}")
+        samples = np.fromfile(pcm, dtype="<i2").astype(np.float32) / 32768
+    finally:
+        os.remove(pcm)
+    frames = samples[:len(samples) // FRAME * FRAME].reshape(-1, FRAME)
+    return log_envelope(np.sqrt(np.mean(frames * frames, axis=1)))
+
+
+class FingerprintIndex:
+    """Envelopes of the files played so far, stored as .npy files."""
+
+    def __init__(self, directory: Path, decoder: str) -> None:
+        self.directory = directory
+        self.decoder = decoder
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def key(self, path: str) -> str:
+        try:
+            stat = os.stat(path)
+            identity = f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+        except OSError:  # URL or stream
+            identity = path
+        return hashlib.sha1(identity.encode()).hexdigest()
+
+    def envelope(self, path: str) -> np.ndarray:
+        """Load the envelope of path, decoding the file the first time; blocking."""
+        cached = self.directory / f"{self.key(path)}.npy"
+        if cached.is_file():
+            return np.load(cached)
+        envelope = decode_envelope(self.decoder, path)
+        np.save(cached, envelope)
+        return envelope
+
+
+class DelayDetector:
+    """Accumulate browser envelope chunks and locate them in the reference.
+
+    ``add`` takes chunks as they arrive, a chunk that does not continue the
+    previous one (seek, pause) restarts the window. ``estimate`` returns
+    ``(delay, confidence)`` once the window is long enough and the
+    correlation peak is both high and clearly above any other match.
+
+    Each estimate correlates the whole window again: the FFT over the
+    reference sets its cost (tens of ms for an hour of audio), and a
+    correlation of only the newest chunk would need the same FFT size.
+    """
+
+    min_window: float = 1  # seconds of browser audio before the first estimate, the peak and margin reject ambiguous ones
+    max_window: float = 20
+    min_peak: float = 0.5
+    min_margin: float = 0.1  # over the best match more than exclusion away
+    exclusion: float = 0.5
+
+    def __init__(self, reference: np.ndarray) -> None:
+        self.reference = reference
+        self.times: list[np.ndarray] = []
+        self.values: list[np.ndarray] = []
+        self.end: float | None = None
+        # prefix sums of the reference for the sliding normalization
+        self.sum = np.concatenate(([0.0], np.cumsum(reference)))
+        self.sum_sq = np.concatenate(([0.0], np.cumsum(reference * reference)))
+        # spectrum of the reference by FFT size, it only changes when the window doubles
+        self.spectra: dict[int, np.ndarray] = {}
+
+    def add(self, start: float, rate: float, rms: list[float]) -> None:
+        if not rms:
+            return
+        if self.end is None or abs(start - self.end) > 2 / rate:
+            self.times.clear()
+            self.values.clear()
+        times = start + np.arange(len(rms)) / rate
+        self.times.append(times)
+        self.values.append(log_envelope(rms))
+        self.end = start + len(rms) / rate
+        # keep only the most recent max_window seconds
+        while len(self.times) > 1 and self.end - self.times[1][0] >= DelayDetector.max_window:
+            self.times.pop(0)
+            self.values.pop(0)
+
+    @property
+    def window(self) -> float:
+        return 0 if self.end is None or not self.times else self.end - self.times[0][0]
+
+    def estimate(self) -> tuple[float, float] | None:
+        if self.window < DelayDetector.min_window:
+            return None
+        times = np.concatenate(self.times)
+        grid = np.arange(times[0], times[-1], 1 / RATE)
+        x = np.interp(grid, times, np.concatenate(self.values))
+        m = len(x)
+        n = len(self.reference)
+        if m < 2 or n < m:
+            return None
+        x = x - x.mean()
+        x_norm = np.sqrt(np.dot(x, x))
+        if x_norm == 0:
+            return None
+
+        size = 1 << (n + m - 1).bit_length()
+        if size not in self.spectra:
+            self.spectra[size] = np.fft.rfft(self.reference, size)
+        corr = np.fft.irfft(self.spectra[size] * np.conj(np.fft.rfft(x, size)), size)[:n - m + 1]
+        window_sum = self.sum[m:] - self.sum[:-m]
+        window_sq = self.sum_sq[m:] - self.sum_sq[:-m]
+        y_norm = np.sqrt(np.maximum(window_sq - window_sum * window_sum / m, 1e-12))
+        ncc = corr / (y_norm * x_norm)
+
+        peak = int(np.argmax(ncc))
+        score = float(ncc[peak])
+        exclusion = int(DelayDetector.exclusion * RATE)
+        others = np.concatenate((ncc[:max(peak - exclusion, 0)], ncc[peak + exclusion + 1:]))
+        second = float(others.max()) if len(others) else -1.0
+        if score < DelayDetector.min_peak or score - second < DelayDetector.min_margin:
+            return None
+
+        # parabolic interpolation for a sub-sample peak position
+        offset = 0.0
+        if 0 < peak < len(ncc) - 1:
+            left, right = ncc[peak - 1], ncc[peak + 1]
+            curvature = left - 2 * score + right
+            if curvature < 0:
+                offset = 0.5 * (left - right) / curvature
+        mpv_time = (peak + offset) / RATE
+        return float(grid[0] - mpv_time), score
@@ -0,0 +1,61 @@
+from bisect import bisect_right
+from collections.abc import Iterable
+
+
+class DelayMap:
+    """Delay of a client over mpv time, constant between breakpoints.
+
+    A reaction video that pauses or cuts its source changes the delay at
+    that point of the source: ``starts[i]`` is the mpv time where
+    ``delays[i]`` begins, the first segment covers the start of the file.
+    """
+
+    # neighbouring segments closer than this are merged
+    merge: float = 0.05
+
+    def __init__(self, delay: float) -> None:
+        self.starts: list[float] = [0.0]
+        self.delays: list[float] = [delay]
+
+    @classmethod
+    def from_segments(cls, segments: Iterable[tuple[float, float]]) -> "DelayMap":
+        segments = sorted(segments)
+        delays = cls(segments[0][1])
+        for start, delay in segments[1:]:
+            delays.set(start, delay)
+        return delays
+
+    def segments(self) -> list[tuple[float, float]]:
+        return list(zip(self.starts, self.delays))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def index(self, mpv_time: float) -> int:
+        return max(bisect_right(self.starts, mpv_time) - 1, 0)
+
+    def at(self, mpv_time: float) -> float:
+        return self.delays[self.index(mpv_time)]
+
+    def set(self, mpv_time: float, delay: float) -> None:
+        """Start a segment with delay at mpv_time, it lasts until the next breakpoint."""
+        i = self.index(mpv_time)
+        if mpv_time > self.starts[i]:
+            i += 1
+            self.starts.insert(i, mpv_time)
+            self.delays.insert(i, delay)
+        else:
+            self.delays[i] = delay
+        self._merge(i)
+
+    def shift(self, mpv_time: float, offset: float) -> None:
+        """Move the delay of the segment playing at mpv_time."""
+        i = self.index(mpv_time)
+        self.delays[i] += offset
+        self._merge(i)
+
+    def _merge(self, i: int) -> None:
+        if i + 1 < len(self.starts) and abs(self.delays[i + 1] - self.delays[i]) < DelayMap.merge:
+            del self.starts[i + 1], self.delays[i + 1]
+        if i > 0 and abs(self.delays[i] - self.delays[i - 1]) < DelayMap.merge:
+            del self.starts[i], self.delays[i]
@@ -0,0 +1,153 @@
+import json
+import math
+import sqlite3
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+from delay_map import DelayMap
+
+
+class DelayStore:
+    """Persistent cache of delays, keyed by mpv filename + client id.
+
+    Entries live in memory in least recently used order, so lookups and
+    updates are O(1); every change is written to SQLite (WAL mode) by a
+    single background thread, keeping disk I/O off the event loop.
+
+    The ``delay`` column holds the delay at the start of the file, files
+    with more than one segment also keep all breakpoints in ``segments``.
+    """
+
+    close_timeout: float = 0.5  # seconds the event loop waits for pending writes on stop
+
+    def __init__(self, directory: Path, size: int) -> None:
+        self.size = size
+        self.closed = False
+        self.entries: OrderedDict[str, tuple[list[tuple[float, float]], str]] = OrderedDict()
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="delay-store")
+
+        self.db = sqlite3.connect(directory / "SyncReaction_cache.sqlite", check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS delays "
+            "(key TEXT PRIMARY KEY, delay REAL NOT NULL, updated TEXT NOT NULL, used REAL NOT NULL, segments TEXT)"
+        )
+        columns = {row[1] for row in self.db.execute("PRAGMA table_info(delays)")}
+        if "segments" not in columns:
+            with self.db:
+                self.db.execute("ALTER TABLE delays ADD COLUMN segments TEXT")
+        self._migrate(directory / "SyncReaction_cache.json")
+
+        rows = self.db.execute("SELECT key, delay, updated, segments FROM delays ORDER BY used")
+        for key, delay, updated, segments in rows:
+            self.entries[key] = ([tuple(s) for s in json.loads(segments)] if segments else [(0.0, delay)], updated)
+        self._evict()
+
+    def _migrate(self, json_cache: Path) -> None:
+        # Import the cache written by older versions, oldest entry first
+        if not json_cache.is_file():
+            return
+        try:
+            legacy = json.loads(json_cache.read_text())
+        except ValueError:
+            legacy = {}
+        if not isinstance(legacy, dict):
+            legacy = {}
+        now = time.time()
+        rows = [
+            (key, value[0], value[1], now - len(legacy) + i)
+            for i, (key, value) in enumerate(legacy.items())
+            if _legacy_entry(value)
+        ]
+        with self.db:
+            self.db.executemany("INSERT OR IGNORE INTO delays (key, delay, updated, used) VALUES (?, ?, ?, ?)", rows)
+        # replace: rename fails on Windows if an earlier migration left the target
+        json_cache.replace(json_cache.with_suffix(".json.migrated"))
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> DelayMap:
+        """Return a copy of the cached delays and mark them as recently used, KeyError if missing."""
+        delays = self.peek(key)
+        self.touch(key)
+        return delays
+
+    def peek(self, key: str) -> DelayMap:
+        """Return a copy of the cached delays without changing the eviction order, KeyError if missing."""
+        segments, _ = self.entries[key]
+        return DelayMap.from_segments(segments)
+
+    def touch(self, key: str) -> None:
+        """Mark an entry as recently used, e.g. one that was looked up with peek, KeyError if missing."""
+        self.entries.move_to_end(key)
+        self._submit(self._touch, key, time.time())
+
+    def put(self, key: str, delays: DelayMap) -> None:
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime())
+        segments = delays.segments()
+        self.entries[key] = (segments, updated)
+        self.entries.move_to_end(key)
+        self._submit(self._write, key, segments, updated, time.time())
+        self._evict()
+
+    def close(self, timeout: float | None = None) -> bool:
+        """Close the database after the pending writes, waiting at most timeout seconds.
+
+        False when they are still running, the writer thread finishes them
+        before the interpreter exits.
+        """
+        if self.closed:
+            return True
+        self.closed = True
+        closed = self.writer.submit(self.db.close)
+        self.writer.shutdown(wait=False)
+        return not wait([closed], timeout).not_done
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.size:
+            key, _ = self.entries.popitem(last=False)
+            self._submit(self._delete, key)
+
+    def _submit(self, func, *args) -> None:  # noqa: ANN001
+        if not self.closed:
+            self.writer.submit(self._run, func, *args)
+
+    @staticmethod
+    def _run(func, *args) -> None:  # noqa: ANN001
+        try:
+            func(*args)
+        except sqlite3.Error as error:
+            print(f"delay cache: {error}", flush=True)
+
+    def _write(self, key: str, segments: list[tuple[float, float]], updated: str, used: float) -> None:
+        encoded = json.dumps(segments) if len(segments) > 1 else None
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO delays VALUES (?, ?, ?, ?, ?)",
+                (key, segments[0][1], updated, used, encoded),
+            )
+
+    def _touch(self, key: str, used: float) -> None:
+        with self.db:
+            self.db.execute("UPDATE delays SET used = ? WHERE key = ?", (used, key))
+
+    def _delete(self, key: str) -> None:
+        with self.db:
+            self.db.execute("DELETE FROM delays WHERE key = ?", (key,))
+
+
+def _legacy_entry(value: object) -> bool:
+    """A [delay, updated] pair of the JSON cache."""
+    return (
+        isinstance(value, list) and len(value) == 2  # noqa: PLR2004
+        and isinstance(value[0], (int, float)) and not isinstance(value[0], bool) and math.isfinite(value[0])
+        and isinstance(value[1], str)
+    )
@@ -0,0 +1,104 @@
+"""Passive viewers of a watch party.
+
+In hub mode remote browsers join as viewers: they follow mpv's pause,
+speed and seeks but never take part in the sync control of the local
+players. Viewers of the same video share its delay, so every frame they
+need is the same and is encoded once and handed to
+``websockets.broadcast``, which writes it to each connection without a
+task or a copy per viewer.
+
+A viewer only keeps what following needs, its own drift is checked on
+the heartbeat reports and corrected with a seek.
+"""
+import json
+import time
+
+from typing import Any
+
+import websockets
+
+import wire
+from delay_map import DelayMap
+
+
+class Viewer:
+    __slots__ = ("socket", "group", "offset", "rtt", "pings", "corrected")
+
+    tolerance: float = 0.5  # drift before a viewer is seeked back, there is no speed correction
+    settle: float = 3  # seconds after a seek before the drift counts again
+    burst: int = 3  # pings sent one after the other when joining
+
+    def __init__(self, socket: websockets.ServerConnection, group: "ViewerGroup") -> None:
+        self.socket = socket
+        self.group = group
+        self.offset: float | None = None  # browser clock - time.monotonic(), from the fastest ping
+        self.rtt: float | None = None
+        self.pings = 0
+        self.corrected = 0.0  # monotonic time of the last seek sent to this viewer alone
+
+    def send(self, frame: str | bytes) -> None:
+        # queued like a broadcast to a single viewer, nothing to await
+        websockets.broadcast((self.socket,), frame)
+
+    def set(self, name: str, value: Any) -> None:
+        self.send(wire.encode({"type": "set", "property": name, "value": value}, self.socket.subprotocol))
+
+    def ping(self) -> None:
+        self.pings += 1
+        self.send(json.dumps({"type": "ping", "value": time.monotonic()}))
+
+    def add_clock_sample(self, sent: float, client_time: float, received: float) -> None:
+        rtt = received - sent
+        if self.rtt is None or rtt <= self.rtt:
+            self.rtt = rtt
+            self.offset = client_time - (sent + rtt / 2)
+        if self.pings < Viewer.burst:
+            self.ping()
+
+    def settling(self, now: float) -> bool:
+        """A seek sent to the viewer may still be under way."""
+        return now - max(self.corrected, self.group.seeked) < Viewer.settle
+
+    def elapsed_since(self, client_time: float) -> float:
+        """Seconds passed since the browser read its clock at client_time."""
+        if self.offset is None:
+            return time.time() - client_time
+        return time.monotonic() - (client_time - self.offset)
+
+
+class ViewerGroup:
+    """Viewers of one video, they share its delay and every frame sent to them."""
+
+    __slots__ = ("video_id", "delays", "sockets", "seeked")
+
+    def __init__(self, video_id: str, delays: DelayMap) -> None:
+        self.video_id = video_id
+        self.delays = delays
+        self.seeked = 0.0  # monotonic time of the last seek broadcast
+        # by subprotocol, one encoding each
+        self.sockets: dict[str | None, set[websockets.ServerConnection]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(sockets) for sockets in self.sockets.values())
+
+    def add(self, viewer: Viewer) -> None:
+        self.sockets.setdefault(viewer.socket.subprotocol, set()).add(viewer.socket)
+
+    def discard(self, viewer: Viewer) -> None:
+        sockets = self.sockets.get(viewer.socket.subprotocol)
+        if sockets is not None:
+            sockets.discard(viewer.socket)
+            if not sockets:
+                del self.sockets[viewer.socket.subprotocol]
+
+    def broadcast(self, msg: dict) -> None:
+        """Send msg to every viewer without waiting, closed connections are skipped."""
+        for subprotocol, sockets in self.sockets.items():
+            websockets.broadcast(sockets, wire.encode(msg, subprotocol))
+
+    def set(self, name: str, value: Any) -> None:
+        self.broadcast({"type": "set", "property": name, "value": value})
+
+    def seek(self, target: float) -> None:
+        self.seeked = time.monotonic()
+        self.set("playback-time", target)
@@ -5,13 +5,20 @@ local script_path = utils.join_path(mp.get_script_directory(), "SyncReaction.py"
 local running = false
 local video_sync = mp.get_property_native("video-sync")
 local old_ipc_server = mp.get_property_native("input-ipc-server")
-local new_ipc_server = "/tmp/mpvsocket"
+-- one socket per mpv, a running script can sync several players
+local new_ipc_server = "/tmp/mpvsocket-" .. utils.getpid()
 local use_ssl = false
+local daemon = false
+local attached = false
+local handed_over = 3 -- exit status of the script once a copy already running took over this mpv
+local stop_timeout = 2 -- seconds the script gets to stop syncing this mpv before it is killed
+local started_daemon = false
 local custom_python_cmd
 local python_cmd
 local bin_path
 local default_venv_bin
 local syncScript
+local launch_time
 
 
 if package.config:sub(1,1) == '/' then
@@ -38,11 +45,22 @@ if custom_python_cmd then
   python_cmd = custom_python_cmd
 end
 
+local function reset()
+  mp.osd_message("Sync script has stopped", 2)
+  mp.set_property("video-sync", video_sync)
+  mp.set_property("input-ipc-server", old_ipc_server)
+  mp.set_property("speed", 1)
+  running = false
+  attached = false
+  syncScript = nil
+end
+
 local function startScript(additional_args)
   if running then
     mp.osd_message("Script already running", 2)
   else
     running = true
+    launch_time = mp.get_time()
     old_ipc_server = mp.get_property_native("input-ipc-server")
     if old_ipc_server == "" then
       mp.set_property("input-ipc-server", new_ipc_server)
@@ -77,23 +95,50 @@ local function startScript(additional_args)
       table.insert(arguments, "--ssl")
     end
 
-    syncScript = mp.command_native_async({
+    -- a daemon outlives the current file and follows the playlist
+    if daemon then
+      table.insert(arguments, "--daemon")
+    end
+    started_daemon = daemon
+
+    -- the script may sync other players as well, the end of this file
+    -- only stops syncing this one (see end-file)
+    local command
+    command = mp.command_native_async({
         name = "subprocess",
-        playback_only = true,
+        playback_only = false,
         args = arguments,
       },
       function(res, val, err)
-          mp.osd_message("Sync script has stopped", 2)
-          mp.set_property("video-sync", video_sync)
-          mp.set_property("input-ipc-server", old_ipc_server)
-          mp.set_property("speed", 1)
-          running = false
+          -- the script stopped syncing this mpv before it exited
+          if command ~= syncScript then
+            return
+          end
+          if val and val.status == handed_over then
+            attached = true
+            syncScript = nil
+            return
+          end
+          reset()
       end
     )
+    syncScript = command
   end
 
 end
 
+-- Sent by the python script once it is ready, with the time of each startup stage
+mp.register_script_message("SyncReaction-ready", function(stages)
+  print(string.format("ready %.0f ms after keypress (%s)", (mp.get_time() - launch_time) * 1000, stages))
+end)
+
+-- Sent by a script syncing several players once it stops syncing this one
+mp.register_script_message("SyncReaction-stopped", function()
+  if running then
+    reset()
+  end
+end)
+
 local function sync()
   startScript({})
 end
@@ -102,19 +147,46 @@ local function searchCache()
   startScript({"--cache"})
 end
 
+-- The script stops syncing this mpv, or exits if it is the last one it
+-- syncs; it is killed if it does neither in time (e.g. still starting)
+local function requestStop()
+  local command = syncScript
+  mp.commandv("script-message", "SyncReaction-stop")
+  mp.add_timeout(stop_timeout, function()
+    if command ~= nil and command == syncScript then
+      mp.abort_async_command(command)
+    end
+  end)
+end
+
 local function stopScript()
-  if running then
-    mp.abort_async_command(syncScript)
+  if attached then
+    mp.commandv("script-message", "SyncReaction-stop")
+    reset()
+  elseif running then
+    requestStop()
   else
     mp.osd_message("Script is not running", 2)
   end
 end
 
+-- outside of daemon mode the sync of this mpv ends with its file
+mp.register_event("end-file", function()
+  if running and not started_daemon then
+    stopScript()
+  end
+end)
+
 mp.add_key_binding("CTRL+ALT+g", "toggle_ssl", function()
   use_ssl = not use_ssl
   mp.osd_message("use_ssl: "..tostring(use_ssl))
 end)
 
+mp.add_key_binding("CTRL+ALT+d", "toggle_daemon", function()
+  daemon = not daemon
+  mp.osd_message("daemon: "..tostring(daemon))
+end)
+
 mp.add_forced_key_binding("CTRL+ALT+s", "startsync", sync, {repeatable=false})
 mp.add_forced_key_binding("CTRL+ALT+c", "searchCache", searchCache, {repeatable=false})
 mp.add_forced_key_binding("CTRL+ALT+a", "stopScript", stopScript, {repeatable=false})
@@ -0,0 +1,118 @@
+"""In-process metrics, exposed as Prometheus text or JSON.
+
+Counters and histograms are updated from the event loop only, gauges are
+callables sampled when the metrics are read.
+"""
+from bisect import bisect_left
+from collections.abc import Callable
+
+# Bracket the PlayerClient thresholds (accuracy 0.15, mid_diff 0.2, max_diff 2)
+DRIFT_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.15, 0.2, 0.5, 1, 2, 5)
+DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+Labels = tuple[tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        total = 0
+        result = []
+        for bound, count in zip((*map(str, self.buckets), "+Inf"), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+class Metrics:
+    def __init__(self, prefix: str = "syncreaction_") -> None:
+        self.prefix = prefix
+        self.help: dict[str, str] = {}
+        self.counters: dict[str, dict[Labels, float]] = {}
+        self.histograms: dict[str, dict[Labels, Histogram]] = {}
+        self.bucket_bounds: dict[str, tuple[float, ...]] = {}
+        self.gauges: dict[str, Callable[[], float]] = {}
+
+    def counter(self, name: str, help_text: str) -> None:
+        self.help[name] = help_text
+        self.counters[name] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: tuple[float, ...]) -> None:
+        self.help[name] = help_text
+        self.histograms[name] = {}
+        self.bucket_bounds[name] = buckets
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        self.help[name] = help_text
+        self.gauges[name] = read
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        series = self.counters[name]
+        key = tuple(labels.items())
+        series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        series = self.histograms[name]
+        key = tuple(labels.items())
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram(self.bucket_bounds[name])
+        histogram.observe(value)
+
+    def prometheus(self) -> str:
+        lines = []
+        for name, series in self.counters.items():
+            full = self.prefix + name
+            lines += [f"# HELP {full} {self.help[name]}", f"# TYPE {full} counter"]
+            lines += [f"{full}{_labels(labels)} {value}" for labels, value in series.items()]
+        for name, read in self.gauges.items():
+            full = self.prefix + name
+            lines += [f"# HELP {full} {self.help[name]}", f"# TYPE {full} gauge", f"{full} {read()}"]
+        for name, series in self.histograms.items():
+            full = self.prefix + name
+            lines += [f"# HELP {full} {self.help[name]}", f"# TYPE {full} histogram"]
+            for labels, histogram in series.items():
+                for bound, total in histogram.cumulative():
+                    lines.append(f"{full}_bucket{_labels((*labels, ('le', bound)))} {total}")
+                lines.append(f"{full}_sum{_labels(labels)} {histogram.sum}")
+                lines.append(f"{full}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            "counters": {
+                name: [{"labels": dict(labels), "value": value} for labels, value in series.items()]
+                for name, series in self.counters.items()
+            },
+            "gauges": {name: read() for name, read in self.gauges.items()},
+            "histograms": {
+                name: [
+                    {
+                        "labels": dict(labels),
+                        "buckets": dict(histogram.cumulative()),
+                        "sum": histogram.sum,
+                        "count": histogram.count,
+                    }
+                    for labels, histogram in series.items()
+                ]
+                for name, series in self.histograms.items()
+            },
+        }
+
+
+def _labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
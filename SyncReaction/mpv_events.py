@@ -0,0 +1,98 @@
+"""Hand mpv events from the jsonipc thread over to the event loop.
+
+python-mpv-jsonipc runs property observers and key bindings on its reader
+thread. Handlers running there would race with the loop over the client
+table, so the thread only posts events here and every handler runs on the
+loop thread, in the context the channel was created in.
+"""
+import asyncio
+import contextvars
+import threading
+import time
+import traceback
+
+from collections.abc import Callable
+from itertools import count
+from typing import Any
+
+
+class EventChannel:
+    """Batched, thread-safe queue of callbacks into one event loop.
+
+    ``post`` buffers the event and wakes the loop at most once per batch,
+    however many events arrive before it runs. Within a batch a property
+    only delivers its newest value.
+
+    Debounced properties are flags like ``seeking``: turning on is
+    delivered right away, turning off only once the flag has stayed off for
+    the debounce delay. While scrubbing, a burst of seeks then reaches the
+    handler as a single start and a single end.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop = loop
+        self.context = contextvars.copy_context()
+        self.lock = threading.Lock()
+        self.pending: dict[Any, tuple[Callable[..., None], tuple]] = {}
+        self.scheduled = False
+        self.ids = count()  # keys of events that are never coalesced
+        self.debounce: dict[str, float] = {}
+        self.active: dict[str, bool] = {}  # last state delivered for debounced flags
+        self.releases: dict[str, asyncio.TimerHandle] = {}
+        # called with each handler and the perf_counter value it started at
+        self.on_deliver: Callable[[Callable[..., None], float], None] | None = None
+
+    def observer(self, name: str, callback: Callable[[str, Any], None], *, debounce: float | None = None) -> Callable[[str, Any], None]:
+        """Observer for jsonipc that runs callback(name, value) on the loop."""
+        if debounce is not None:
+            self.debounce[name] = debounce
+            return lambda name, value: self.post(None, self._debounced, name, callback, (name, value))
+        return lambda name, value: self.post(("property", name), callback, name, value)
+
+    def key_binding(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Key binding for jsonipc that runs callback() on the loop, every press counts."""
+        return lambda: self.post(None, callback)
+
+    def post(self, key: Any, callback: Callable[..., None], *args: Any) -> None:
+        if key is None:
+            key = next(self.ids)
+        with self.lock:
+            self.pending.pop(key, None)  # keep the order of the newest events
+            self.pending[key] = (callback, args)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.loop.call_soon_threadsafe(self._drain, context=self.context)
+
+    def _drain(self) -> None:
+        with self.lock:
+            batch, self.pending = self.pending, {}
+            self.scheduled = False
+        for callback, args in batch.values():
+            self._deliver(callback, args)
+
+    def _deliver(self, callback: Callable[..., None], args: tuple) -> None:
+        started = time.perf_counter()
+        try:
+            callback(*args)
+        except Exception:  # noqa: BLE001
+            # one failing handler must not drop the rest of the batch
+            traceback.print_exc()
+        if self.on_deliver is not None:
+            self.on_deliver(callback, started)
+
+    def _debounced(self, name: str, callback: Callable[[str, Any], None], args: tuple) -> None:
+        release = self.releases.pop(name, None)
+        if release is not None:
+            release.cancel()
+        if args[1]:
+            if not self.active.get(name):
+                self.active[name] = True
+                self._deliver(callback, args)
+        elif self.active.get(name):
+            self.releases[name] = self.loop.call_later(self.debounce[name], self._release, name, callback, args)
+
+    def _release(self, name: str, callback: Callable[[str, Any], None], args: tuple) -> None:
+        del self.releases[name]
+        self.active[name] = False
+        self._deliver(callback, args)
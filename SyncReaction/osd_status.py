@@ -0,0 +1,104 @@
+"""Status overlay drawn on mpv's OSD.
+
+Callers only update a model: free text messages, each replacing the
+previous one with the same key, and a status line per client with its
+delay, drift and current correction. A single renderer task turns the
+model into text and redraws at most ``fps`` times per second, and only
+when the text changed, so a burst of sync decisions from several clients
+costs one overlay command per frame at most.
+"""
+import asyncio
+import time
+
+from collections.abc import Callable
+from typing import Any
+
+
+class ClientStatus:
+    __slots__ = ("label", "delay", "drift", "state", "until")
+
+    def __init__(self, label: str) -> None:
+        self.label = label
+        self.delay: float | None = None
+        self.drift: float | None = None
+        self.state = ""  # current correction, the line is hidden without one
+        self.until: float | None = None  # when the state expires, None keeps it
+
+    def render(self) -> str:
+        parts = [self.label]
+        if self.delay is not None:
+            parts.append(f"delay {int(self.delay // 60)}:{self.delay % 60:06.3f}")
+        if self.drift is not None:
+            parts.append(f"diff {self.drift:+.3f}")
+        parts.append(self.state)
+        return "   ".join(parts)
+
+
+class OsdStatus:
+
+    fps: float = 10
+
+    def __init__(self, draw: Callable[[str], None]) -> None:
+        self.draw = draw
+        self.messages: dict[str, tuple[str, float | None]] = {}
+        self.clients: dict[Any, ClientStatus] = {}
+        self.changed = asyncio.Event()
+        self.drawn = ""
+        self.frames = 0
+
+    def show(self, text: str, duration: float = -1, key: str = "info") -> None:
+        """Show text for duration seconds, or until replaced if negative."""
+        until = None if duration < 0 else time.monotonic() + duration
+        self.messages[key] = (text, until)
+        self.changed.set()
+
+    def update(
+        self, key: Any, label: str, *,
+        delay: float | None = None, drift: float | None = None, state: str | None = None, duration: float = -1,
+    ) -> None:
+        """Record the last sync decision of a client, fields left as None keep their value."""
+        status = self.clients.get(key)
+        if status is None:
+            status = self.clients[key] = ClientStatus(label)
+        status.label = label
+        if delay is not None:
+            status.delay = delay
+        if drift is not None:
+            status.drift = drift
+        if state is not None:
+            status.state = state
+            status.until = None if duration < 0 else time.monotonic() + duration
+        self.changed.set()
+
+    def remove(self, key: Any) -> None:
+        if self.clients.pop(key, None) is not None:
+            self.changed.set()
+
+    def render(self, now: float) -> str:
+        lines = [text for text, until in self.messages.values() if text and (until is None or until > now)]
+        lines += [status.render() for status in self.clients.values() if status.state and (status.until is None or status.until > now)]
+        return "\n".join(lines)
+
+    def next_expiry(self, now: float) -> float | None:
+        deadlines = [until for _, until in self.messages.values() if until is not None and until > now]
+        deadlines += [s.until for s in self.clients.values() if s.until is not None and s.until > now]
+        return min(deadlines) - now if deadlines else None
+
+    async def run(self) -> None:
+        drawn_at = 0.0
+        while True:
+            try:
+                await asyncio.wait_for(self.changed.wait(), self.next_expiry(time.monotonic()))
+            except asyncio.TimeoutError:
+                pass  # something expired
+            self.changed.clear()
+            # cap the frame rate, changes made meanwhile land in the same frame
+            wait = drawn_at + 1 / OsdStatus.fps - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            drawn_at = time.monotonic()
+            text = self.render(drawn_at)
+            if text != self.drawn:
+                self.drawn = text
+                self.frames += 1
+                self.draw(text)
@@ -0,0 +1,194 @@
+"""On-demand profiling window for a running session.
+
+A window is opened and closed from mpv (or opened at startup with
+``--profile``). While it is open it collects:
+
+- stack samples of every thread, written as folded stacks
+  (``thread;outer;inner count``) that flamegraph.pl, inferno and
+  speedscope read as they are
+- event loop callbacks that ran for ``slow_callback`` seconds or more,
+  the task a step belongs to is named in place of the step itself
+- latency of the hot paths, timed by the script through ``record`` and
+  reported as percentiles
+- the lines that allocated the most memory, from tracemalloc snapshots
+  taken when the window opens and closes
+
+Nothing is collected outside of a window, ``record`` is a single
+attribute check and the event loop runs unpatched.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from collections import Counter
+from pathlib import Path
+from types import CodeType, FrameType
+
+
+class Profiler:
+    interval: float = 0.01  # seconds between stack samples
+    slow_callback: float = 0.01  # loop callbacks running longer are reported
+    top: int = 25  # rows of the slow callback and memory tables
+
+    def __init__(self) -> None:
+        self.active = False
+        self.capture: Capture | None = None
+        self.sampler: threading.Thread | None = None
+        self.stopped = threading.Event()
+        self.handle_run = asyncio.events.Handle._run  # noqa: SLF001
+        self.traced_before = False
+
+    def start(self) -> None:
+        if self.active:
+            return
+        self.active = True
+        self.capture = Capture()
+        self.traced_before = tracemalloc.is_tracing()
+        if not self.traced_before:
+            tracemalloc.start()
+        self.capture.memory_start = tracemalloc.take_snapshot()
+        self._patch_loop()
+        self.stopped.clear()
+        self.sampler = threading.Thread(target=self._sample, args=(self.capture,), name="profiler", daemon=True)
+        self.sampler.start()
+
+    def stop(self) -> "Capture":
+        """Close the window, the capture still has to be written."""
+        capture = self.capture
+        self.active = False
+        self.stopped.set()
+        self.sampler.join()
+        asyncio.events.Handle._run = self.handle_run  # noqa: SLF001
+        capture.duration = time.monotonic() - capture.started
+        capture.memory_end = tracemalloc.take_snapshot()
+        if not self.traced_before:
+            tracemalloc.stop()
+        self.capture = self.sampler = None
+        return capture
+
+    def record(self, name: str, started: float) -> None:
+        """Time spent in name since started (a perf_counter value), kept while a window is open."""
+        if self.active:
+            self.capture.latencies.setdefault(name, []).append(time.perf_counter() - started)
+
+    def _patch_loop(self) -> None:
+        # Handle._run runs every callback and task step of the loop, the
+        # slow_callback_duration of asyncio's debug mode needs the whole
+        # debug mode
+        run = self.handle_run
+        slow = self.capture.slow
+
+        def timed_run(handle: asyncio.Handle) -> None:
+            started = time.perf_counter()
+            run(handle)
+            elapsed = time.perf_counter() - started
+            if elapsed >= Profiler.slow_callback:
+                slow.append((elapsed, describe(handle)))
+
+        asyncio.events.Handle._run = timed_run  # noqa: SLF001
+
+    def _sample(self, capture: "Capture") -> None:
+        me = threading.get_ident()
+        labels: dict[CodeType, str] = {}
+        # thread -> innermost frame, its line and its folded stack, a
+        # thread waiting on the same line has the same stack
+        last: dict[int, tuple[FrameType, int, str]] = {}
+        names: dict[int | None, str] = {}
+        while not self.stopped.wait(Profiler.interval):
+            frames = sys._current_frames()  # noqa: SLF001
+            if frames.keys() - last.keys() - {me}:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == me:
+                    continue
+                previous = last.get(ident)
+                if previous is not None and previous[0] is frame and previous[1] == frame.f_lineno:
+                    stack = previous[2]
+                else:
+                    stack = fold(names.get(ident, str(ident)), frame, labels)
+                    last[ident] = (frame, frame.f_lineno, stack)
+                capture.stacks[stack] += 1
+            capture.samples += 1
+
+
+class Capture:
+    """What one window collected."""
+
+    def __init__(self) -> None:
+        self.stamp = time.strftime("%Y%m%d-%H%M%S")
+        self.started = time.monotonic()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter[str] = Counter()
+        self.latencies: dict[str, list[float]] = {}
+        self.slow: list[tuple[float, str]] = []
+        self.memory_start: tracemalloc.Snapshot | None = None
+        self.memory_end: tracemalloc.Snapshot | None = None
+
+    def write(self, directory: Path) -> tuple[Path, Path]:
+        """Write the folded stacks and the text report, return both paths."""
+        directory.mkdir(exist_ok=True)
+        folded = directory / f"{self.stamp}.folded"
+        report = directory / f"{self.stamp}.txt"
+        with open(folded, "w", encoding="utf-8") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+        report.write_text(self.report(), encoding="utf-8")
+        return folded, report
+
+    def report(self) -> str:
+        lines = [
+            f"profile {self.stamp}: {self.duration:.1f} s, {self.samples} samples every {Profiler.interval * 1000:g} ms",
+            "",
+            f"{'latency ms':<32} {'count':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}",
+        ]
+        for name, values in sorted(self.latencies.items()):
+            values.sort()
+            p50, p90, p99 = (1000 * percentile(values, q) for q in (0.5, 0.9, 0.99))
+            lines.append(f"{name:<32} {len(values):>7} {p50:>8.3f} {p90:>8.3f} {p99:>8.3f} {1000 * values[-1]:>8.3f}")
+
+        slow: dict[str, list[float]] = {}
+        for elapsed, name in self.slow:
+            slow.setdefault(name, []).append(elapsed)
+        lines += ["", f"{f'slow callbacks >= {Profiler.slow_callback * 1000:g} ms':<60} {'count':>7} {'total ms':>9} {'max ms':>8}"]
+        for name, values in sorted(slow.items(), key=lambda item: -sum(item[1]))[:Profiler.top]:
+            lines.append(f"{name[:60]:<60} {len(values):>7} {1000 * sum(values):>9.1f} {1000 * max(values):>8.1f}")
+
+        lines += ["", f"{'memory allocated during the window':<60} {'KiB':>9} {'blocks':>8}"]
+        stats = self.memory_end.compare_to(self.memory_start, "lineno")
+        for stat in stats[:Profiler.top]:
+            frame = stat.traceback[0]
+            where = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+            lines.append(f"{where:<60} {stat.size_diff / 1024:>+9.1f} {stat.count_diff:>+8}")
+        return "\n".join(lines) + "\n"
+
+
+def fold(thread: str, frame: FrameType | None, labels: dict[CodeType, str]) -> str:
+    """One folded stack line, outermost frame first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        label = labels.get(code)
+        if label is None:
+            name = getattr(code, "co_qualname", code.co_name)
+            label = labels[code] = f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        names.append(label)
+        frame = frame.f_back
+    names.append(thread)
+    return ";".join(reversed(names))
+
+
+def describe(handle: asyncio.Handle) -> str:
+    callback = handle._callback  # noqa: SLF001
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        return f"{task.get_name()} {getattr(coro, '__qualname__', coro)}"
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+def percentile(values: list[float], q: float) -> float:
+    """q-th quantile of sorted values, nearest rank."""
+    return values[min(len(values) - 1, int(q * len(values)))]
@@ -0,0 +1,74 @@
+"""Opt-in trace of a sync session, for replaying it offline.
+
+The trace is gzip compressed line-delimited JSON: a header object, then
+one ``[time, kind, client, data]`` array per event, ``time`` in seconds
+since the recording started. Kinds:
+
+    in       message received from a client
+    out      message sent to a client, client is null for broadcasts
+    mpv      mpv property change, or property set by the script (data.set)
+    sync     sync controller decision: role, diff, action, value, can_pause
+    control  controller call outside of a decision (tighten, reset)
+"""
+import gzip
+import json
+import threading
+import time
+
+from collections.abc import Iterator
+from pathlib import Path
+from queue import SimpleQueue
+from typing import Any
+
+VERSION = 1
+
+
+class TraceRecorder:
+    """record() only timestamps and queues the event, encoding, compression
+    and disk writes happen on a background thread."""
+
+    def __init__(self, path: Path, header: dict) -> None:
+        self.path = path
+        self.closed = False
+        self.start = time.monotonic()
+        self.queue: SimpleQueue = SimpleQueue()
+        header = {"trace": VERSION, "started": time.time(), **header}
+        self.thread = threading.Thread(target=self._write, args=(header,), name="trace-writer", daemon=True)
+        self.thread.start()
+
+    def record(self, kind: str, client: str | None, data: Any) -> None:
+        self.queue.put((time.monotonic() - self.start, kind, client, data))
+
+    def close(self) -> None:
+        """Write the queued events and close the file."""
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.put(None)
+        self.thread.join()
+
+    def _write(self, header: dict) -> None:
+        with gzip.open(self.path, "wt", encoding="utf-8", compresslevel=6) as f:
+            f.write(json.dumps(header) + "\n")
+            while (event := self.queue.get()) is not None:
+                f.write(json.dumps(event, separators=(",", ":"), default=str) + "\n")
+
+
+def read_trace(path: Path) -> tuple[dict, Iterator[list]]:
+    """Return the header and an iterator over the events of a trace."""
+    f = gzip.open(path, "rt", encoding="utf-8")
+    header = json.loads(f.readline())
+    if header.get("trace") != VERSION:
+        f.close()
+        raise ValueError(f"{path}: unsupported trace version {header.get('trace')}")
+
+    def events() -> Iterator[list]:
+        with f:
+            try:
+                for line in f:
+                    if line.endswith("\n"):
+                        yield json.loads(line)
+            except EOFError:
+                pass  # the script was killed before closing the trace
+
+    return header, events()
@@ -0,0 +1,191 @@
+from abc import ABC, abstractmethod
+from collections import deque
+from enum import Enum
+
+
+class SyncAction(Enum):
+    HOLD = 0  # keep the current correction, nothing to send
+    SPEED = 1  # value: speed offset for the controlled player
+    SEEK = 2
+    PAUSE = 3  # value: seconds mpv should stay paused
+    SYNCED = 4  # value: tolerance reached, restore the base speed
+    IDLE = 5  # in sync, stop playback reports
+
+
+class ConvergenceStats:
+    """Measure each correction episode, from the first action to SYNCED.
+
+    An episode records how long it took to converge, the largest error seen
+    on the opposite side of the initial one (overshoot) and how many
+    speed changes were needed.
+    """
+
+    history: int = 20
+    correcting = (SyncAction.SPEED, SyncAction.SEEK, SyncAction.PAUSE)
+
+    def __init__(self) -> None:
+        self.episodes: deque[tuple[float, float, int]] = deque(maxlen=ConvergenceStats.history)
+        self.start: float | None = None
+        self.initial_sign = 0.0
+        self.overshoot = 0.0
+        self.speed_changes = 0
+        self.closed: tuple[float, float, int] | None = None  # episode ended by the last decision
+
+    def record(self, action: SyncAction, diff: float, now: float) -> None:
+        self.closed = None
+        if self.start is None and action not in ConvergenceStats.correcting:
+            return  # SYNCED after tighten() without a correction is not an episode
+        if self.start is None:
+            self.start = now
+            self.initial_sign = 1 if diff > 0 else -1
+            self.overshoot = 0
+            self.speed_changes = 0
+        if diff * self.initial_sign < 0:
+            self.overshoot = max(self.overshoot, abs(diff))
+        if action == SyncAction.SPEED:
+            self.speed_changes += 1
+        elif action == SyncAction.SYNCED:
+            self.closed = (now - self.start, self.overshoot, self.speed_changes)
+            self.episodes.append(self.closed)
+            self.start = None
+
+    @property
+    def last(self) -> tuple[float, float, int] | None:
+        return self.episodes[-1] if self.episodes else None
+
+    def summary(self) -> str:
+        if not self.episodes:
+            return "no episodes"
+        count = len(self.episodes)
+        duration = sum(e[0] for e in self.episodes) / count
+        overshoot = max(e[1] for e in self.episodes)
+        changes = sum(e[2] for e in self.episodes) / count
+        return f"{count} episodes, avg {duration:.2f}s, max overshoot {overshoot:.3f}s, avg {changes:.1f} speed changes"
+
+
+class SyncController(ABC):
+    """Turn the drift of a player into the next correction.
+
+    ``diff`` is how far the controlled player is behind its target, in
+    seconds: a positive value means it has to speed up.
+    """
+
+    def __init__(self, max_diff: float, mid_diff: float, accuracy: float) -> None:
+        self.max_diff = max_diff
+        self.mid_diff = mid_diff
+        self.accuracy = accuracy
+        self.original_accuracy = accuracy
+        self.stats = ConvergenceStats()
+
+    def update(self, diff: float, now: float, *, can_pause: bool = False) -> tuple[SyncAction, float]:
+        action, value = self.decide(diff, now, can_pause=can_pause)
+        self.stats.record(action, diff, now)
+        return action, value
+
+    @abstractmethod
+    def decide(self, diff: float, now: float, *, can_pause: bool) -> tuple[SyncAction, float]:
+        ...
+
+    def tighten(self) -> None:
+        """Require a closer sync on the next samples, e.g. after resuming playback."""
+        self.accuracy = 0.05
+
+    def reset(self) -> None:
+        """Forget the current correction, e.g. after a seek."""
+        self.accuracy = self.original_accuracy
+
+
+class LadderController(SyncController):
+    """Fixed speed steps, 0.05 above mid_diff and 0.01 above accuracy."""
+
+    def decide(self, diff: float, now: float, *, can_pause: bool) -> tuple[SyncAction, float]:
+        sign = 1 if diff > 0 else -1
+        if can_pause and -self.max_diff < diff < -self.accuracy:
+            self.accuracy = 0.05
+            return SyncAction.PAUSE, abs(diff)
+        if abs(diff) > self.max_diff:
+            return SyncAction.SEEK, 0
+        if abs(diff) > self.mid_diff:
+            self.accuracy = 0.05
+            return SyncAction.SPEED, sign * 0.05
+        if abs(diff) > self.accuracy:
+            self.accuracy = 0.05
+            return SyncAction.SPEED, sign * 0.01
+        if self.accuracy != self.original_accuracy:
+            reached = self.accuracy
+            self.accuracy = self.original_accuracy
+            return SyncAction.SYNCED, reached
+        return SyncAction.IDLE, 0
+
+
+class PIController(SyncController):
+    """Proportional-integral speed correction over an EWMA of the drift.
+
+    The output is clamped to max_offset and quantized to step, and a new
+    speed is only sent when the quantized value changes, which avoids the
+    back and forth of the ladder and most of its messages.
+    """
+
+    kp: float = 0.25
+    ki: float = 0.05
+    smoothing: float = 0.3  # EWMA weight of the newest sample
+    max_offset: float = 0.1
+    step: float = 0.01
+
+    def __init__(self, max_diff: float, mid_diff: float, accuracy: float) -> None:
+        super().__init__(max_diff, mid_diff, accuracy)
+        self.filtered: float | None = None
+        self.integral = 0.0
+        self.offset = 0.0
+        self.last_time: float | None = None
+
+    def decide(self, diff: float, now: float, *, can_pause: bool) -> tuple[SyncAction, float]:
+        if abs(diff) > self.max_diff:
+            self.reset()
+            return SyncAction.SEEK, 0
+
+        if self.filtered is None:
+            self.filtered = diff
+        else:
+            self.filtered += PIController.smoothing * (diff - self.filtered)
+        dt = 0 if self.last_time is None else min(now - self.last_time, 1)
+        self.last_time = now
+        error = self.filtered
+
+        if can_pause and -self.max_diff < error < -self.mid_diff:
+            self.reset()
+            self.accuracy = 0.05
+            return SyncAction.PAUSE, abs(error)
+
+        if abs(error) <= self.accuracy:
+            if self.offset != 0:
+                reached = self.accuracy
+                self.reset()
+                return SyncAction.SYNCED, reached
+            return SyncAction.IDLE, 0
+
+        limit = PIController.max_offset / PIController.ki
+        self.integral = max(-limit, min(limit, self.integral + error * dt))
+        output = PIController.kp * error + PIController.ki * self.integral
+        output = max(-PIController.max_offset, min(PIController.max_offset, output))
+        offset = round(round(output / PIController.step) * PIController.step, 3)
+        if offset == 0:
+            offset = PIController.step if error > 0 else -PIController.step
+        self.accuracy = 0.05
+        if offset == self.offset:
+            return SyncAction.HOLD, offset
+        self.offset = offset
+        return SyncAction.SPEED, offset
+
+    def reset(self) -> None:
+        super().reset()
+        self.filtered = None
+        self.integral = 0.0
+        self.offset = 0.0
+        self.last_time = None
+
+
+controllers: dict[str, type[SyncController]] = {
+    "ladder": LadderController,
+    "pi": PIController,
+}
@@ -0,0 +1,84 @@
+"""Compact binary encoding for the high frequency websocket messages.
+
+Clients that offer the ``syncreaction.bin`` subprotocol exchange
+``playbackSync``, ``set`` and ``schedule`` messages as fixed-layout
+little-endian frames, everything else (and every client without it) stays
+JSON text.
+
+    playbackSync  <B d d       type, playback time, client time
+    set           <B B d       type, property, value
+    schedule      <B d d d d   type, mpv position, mpv rate, client time, delay
+"""
+import json
+import struct
+
+from typing import Any
+
+BINARY = "syncreaction.bin"
+JSON = "syncreaction.json"
+SUBPROTOCOLS = (BINARY, JSON)  # in order of preference
+
+PLAYBACK_SYNC = 1
+SET = 2
+SCHEDULE = 3
+
+_playback_sync = struct.Struct("<Bdd")
+_set = struct.Struct("<BBd")
+_schedule = struct.Struct("<Bdddd")
+
+PROPERTIES = ("pause", "playback-time", "speed", "speedOffset", "addListener", "removeListener", "reportInterval")
+_property_codes = {name: code for code, name in enumerate(PROPERTIES, 1)}
+# string values of addListener / removeListener
+LISTENERS = ("playback-time", "state", "audio")
+_listener_codes = {name: code for code, name in enumerate(LISTENERS, 1)}
+
+
+class DecodeError(ValueError):
+    """A frame that is not a message of the protocol."""
+
+
+def select_subprotocol(connection: Any, subprotocols: list[str]) -> str | None:
+    """Pick the preferred encoding, older clients that offer none get JSON."""
+    for subprotocol in SUBPROTOCOLS:
+        if subprotocol in subprotocols:
+            return subprotocol
+    return None
+
+
+def encode(msg: dict, subprotocol: str | None) -> str | bytes:
+    if subprotocol == BINARY and msg["type"] == "set" and msg["property"] in _property_codes:
+        value = msg["value"]
+        if isinstance(value, str):
+            if value not in _listener_codes:
+                raise ValueError(f"unknown listener {value!r}")
+            value = _listener_codes[value]
+        return _set.pack(SET, _property_codes[msg["property"]], value)
+    if subprotocol == BINARY and msg["type"] == "schedule" and msg["value"] is not None:
+        return _schedule.pack(SCHEDULE, msg["value"], msg["speed"], msg["time"], msg["delay"])
+    return json.dumps(msg)
+
+
+def decode(frame: str | bytes) -> dict:
+    """Raise DecodeError for anything that is not a message, the frames come from the network."""
+    if isinstance(frame, str):
+        try:
+            msg = json.loads(frame)
+        except ValueError as e:
+            raise DecodeError(f"invalid JSON: {e}") from None
+        if not isinstance(msg, dict) or "type" not in msg:
+            raise DecodeError("not a message")
+        return msg
+    if not frame:
+        raise DecodeError("empty frame")
+    try:
+        if frame[0] == PLAYBACK_SYNC:
+            _, value, client_time = _playback_sync.unpack(frame)
+            return {"type": "playbackSync", "property": "playback-time", "value": value, "time": client_time}
+        if frame[0] == SET:
+            _, code, value = _set.unpack(frame)
+            if not 0 < code <= len(PROPERTIES):
+                raise DecodeError(f"unknown property {code}")
+            return {"type": "set", "property": PROPERTIES[code - 1], "value": value}
+    except struct.error as e:
+        raise DecodeError(f"frame type {frame[0]}: {e}") from None
+    raise DecodeError(f"unknown frame type {frame[0]}")
@@ -0,0 +1,234 @@
+"""Load test of the watch party hub with hundreds of simulated viewers.
+
+Starts the real script in hub mode against a FakeMpv, syncs one local
+tab (the host) and then connects N viewers to ``/watch``, all watching
+the same video. mpv is then paused, resumed, seeked and sped up a few
+times and the run measures:
+
+- join: time until every viewer is connected and following
+- fan-out: time from the mpv change until the last viewer received it
+- residual: distance of the viewers from the host once the run settles
+- CPU: CPU time of the script process over wall time, the script is
+  pinned to a single core where the platform allows it
+
+    python benchmarks/bench_hub.py --viewers 100 500
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from pathlib import Path
+from typing import Any
+
+from bench_sync import SCRIPT, free_port, percentile, wait_for_port
+from fake_browser import SimulatedBrowser
+from fake_mpv import FakeMpv
+
+EVENTS = ("pause", "resume", "seek", "speed")
+POLL = 0.005
+
+
+class RecordingBrowser(SimulatedBrowser):
+    """Simulated tab that notes when each property last arrived."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.arrived: dict[str, float] = {}
+
+    def on_set(self, name: str, value: Any) -> None:
+        self.arrived[name] = time.monotonic()
+        super().on_set(name, value)
+
+
+def server_metrics(port: int) -> dict | None:
+    try:
+        with urllib.request.urlopen(f"http://localhost:{port}/metrics.json", timeout=5) as response:
+            return json.load(response)
+    except OSError:
+        return None
+
+
+def gauge(metrics: dict | None, name: str) -> float:
+    return 0 if metrics is None else metrics["gauges"].get(name, 0)
+
+
+async def wait_until(predicate: Any, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(POLL)
+    return predicate()
+
+
+def pin(core: int) -> None:
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {core})
+
+
+async def fan_out(mpv: FakeMpv, viewers: list[RecordingBrowser], event: str, prop: str, args: argparse.Namespace) -> list[float]:
+    """Apply event to mpv, return the arrival delay of prop at every viewer that got it."""
+    if event in ("pause", "resume") and mpv.props["pause"] == (event == "pause"):
+        # left in that state by the host, mpv would not report the change
+        mpv.loop.call_soon_threadsafe(mpv.set, "pause", event != "pause")
+        await asyncio.sleep(args.gap)
+    start = time.monotonic()
+    if event == "pause":
+        mpv.loop.call_soon_threadsafe(mpv.set, "pause", True)
+    elif event == "resume":
+        mpv.loop.call_soon_threadsafe(mpv.set, "pause", False)
+    elif event == "seek":
+        mpv.loop.call_soon_threadsafe(mpv.seek, mpv.position() + 30)
+    elif event == "speed":
+        speed = 1.5 if mpv.props["speed"] == 1.0 else 1.0
+        mpv.loop.call_soon_threadsafe(mpv.set, "speed", speed)
+    await wait_until(lambda: all(v.arrived.get(prop, 0) >= start for v in viewers), args.timeout)
+    return [v.arrived[prop] - start for v in viewers if v.arrived.get(prop, 0) >= start]
+
+
+async def run_scenario(count: int, args: argparse.Namespace) -> dict:
+    rng = random.Random(f"{args.seed}-{count}")
+    workdir = Path(tempfile.mkdtemp(prefix="syncreaction-hub-"))
+    port = free_port()
+    (workdir / "SyncReaction_options.json").write_text(json.dumps({
+        "PORT": port,
+        "cache_size": 20,
+        "pauseToSync": False,  # the host is corrected without pausing mpv under the measured events
+        "heartbeatInterval": args.heartbeat,
+        "hub": True,
+        "hubHost": "127.0.0.1",
+    }))
+    mpv = FakeMpv(str(workdir / "mpvsocket"), workdir, seek_latency=args.seek_latency)
+    mpv.start()
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_before = usage.ru_utime + usage.ru_stime
+    with open(workdir / "server.log", "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, str(SCRIPT), "-s", "--socket", str(workdir / "mpvsocket")],
+            stdout=log, stderr=subprocess.STDOUT, preexec_fn=lambda: pin(args.core),  # noqa: PLW1509
+        )
+    runs: list[asyncio.Task] = []
+    fan: dict[str, list[float]] = {event: [] for event in EVENTS}
+    missed: dict[str, int] = {event: 0 for event in EVENTS}
+    try:
+        await wait_for_port(port, process)
+        wall_start = time.monotonic()
+
+        def browser(path: str) -> RecordingBrowser:
+            tab = RecordingBrowser(
+                "party",  # every tab watches the same video
+                random.Random(rng.random()),
+                start=mpv.position() + rng.uniform(-30, 30),
+                drift=rng.uniform(-args.drift, args.drift),
+                seek_latency=args.seek_latency,
+                binary=args.binary,
+            )
+            runs.append(asyncio.create_task(tab.run(f"ws://localhost:{port}{path}")))
+            return tab
+
+        host = browser("/")
+        await wait_until(lambda: gauge(server_metrics(port), "clients") >= 1, args.timeout)
+        await asyncio.sleep(args.settle)
+
+        join_start = time.monotonic()
+        viewers = [browser("/watch") for _ in range(count)]
+        joined = await wait_until(lambda: all("playback-time" in v.arrived for v in viewers), args.join_timeout)
+        join = time.monotonic() - join_start if joined else None
+        await asyncio.sleep(args.settle)
+
+        for _ in range(args.rounds):
+            for event in EVENTS:
+                prop = {"resume": "pause", "seek": "playback-time"}.get(event, event)
+                delays = await fan_out(mpv, viewers, event, prop, args)
+                fan[event] += delays
+                missed[event] += count - len(delays)
+                await asyncio.sleep(args.gap)
+
+        await asyncio.sleep(args.settle)
+        residual = [abs(v.position() - host.position()) for v in viewers]
+        metrics = server_metrics(port)
+        wall = time.monotonic() - wall_start
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        mpv.stop()
+        for run in runs:
+            run.cancel()
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = usage.ru_utime + usage.ru_stime - cpu_before
+    return {
+        "viewers": count,
+        "joined": gauge(metrics, "viewers"),
+        "join_seconds": join,
+        "fan_out": {
+            event: {"p50": percentile(fan[event], 0.5), "p95": percentile(fan[event], 0.95), "max": max(fan[event], default=None), "missed": missed[event]}
+            for event in EVENTS
+        },
+        "residual_p50": percentile(residual, 0.5),
+        "residual_p95": percentile(residual, 0.95),
+        "within_tolerance": sum(r <= args.tolerance for r in residual) / count,
+        "cpu_percent": 100 * cpu / wall,
+        "max_rss_mb": usage.ru_maxrss / 1024,
+        "server_metrics": metrics,
+    }
+
+
+def print_table(results: list[dict]) -> None:
+    def fmt(value: float | None, spec: str) -> str:
+        return "-" if value is None else format(value, spec)
+
+    header = f"{'viewers':>7} {'join s':>7} " + " ".join(f"{event + ' p95':>11}" for event in EVENTS)
+    print(header + f" {'resid p95':>9} {'in tol%':>7} {'cpu%':>6} {'rss MB':>7}")
+    for r in results:
+        fan = " ".join(f"{fmt(r['fan_out'][event]['p95'] and 1000 * r['fan_out'][event]['p95'], '8.1f')} ms" for event in EVENTS)
+        print(
+            f"{r['viewers']:>7} {fmt(r['join_seconds'], '7.2f')} {fan} {fmt(r['residual_p95'], '9.3f')} "
+            f"{100 * r['within_tolerance']:>7.0f} {r['cpu_percent']:>6.1f} {r['max_rss_mb']:>7.0f}"
+        )
+    for r in results:
+        missed = {event: r["fan_out"][event]["missed"] for event in EVENTS if r["fan_out"][event]["missed"]}
+        if missed:
+            print(f"{r['viewers']} viewers, updates not received within the timeout: {missed}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--viewers", type=int, nargs="+", default=[500])
+    parser.add_argument("--rounds", type=int, default=3, help="times each event is applied")
+    parser.add_argument("--heartbeat", type=int, default=5000, help="ms between viewer reports")
+    parser.add_argument("--binary", action="store_true", help="offer the binary subprotocol")
+    parser.add_argument("--drift", type=float, default=0.002, help="max playback rate error of a tab")
+    parser.add_argument("--seek-latency", type=float, default=0.1, help="seconds a seek takes")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="distance from the host counted as following")
+    parser.add_argument("--settle", type=float, default=3, help="seconds before measuring, after joining and at the end")
+    parser.add_argument("--gap", type=float, default=1, help="seconds between events")
+    parser.add_argument("--timeout", type=float, default=5, help="seconds to wait for an event to reach every viewer")
+    parser.add_argument("--join-timeout", type=float, default=30)
+    parser.add_argument("--core", type=int, default=0, help="CPU the script is pinned to")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run_scenario(count, args)) for count in args.viewers]
+    print_table(results)
+    if args.json is not None:
+        args.json.write_text(json.dumps({"args": {k: str(v) for k, v in vars(args).items()}, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""Several mpv players synced by one script process or by one process each.
+
+Starts N FakeMpvs, each playing its own file, and syncs T simulated tabs
+to each of them, every player with its own video. The shared run starts
+a single script with one ``--socket`` per player, the separate run one
+script per player on its own port. Both report:
+
+- routed: tabs that ended up in sync with their own player
+- error: sync error of the tabs at the end of the run
+- CPU: CPU time of the script processes over wall time
+- RSS: resident memory of the script processes, summed
+
+    python benchmarks/bench_multi.py --players 2 4 --tabs 3
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Any
+
+from bench_sync import SCRIPT, free_port, percentile, wait_for_port
+from fake_browser import SimulatedBrowser
+from fake_mpv import FakeMpv
+
+
+class JoiningBrowser(SimulatedBrowser):
+    """Simulated tab that notes when the server onboarded it."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.joined = asyncio.Event()
+
+    def on_message(self, msg: dict) -> None:
+        if msg["type"] == "session":
+            self.joined.set()
+        super().on_message(msg)
+
+
+def rss(pid: int) -> int:
+    """Resident memory of pid in KiB."""
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmRSS:"):
+            return int(line.split()[1])
+    return 0
+
+
+def start_script(workdir: Path, port: int, sockets: list[str]) -> subprocess.Popen:
+    (workdir / "SyncReaction_options.json").write_text(json.dumps({"PORT": port, "cache_size": 20, "pauseToSync": True}))
+    with open(workdir / "server.log", "w") as log:
+        return subprocess.Popen(
+            [sys.executable, str(SCRIPT), "-s", *(arg for socket in sockets for arg in ("--socket", socket))],
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+
+
+async def run_scenario(players: int, *, shared: bool, args: argparse.Namespace) -> dict:
+    rng = random.Random(f"{args.seed}-{players}")
+    workdir = Path(tempfile.mkdtemp(prefix="syncreaction-multi-"))
+    mpvs = [
+        FakeMpv(str(workdir / f"mpvsocket{i}"), workdir, filename=f"video{i}.mkv", start=10 + 100 * i, seek_latency=args.seek_latency)
+        for i in range(players)
+    ]
+    for mpv in mpvs:
+        mpv.start()
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_before = usage.ru_utime + usage.ru_stime
+    if shared:
+        port = free_port()
+        ports = [port] * players
+        processes = [start_script(workdir, port, [mpv.socket_path for mpv in mpvs])]
+    else:
+        ports = [free_port() for _ in mpvs]
+        processes = []
+        for i, (port, mpv) in enumerate(zip(ports, mpvs)):
+            directory = workdir / f"script{i}"
+            directory.mkdir()
+            # the options live next to the socket, FakeMpv expands ~~ to its config_dir
+            mpv.config_dir = directory
+            processes.append(start_script(directory, port, [mpv.socket_path]))
+
+    runs: list[asyncio.Task] = []
+    tabs: list[tuple[JoiningBrowser, FakeMpv, float]] = []
+    try:
+        for port, process in zip(ports, processes):
+            await wait_for_port(port, process)
+        # a shared script waits for every player before it routes tabs
+        await asyncio.sleep(args.settle)
+        wall_start = time.monotonic()
+
+        async def connect(i: int, tab_index: int) -> JoiningBrowser:
+            mpv = mpvs[i]
+            tab = JoiningBrowser(
+                f"video{i}", random.Random(rng.random()),
+                start=mpv.position() + rng.uniform(-30, 30),
+                latency=args.latency, jitter=args.jitter, seek_latency=args.seek_latency,
+            )
+            tabs.append((tab, mpv, tab.position() - mpv.position()))  # the manual sync keeps the offset
+            runs.append(asyncio.create_task(tab.run(f"ws://localhost:{ports[i]}/")))
+            if tab_index == 0:
+                # the first tab of a player is routed to the newest one still waiting
+                await asyncio.wait_for(tab.joined.wait(), args.timeout)
+            return tab
+
+        for i in reversed(range(players)):
+            await connect(i, 0)
+        await asyncio.gather(*(connect(i, t) for i in range(players) for t in range(1, args.tabs)))
+        await asyncio.sleep(args.duration)
+
+        errors = [abs(tab.position() - mpv.position() - delay) for tab, mpv, delay in tabs]
+        memory = sum(rss(process.pid) for process in processes)
+        wall = time.monotonic() - wall_start
+    finally:
+        for process in processes:
+            process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        for mpv in mpvs:
+            mpv.stop()
+        for run in runs:
+            run.cancel()
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = usage.ru_utime + usage.ru_stime - cpu_before
+    return {
+        "players": players,
+        "mode": "shared" if shared else "separate",
+        "tabs": len(tabs),
+        "routed": sum(error <= args.tolerance for error in errors),
+        "error_p50": percentile(errors, 0.5),
+        "error_p95": percentile(errors, 0.95),
+        "cpu_percent": 100 * cpu / wall,
+        "rss_mb": memory / 1024,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 4])
+    parser.add_argument("--tabs", type=int, default=3, help="tabs synced to each player")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of playback measured after every tab joined")
+    parser.add_argument("--settle", type=float, default=1, help="seconds for the script to take over every player")
+    parser.add_argument("--latency", type=float, default=0.01, help="one way network latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="latency jitter, seconds")
+    parser.add_argument("--seek-latency", type=float, default=0.1, help="seconds a seek takes")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="sync error counted as routed to the right player")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    args = parser.parse_args()
+
+    results = [asyncio.run(run_scenario(players, shared=shared, args=args)) for players in args.players for shared in (False, True)]
+    print(f"{'players':>7} {'mode':>8} {'routed':>7} {'err p50':>8} {'err p95':>8} {'cpu%':>6} {'rss MB':>7}")
+    for r in results:
+        print(
+            f"{r['players']:>7} {r['mode']:>8} {r['routed']:>3}/{r['tabs']:<3} {r['error_p50']:>8.3f} "
+            f"{r['error_p95']:>8.3f} {r['cpu_percent']:>6.1f} {r['rss_mb']:>7.1f}"
+        )
+    if args.json is not None:
+        args.json.write_text(json.dumps({"args": {k: str(v) for k, v in vars(args).items()}, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Reconnect time of a synced tab, with and without its resume token.
+
+Starts the real script against a FakeMpv and syncs one simulated tab.
+The tab then loses its connection (TCP abort, no close handshake) a few
+times and reconnects with its resume token, and once without it, which
+is the full onboarding a reload used to take. For each reconnect the
+run reports:
+
+- ready: time from connecting until the server hands out the token again
+- requests: get requests the server sent on the way (url, playback-time)
+- error: sync error of the tab one second later
+
+    python benchmarks/bench_resume.py --rounds 5
+"""
+import argparse
+import asyncio
+import json
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from pathlib import Path
+from typing import Any
+
+from bench_sync import SCRIPT, free_port, percentile, wait_for_port
+from fake_browser import SimulatedBrowser
+from fake_mpv import FakeMpv
+
+
+class ResumingBrowser(SimulatedBrowser):
+    """Simulated tab that notes when it got its token and the requests it answered."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.session_at: float | None = None
+        self.requests = 0
+
+    def on_message(self, msg: dict) -> None:
+        if msg["type"] == "session":
+            self.session_at = time.monotonic()
+        elif msg["type"] == "get":
+            self.requests += 1
+        super().on_message(msg)
+
+
+async def reconnect(tab: ResumingBrowser, url: str, mpv: FakeMpv, delay: float, *, resume: bool, timeout: float) -> dict:
+    if not resume:
+        tab.resume_token = None
+    tab.session_at = None
+    tab.requests = 0
+    start = time.monotonic()
+    run = asyncio.create_task(tab.run(url))
+    deadline = start + timeout
+    while tab.session_at is None and time.monotonic() < deadline:
+        await asyncio.sleep(0.001)
+    ready = None if tab.session_at is None else tab.session_at - start
+    await asyncio.sleep(1)
+    return {
+        "resume": resume,
+        "ready": ready,
+        "requests": tab.requests,
+        "error": abs(tab.position() - mpv.position() - delay),
+        "run": run,
+    }
+
+
+async def run_bench(args: argparse.Namespace) -> list[dict]:
+    rng = random.Random(args.seed)
+    workdir = Path(tempfile.mkdtemp(prefix="syncreaction-resume-"))
+    port = free_port()
+    (workdir / "SyncReaction_options.json").write_text(json.dumps({
+        "PORT": port,
+        "cache_size": 20,
+        "pauseToSync": True,
+        "resumeGrace": 30,
+    }))
+    mpv = FakeMpv(str(workdir / "mpvsocket"), workdir, seek_latency=args.seek_latency)
+    mpv.start()
+    with open(workdir / "server.log", "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, str(SCRIPT), "-s", "--socket", str(workdir / "mpvsocket")],
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+    url = f"ws://localhost:{port}/"
+    results = []
+    try:
+        await wait_for_port(port, process)
+        tab = ResumingBrowser(
+            "resume", rng, start=mpv.position() + rng.uniform(-30, 30),
+            latency=args.latency, jitter=args.jitter, seek_latency=args.seek_latency,
+        )
+        delay = tab.position() - mpv.position()  # the manual sync keeps the current offset
+        first = await reconnect(tab, url, mpv, delay, resume=False, timeout=args.timeout)
+        results.append(first)
+        for i in range(args.rounds + 1):
+            await asyncio.sleep(args.settle)
+            tab.drop()
+            await asyncio.sleep(args.offline)
+            # the last round reconnects like an older userscript would
+            result = await reconnect(tab, url, mpv, delay, resume=i < args.rounds, timeout=args.timeout)
+            results.append(result)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        mpv.stop()
+        for result in results:
+            result.pop("run").cancel()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rounds", type=int, default=5, help="reconnects with the token")
+    parser.add_argument("--offline", type=float, default=0.2, help="seconds without connection")
+    parser.add_argument("--settle", type=float, default=3, help="seconds between reconnects")
+    parser.add_argument("--latency", type=float, default=0.01, help="one way network latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="latency jitter, seconds")
+    parser.add_argument("--seek-latency", type=float, default=0.1, help="seconds a seek takes")
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    results = asyncio.run(run_bench(args))
+    print(f"{'connect':>10} {'ready ms':>9} {'requests':>9} {'error':>7}")
+    for i, r in enumerate(results):
+        kind = "resume" if r["resume"] else ("first" if i == 0 else "onboard")
+        ready = "-" if r["ready"] is None else f"{1000 * r['ready']:9.1f}"
+        print(f"{kind:>10} {ready:>9} {r['requests']:>9} {r['error']:>7.3f}")
+    resumed = [r["ready"] for r in results if r["resume"] and r["ready"] is not None]
+    if resumed:
+        print(f"resume p50 {1000 * percentile(resumed, 0.5):.1f} ms, max {1000 * max(resumed):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""Benchmark SyncReaction against a fake mpv and simulated browser tabs.
+
+Each scenario starts the real script (``SyncReaction.py -s``) as a
+subprocess, pointed at a FakeMpv socket, and connects N simulated tabs to
+it. After a warm-up every tab is knocked off sync by a random jump, then
+the run measures:
+
+- convergence: time until a tab stays within --tolerance of mpv for 1 s
+- residual: absolute sync error over the last third of the run
+- msgs/s: websocket frames exchanged per second, both directions
+- CPU: CPU time of the script process over wall time
+
+The server side metrics (/metrics.json) of every run are kept in the JSON
+report. Runs on Linux/macOS, needs the packages in requirements.txt.
+
+    python benchmarks/bench_sync.py --clients 1 10 50 100 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import resource
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from pathlib import Path
+
+from fake_browser import SimulatedBrowser
+from fake_mpv import FakeMpv
+
+SCRIPT = Path(__file__).resolve().parent.parent / "SyncReaction" / "SyncReaction.py"
+HOLD = 1.0  # seconds within tolerance that count as converged
+SAMPLE = 0.1
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 15) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"SyncReaction exited with code {process.returncode}")
+        try:
+            _, writer = await asyncio.open_connection("localhost", port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.05)
+    raise TimeoutError("SyncReaction did not start listening")
+
+
+def convergence_time(samples: list[tuple[float, float]], since: float, tolerance: float) -> float | None:
+    inside_since = None
+    for t, error in samples:
+        if t < since:
+            continue
+        if abs(error) <= tolerance:
+            if inside_since is None:
+                inside_since = t
+            elif t - inside_since >= HOLD:
+                return inside_since - since
+        else:
+            inside_since = None
+    return None
+
+
+async def run_scenario(clients: int, args: argparse.Namespace) -> dict:
+    rng = random.Random(f"{args.seed}-{clients}")
+    workdir = Path(tempfile.mkdtemp(prefix="syncreaction-bench-"))
+    port = free_port()
+    (workdir / "SyncReaction_options.json").write_text(json.dumps({
+        "PORT": port,
+        "cache_size": 20,
+        "pauseToSync": True,
+        "syncController": args.controller,
+        "reportInterval": args.report_interval,
+        "recordTrace": args.record_trace,
+    }))
+    mpv = FakeMpv(str(workdir / "mpvsocket"), workdir, seek_latency=args.seek_latency)
+    mpv.start()
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_before = usage.ru_utime + usage.ru_stime
+    wall_start = time.monotonic()
+    with open(workdir / "server.log", "w") as log:
+        process = subprocess.Popen(
+            [sys.executable, str(SCRIPT), "-s", "--socket", str(workdir / "mpvsocket"), *(["--profile"] if args.profile else [])],
+            stdout=log, stderr=subprocess.STDOUT,
+        )
+    try:
+        await wait_for_port(port, process)
+
+        browsers = [
+            SimulatedBrowser(
+                f"sim{i:03d}",
+                random.Random(rng.random()),
+                start=mpv.position() + rng.uniform(-30, 30),
+                drift=rng.uniform(-args.drift, args.drift),
+                clock_offset=rng.uniform(-args.clock_offset, args.clock_offset),
+                latency=args.latency,
+                jitter=args.jitter,
+                stall_rate=args.stall_rate,
+                seek_latency=args.seek_latency,
+                binary=args.binary,
+                follow_schedule=args.schedule,
+            )
+            for i in range(clients)
+        ]
+        offsets = [browser.position() - mpv.position() for browser in browsers]
+        runs = [asyncio.create_task(browser.run(f"ws://localhost:{port}/")) for browser in browsers]
+
+        samples: list[list[tuple[float, float]]] = [[] for _ in browsers]
+        kick_at = args.duration / 3
+        kicked = False
+        start = time.monotonic()
+        while (elapsed := time.monotonic() - start) < args.duration:
+            if not kicked and elapsed >= kick_at:
+                for browser in browsers:
+                    browser.kick(rng.uniform(-args.kick, args.kick))
+                kicked = True
+            reference = mpv.position()
+            for i, browser in enumerate(browsers):
+                samples[i].append((elapsed, browser.position() - reference - offsets[i]))
+            await asyncio.sleep(SAMPLE)
+
+        try:
+            with urllib.request.urlopen(f"http://localhost:{port}/metrics.json", timeout=5) as response:
+                server_metrics = json.load(response)
+        except OSError:
+            server_metrics = None
+    finally:
+        wall = time.monotonic() - wall_start
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        mpv.stop()
+    for run in runs:
+        run.cancel()
+
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = usage.ru_utime + usage.ru_stime - cpu_before
+
+    convergence = [convergence_time(s, kick_at, args.tolerance) for s in samples]
+    converged = [c for c in convergence if c is not None]
+    residual = [abs(error) for s in samples for t, error in s if t >= args.duration * 2 / 3]
+    frames = sum(browser.sent + browser.received for browser in browsers)
+    return {
+        "clients": clients,
+        "converged": len(converged) / clients,
+        "convergence_p50": percentile(converged, 0.5),
+        "convergence_p95": percentile(converged, 0.95),
+        "residual_mean": sum(residual) / len(residual) if residual else None,
+        "residual_p95": percentile(residual, 0.95),
+        "messages_per_second": frames / args.duration,
+        "cpu_percent": 100 * cpu / wall,
+        "mpv_commands": mpv.commands,
+        "traces": [str(path) for path in (workdir / "traces").glob("*.ndjson.gz")],
+        "profiles": [str(path) for path in (workdir / "profiles").glob("*.txt")],
+        "server_metrics": server_metrics,
+    }
+
+
+def print_table(results: list[dict]) -> None:
+    def fmt(value: float | None, spec: str) -> str:
+        return "-" if value is None else format(value, spec)
+
+    print(f"{'clients':>7} {'conv%':>6} {'conv p50':>9} {'conv p95':>9} {'resid':>8} {'resid p95':>9} {'msgs/s':>8} {'cpu%':>6}")
+    for r in results:
+        print(
+            f"{r['clients']:>7} {100 * r['converged']:>6.0f} {fmt(r['convergence_p50'], '9.2f')} "
+            f"{fmt(r['convergence_p95'], '9.2f')} {fmt(r['residual_mean'], '8.3f')} {fmt(r['residual_p95'], '9.3f')} "
+            f"{r['messages_per_second']:>8.0f} {r['cpu_percent']:>6.1f}"
+        )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--duration", type=float, default=20, help="seconds per scenario")
+    parser.add_argument("--controller", default="ladder", choices=["ladder", "pi"])
+    parser.add_argument("--report-interval", type=int, default=0, help="ms, see reportInterval option")
+    parser.add_argument("--binary", action="store_true", help="offer the binary subprotocol")
+    parser.add_argument("--schedule", action="store_true", help="tabs follow the schedule and correct their own drift")
+    parser.add_argument("--latency", type=float, default=0.01, help="one way network latency, seconds")
+    parser.add_argument("--jitter", type=float, default=0.005, help="latency jitter, seconds")
+    parser.add_argument("--drift", type=float, default=0.002, help="max playback rate error of a tab")
+    parser.add_argument("--clock-offset", type=float, default=2, help="max browser clock offset, seconds")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="buffering stalls per second per tab")
+    parser.add_argument("--seek-latency", type=float, default=0.1, help="seconds a seek takes")
+    parser.add_argument("--kick", type=float, default=0.5, help="max position jump applied to each tab")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="sync error counted as converged")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--record-trace", action="store_true", help="record a session trace, see replay_trace.py")
+    parser.add_argument("--profile", action="store_true", help="profile the script for the whole run")
+    parser.add_argument("--json", type=Path, help="write the results to this file")
+    parser.add_argument(
+        "--max-msgs", type=float, default=100, help="fail if a scenario exceeds this many messages per second per client"
+    )
+    args = parser.parse_args()
+
+    results = [asyncio.run(run_scenario(clients, args)) for clients in args.clients]
+    print_table(results)
+    for r in results:
+        for path in r["traces"]:
+            print(f"trace ({r['clients']} clients): {path}")
+        for path in r["profiles"]:
+            print(f"profile ({r['clients']} clients): {path}")
+    if args.json is not None:
+        args.json.write_text(json.dumps({"args": {k: str(v) for k, v in vars(args).items()}, "results": results}, indent=2))
+    # a feedback loop between the tabs and mpv shows up as a message storm
+    chatty = [r["clients"] for r in results if r["messages_per_second"] > args.max_msgs * r["clients"]]
+    if chatty:
+        sys.exit(f"more than {args.max_msgs:g} msgs/s per client with {', '.join(map(str, chatty))} clients")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+"""Simulated browser tab running the SyncReaction userscript.
+
+Speaks the same websocket protocol as sync.user.js (JSON or binary frames,
+get/set/ping/notice) on top of a playback model with its own clock offset,
+playback rate drift, network latency and jitter, buffering stalls and seek
+latency. With ``follow_schedule`` it corrects its own drift against the
+schedule the server sends, like the userscripts do.
+
+Every random choice comes from the ``rng`` passed in, so a seed fixes the
+scenario: clock offsets, drift rates and the sequence of latency, jitter
+and stall draws. Time is the wall clock shared with a real script process
+and real sockets, so when each draw is used, and the results, still vary
+from run to run.
+"""
+import asyncio
+import json
+import random
+import struct
+import time
+
+from typing import Any
+
+import websockets
+
+SUBPROTOCOLS = ["syncreaction.bin", "syncreaction.json"]
+PROPERTIES = ("pause", "playback-time", "speed", "speedOffset", "addListener", "removeListener", "reportInterval")
+LISTENERS = ("playback-time", "state", "audio")
+PLAYING, PAUSED, BUFFERING = 1, 2, 3
+SCHEDULE = 3  # binary frame type
+
+
+class SimulatedBrowser:
+    timeupdate: float = 0.25  # seconds between timeupdate events while playing
+    # local drift correction, the same as the userscripts
+    max_diff: float = 2
+    accuracy: float = 0.04
+    settled: float = 0.01
+    max_offset: float = 0.1
+
+    def __init__(
+        self,
+        name: str,
+        rng: random.Random,
+        *,
+        start: float,
+        drift: float = 0.0,
+        clock_offset: float = 0.0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        stall_rate: float = 0.0,
+        stall_time: float = 0.5,
+        seek_latency: float = 0.1,
+        binary: bool = False,
+        follow_schedule: bool = False,
+    ) -> None:
+        self.name = name
+        self.rng = rng
+        self.drift = drift
+        self.clock_offset = clock_offset
+        self.latency = latency
+        self.jitter = jitter
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.seek_latency = seek_latency
+        self.offer_binary = binary
+        self.follow_schedule = follow_schedule
+        self.schedule: dict | None = None
+
+        self.base = (start, time.monotonic())
+        self.speed = 1.0
+        self.speed_offset = 0.0
+        self.paused = False
+        self.stalled = False
+        self.seek_pending = False  # report ready once the current stall ends
+        self.listening = False
+        self.report_interval = 0.0
+        self.last_report = 0.0
+        self.resume_token: str | None = None
+
+        self.websocket: Any = None
+        self.binary = False
+        self.outgoing: asyncio.Queue = asyncio.Queue()
+        self.last_arrival = 0.0  # keeps delivery in order despite the jitter
+        self.sent = 0
+        self.received = 0
+        self.closed = asyncio.Event()
+
+    # ------- playback model --------------------------------------
+
+    def position(self, now: float | None = None) -> float:
+        position, stamp = self.base
+        if self.paused or self.stalled:
+            return position
+        if now is None:
+            now = time.monotonic()
+        return position + (self.speed + self.speed_offset) * (1 + self.drift) * (now - stamp)
+
+    def rebase(self, position: float | None = None) -> None:
+        now = time.monotonic()
+        self.base = (self.position(now) if position is None else position, now)
+
+    def state(self) -> int:
+        if self.stalled:
+            return BUFFERING
+        return PAUSED if self.paused else PLAYING
+
+    def kick(self, seconds: float) -> None:
+        """Jump the playback position, like a decoder hiccup the server has to correct."""
+        self.rebase(self.position() + seconds)
+
+    def client_now(self) -> float:
+        return time.time() + self.clock_offset
+
+    # ------- network ---------------------------------------------
+
+    def delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    def transmit(self, frame: str | bytes) -> None:
+        self.outgoing.put_nowait((time.monotonic() + self.delay(), frame))
+
+    def send_set(self, name: str, value: float) -> None:
+        if self.binary:
+            self.transmit(struct.pack("<BBd", 2, PROPERTIES.index(name) + 1, value))
+        else:
+            self.transmit(json.dumps({"type": "set", "property": name, "value": value}))
+
+    async def sender(self) -> None:
+        while True:
+            arrival, frame = await self.outgoing.get()
+            await asyncio.sleep(max(0.0, arrival - time.monotonic()))
+            await self.websocket.send(frame)
+            self.sent += 1
+
+    async def receiver(self) -> None:
+        loop = asyncio.get_running_loop()
+        async for frame in self.websocket:
+            self.received += 1
+            arrival = max(self.last_arrival, loop.time() + self.delay())
+            self.last_arrival = arrival
+            loop.call_at(arrival, self.on_message, self.decode(frame))
+
+    @staticmethod
+    def decode(frame: str | bytes) -> dict:
+        if isinstance(frame, str):
+            return json.loads(frame)
+        if frame[0] == SCHEDULE:
+            _, value, speed, client_time, delay = struct.unpack("<Bdddd", frame)
+            return {"type": "schedule", "value": value, "speed": speed, "time": client_time, "delay": delay}
+        _, code, value = struct.unpack("<BBd", frame)
+        name = PROPERTIES[code - 1]
+        if name in ("addListener", "removeListener"):
+            value = LISTENERS[int(value) - 1]
+        return {"type": "set", "property": name, "value": value}
+
+    # ------- userscript ------------------------------------------
+
+    def on_message(self, msg: dict) -> None:
+        if msg["type"] == "set":
+            self.on_set(msg["property"], msg["value"])
+        elif msg["type"] == "get":
+            value = f"https://www.youtube.com/watch?v={self.name}" if msg["property"] == "url" else self.position()
+            self.transmit(json.dumps({"type": "get-property", "property": msg["property"], "value": value, "id": msg.get("id")}))
+        elif msg["type"] == "session":
+            self.resume_token = msg["value"]
+        elif msg["type"] == "schedule":
+            self.schedule = None if msg["value"] is None else msg
+            if self.schedule is None:
+                self.correct(0.0)
+        elif msg["type"] == "ping":
+            self.transmit(json.dumps({"type": "pong", "value": msg["value"], "time": self.client_now()}))
+        elif msg["type"] == "notice" and msg["value"] == "stopping server":
+            self.closed.set()
+
+    def on_set(self, name: str, value: Any) -> None:
+        if name == "pause":
+            self.rebase()
+            self.paused = bool(value)
+            self.send_set("pause", self.state())
+        elif name == "playback-time":
+            self.seek(value)
+        elif name == "speed":
+            self.rebase()
+            self.speed = value
+            self.speed_offset = 0.0
+            self.send_set("speed", value)  # onPlaybackRateChange
+        elif name == "speedOffset":
+            self.rebase()
+            self.speed_offset = value
+        elif name == "reportInterval":
+            self.report_interval = value / 1000
+        elif name == "addListener" and value == "playback-time":
+            self.listening = True
+        elif name == "removeListener" and value == "playback-time":
+            self.listening = False
+
+    def follow(self, now: float) -> bool:
+        """Correct the drift from the schedule, False when it is too far off to correct."""
+        schedule = self.schedule
+        target = schedule["value"] + schedule["speed"] * (self.client_now() - schedule["time"]) + schedule["delay"]
+        diff = target - self.position(now)
+        if abs(diff) > SimulatedBrowser.max_diff:
+            self.correct(0.0)
+            return False
+        if abs(diff) > (SimulatedBrowser.settled if self.speed_offset else SimulatedBrowser.accuracy):
+            offset = max(-SimulatedBrowser.max_offset, min(SimulatedBrowser.max_offset, round(diff, 2)))
+            self.correct(offset or (0.01 if diff > 0 else -0.01))
+        else:
+            self.correct(0.0)
+        return True
+
+    def correct(self, offset: float) -> None:
+        if offset != self.speed_offset:
+            self.rebase()
+            self.speed_offset = offset
+
+    def seek(self, target: float) -> None:
+        self.rebase(target)
+        self.seek_pending = True
+        self.stall(self.seek_latency)
+
+    def send_ready(self) -> None:
+        self.transmit(json.dumps({"type": "notice", "value": "ready"}))
+
+    def stall(self, duration: float) -> None:
+        if self.stalled:
+            return
+        self.rebase()
+        self.stalled = True
+        self.send_set("pause", BUFFERING)
+
+        def resume() -> None:
+            self.rebase()
+            self.stalled = False
+            if self.seek_pending:
+                self.seek_pending = False
+                self.send_ready()
+            self.send_set("pause", self.state())
+
+        asyncio.get_running_loop().call_later(duration, resume)
+
+    async def timeupdates(self) -> None:
+        while True:
+            await asyncio.sleep(SimulatedBrowser.timeupdate)
+            if self.stall_rate and self.rng.random() < self.stall_rate * SimulatedBrowser.timeupdate:
+                self.stall(self.stall_time)
+            if not self.listening or self.paused or self.stalled:
+                continue
+            now = time.monotonic()
+            # exceptions to the schedule are reported right away
+            exception = self.schedule is not None and not self.seek_pending and not self.follow(now)
+            if not exception and now - self.last_report < self.report_interval:
+                continue
+            self.last_report = now
+            if self.binary:
+                self.transmit(struct.pack("<Bdd", 1, self.position(now), self.client_now()))
+            else:
+                msg = {"type": "playbackSync", "property": "playback-time", "value": self.position(now), "time": self.client_now()}
+                self.transmit(json.dumps(msg))
+
+    def drop(self) -> None:
+        """Lose the connection without a close handshake, like a network blip."""
+        self.websocket.transport.abort()
+
+    async def run(self, url: str) -> None:
+        if self.resume_token is not None:
+            url += f"?resume={self.resume_token}"
+        subprotocols = SUBPROTOCOLS if self.offer_binary else None
+        async with websockets.connect(url, subprotocols=subprotocols, max_queue=None) as websocket:
+            self.websocket = websocket
+            self.binary = websocket.subprotocol == "syncreaction.bin"
+            tasks = [asyncio.create_task(coro) for coro in (self.sender(), self.timeupdates())]
+            self.send_ready()
+            if self.follow_schedule:
+                self.transmit(json.dumps({"type": "notice", "value": "schedule"}))
+            try:
+                await self.receiver()
+            except websockets.ConnectionClosed:
+                pass
+            finally:
+                for task in tasks:
+                    task.cancel()
+                self.closed.set()
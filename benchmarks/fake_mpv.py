@@ -0,0 +1,169 @@
+"""Stand-in for mpv's JSON IPC server.
+
+Implements the part of the protocol SyncReaction uses: get/set/observe
+properties, ``expand-path`` and fire-and-forget commands (keybind, OSD,
+script messages). Playback advances with the wall clock at the current
+speed, seeks take ``seek_latency`` seconds and emit the ``seeking``
+property like mpv does.
+
+The server runs its own event loop on a thread, so it is never slowed
+down (or blocked) by the code under test.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Any
+
+
+class FakeMpv:
+    def __init__(
+        self,
+        socket_path: str,
+        config_dir: Path,
+        *,
+        filename: str = "video.mkv",
+        start: float = 10.0,
+        seek_latency: float = 0.05,
+        tick: float = 1 / 30,
+    ) -> None:
+        self.socket_path = socket_path
+        self.config_dir = config_dir
+        self.seek_latency = seek_latency
+        self.tick = tick
+        self.props: dict[str, Any] = {
+            "speed": 1.0,
+            "pause": False,
+            "core-idle": False,
+            "seeking": False,
+            "eof-reached": False,
+            "filename": filename,
+            "playlist": [{"filename": filename, "current": True}],
+            "playlist-count": 1,
+            "keep-open": "no",
+            "video-sync": "display",
+        }
+        # (position, monotonic time) where playback last changed rate
+        self.base = (start, time.monotonic())
+        self.observers: list[tuple[asyncio.StreamWriter, int, str]] = []
+        self.commands = 0
+        self.loop: asyncio.AbstractEventLoop | None = None
+        self.stopped: asyncio.Future | None = None
+        self.thread: threading.Thread | None = None
+        self._started = threading.Event()
+
+    # ------- playback model --------------------------------------
+
+    def position(self) -> float:
+        position, stamp = self.base
+        if self.props["pause"] or self.props["seeking"]:
+            return position
+        return position + self.props["speed"] * (time.monotonic() - stamp)
+
+    def get(self, name: str) -> Any:
+        if name == "playback-time":
+            return self.position()
+        if name == "property-list":
+            return [*self.props, "playback-time", "osd-overlay"]
+        if name == "command-list":
+            return [{"name": name} for name in ("osd-overlay", "show-text", "keybind", "expand-path", "script-message")]
+        return self.props.get(name)
+
+    def set(self, name: str, value: Any) -> None:
+        if name == "playback-time":
+            self.seek(value)
+            return
+        if self.props.get(name) == value:
+            return  # mpv only reports actual changes
+        if name in ("pause", "speed"):
+            self.base = (self.position(), time.monotonic())
+        self.props[name] = value
+        self.emit(name, value)
+        if name == "pause":
+            self.props["core-idle"] = value
+            self.emit("core-idle", value)
+
+    def seek(self, target: float) -> None:
+        self.base = (self.position(), time.monotonic())
+        self.props["seeking"] = True
+        self.emit("seeking", True)
+
+        def done() -> None:
+            self.props["seeking"] = False
+            self.base = (target, time.monotonic())
+            self.emit("seeking", False)
+            self.emit("playback-time", target)
+
+        self.loop.call_later(self.seek_latency, done)
+
+    # ------- protocol --------------------------------------------
+
+    def emit(self, name: str, value: Any) -> None:
+        for writer, observer_id, observed in list(self.observers):
+            if observed == name:
+                self.write(writer, {"event": "property-change", "id": observer_id, "name": name, "data": value})
+
+    @staticmethod
+    def write(writer: asyncio.StreamWriter, data: dict) -> None:
+        if not writer.is_closing():
+            writer.write(json.dumps(data).encode() + b"\n")
+
+    async def connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while line := await reader.readline():
+                request = json.loads(line)
+                command = request["command"]
+                self.commands += 1
+                data = None
+                if command[0] == "get_property":
+                    data = self.get(command[1])
+                elif command[0] == "set_property":
+                    self.set(command[1], command[2])
+                elif command[0] == "observe_property":
+                    self.observers.append((writer, command[1], command[2]))
+                elif command[0] == "unobserve_property":
+                    self.observers = [o for o in self.observers if not (o[0] is writer and o[1] == command[1])]
+                elif command[0] == "expand-path":
+                    data = str(self.config_dir)
+                self.write(writer, {"request_id": request.get("request_id"), "error": "success", "data": data})
+                if command[0] == "observe_property":
+                    value = self.get(command[2])
+                    self.write(writer, {"event": "property-change", "id": command[1], "name": command[2], "data": value})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        self.observers = [o for o in self.observers if o[0] is not writer]
+
+    async def ticker(self) -> None:
+        # mpv reports the position on every frame
+        while True:
+            await asyncio.sleep(self.tick)
+            if not (self.props["pause"] or self.props["seeking"]):
+                self.emit("playback-time", self.position())
+
+    # ------- thread ----------------------------------------------
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=asyncio.run, args=(self._serve(),), name="fake-mpv", daemon=True)
+        self.thread.start()
+        self._started.wait()
+
+    async def _serve(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        server = await asyncio.start_unix_server(self.connection, self.socket_path)
+        ticker = asyncio.create_task(self.ticker())
+        self._started.set()
+        async with server:
+            await self.stopped
+        ticker.cancel()
+
+    def stop(self) -> None:
+        if self.stopped is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set_result, None)
+        if self.thread is not None:
+            self.thread.join(timeout=2)
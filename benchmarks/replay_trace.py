@@ -0,0 +1,131 @@
+"""Replay the sync decisions of a recorded session through other controllers.
+
+Enable ``recordTrace`` in SyncReaction_options.json to record sessions,
+traces are written to ``<mpv config directory>/script-opts/SyncReaction/traces``.
+
+Every ``sync`` event of a client is fed to a fresh controller, as fast as
+the controller runs. Decisions only change the drift that follows them, so
+the replay corrects the recorded drift with the effect of its own choices:
+a different speed offset moves the diff by the offset difference times the
+elapsed time, a seek or pause to sync brings it back to zero and one that
+only happened in the recording is undone. Anything the browser did on its
+own is kept as recorded, so treat the numbers as a comparison, not a
+prediction.
+
+    python benchmarks/replay_trace.py trace.ndjson.gz --controller ladder pi
+"""
+import argparse
+import sys
+import time
+
+from collections import Counter, defaultdict
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "SyncReaction"))
+
+from session_trace import read_trace  # noqa: E402
+from sync_controller import SyncAction, controllers  # noqa: E402
+
+CORRECTIONS = (SyncAction.SPEED.name, SyncAction.SEEK.name, SyncAction.PAUSE.name)
+JUMPS = (SyncAction.SEEK.name, SyncAction.PAUSE.name)
+
+
+class Replay:
+    """Counterfactual drift of one client under a replayed controller."""
+
+    def __init__(self, name: str, header: dict) -> None:
+        self.controller = controllers[name](header["max_diff"], header["mid_diff"], header["accuracy"])
+        self.actions: Counter[str] = Counter()
+        self.errors: list[float] = []
+        self.recorded_offset = 0.0
+        self.offset = 0.0
+        self.correction = 0.0
+        self.last_time: float | None = None
+
+    def control(self, call: str) -> None:
+        getattr(self.controller, call)()
+
+    def step(self, t: float, event: dict) -> None:
+        if self.last_time is not None:
+            # a larger offset than recorded closes the gap faster
+            self.correction -= (self.offset - self.recorded_offset) * (t - self.last_time)
+        self.last_time = t
+
+        diff = event["diff"] + self.correction
+        action, value = self.controller.update(diff, t, can_pause=event["can_pause"])
+        self.actions[action.name] += 1
+        self.errors.append(abs(diff))
+        if action == SyncAction.SPEED:
+            self.offset = value
+        elif action == SyncAction.SYNCED or action.name in JUMPS:
+            self.offset = 0.0
+
+        # the recorded diff drops to ~0 after a recorded jump
+        recorded_jump = event["action"] in JUMPS
+        if action.name in JUMPS:
+            self.correction = 0.0 if recorded_jump else -event["diff"]
+        elif recorded_jump:
+            self.correction += event["diff"]
+
+        if event["action"] == SyncAction.SPEED.name:
+            self.recorded_offset = event["value"]
+        elif event["action"] == SyncAction.SYNCED.name or recorded_jump:
+            self.recorded_offset = 0.0
+
+
+def percentile(values: list[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+def summarize(label: str, actions: Counter, errors: list[float], convergence: str) -> None:
+    corrections = " ".join(f"{name.lower()}:{actions[name]}" for name in CORRECTIONS)
+    mean = sum(errors) / len(errors) if errors else 0.0
+    print(f"{label:<10} {corrections:<28} mean |diff| {mean:.3f}s  p95 {percentile(errors, 0.95):.3f}s  {convergence}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("trace", type=Path)
+    parser.add_argument("--controller", nargs="+", default=list(controllers), choices=list(controllers))
+    args = parser.parse_args()
+
+    header, events = read_trace(args.trace)
+    decisions: dict[str, list[tuple[float, str, dict | str]]] = defaultdict(list)
+    duration = 0.0
+    for t, kind, client, data in events:
+        duration = t
+        if kind in ("sync", "control"):
+            decisions[client].append((t, kind, data))
+    print(f"{args.trace.name}: {duration:.0f}s, {len(decisions)} clients, recorded with {header['controller']}")
+
+    recorded_actions: Counter[str] = Counter()
+    recorded_errors = []
+    for client_events in decisions.values():
+        for _, kind, data in client_events:
+            if kind == "sync":
+                recorded_actions[data["action"]] += 1
+                recorded_errors.append(abs(data["diff"]))
+    summarize("recorded", recorded_actions, recorded_errors, "")
+
+    for name in args.controller:
+        start = time.perf_counter()
+        actions: Counter[str] = Counter()
+        errors: list[float] = []
+        summaries = []
+        for client_events in decisions.values():
+            replay = Replay(name, header)
+            for t, kind, data in client_events:
+                if kind == "control":
+                    replay.control(data)
+                else:
+                    replay.step(t, data)
+            actions += replay.actions
+            errors += replay.errors
+            summaries.append(replay.controller.stats.summary())
+        elapsed = time.perf_counter() - start
+        summarize(name, actions, errors, f"{'; '.join(summaries)} ({duration / max(elapsed, 1e-9):.0f}x real time)")
+
+
+if __name__ == "__main__":
+    main()
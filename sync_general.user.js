@@ -1,6 +1,6 @@
 // ==UserScript==
 // @name         SyncPlayers-general
-// @version      0.4
+// @version      0.13
 // @description  Sync playback between html5 video and mpv
 // @match        https://*/*
 // @icon         data:image/gif;base64,R0lGODlhAQABAAAAACH5BAEKAAEALAAAAAABAAEAAAICTAEAOw==
@@ -13,14 +13,21 @@
 (function () {
     'use strict';
     const PORT = 8001;
+    const HOST = "localhost";  // address of the mpv host, to join a watch party
+    const VIEWER = false;  // join as a viewer: follow the host without controlling it
+    const RESUME_KEY = "SyncReaction-resume";  // sessionStorage, survives a reload of the tab
+    const RECONNECT_DELAY = 500;  // ms before reconnecting a dropped session
     const protocol = "ws"
     let running = false;
     let mn = GM_registerMenuCommand("Sync", startSync);
 
     window.addEventListener('beforeunload', function (e) {
-        // Stop the script if it is still running while the window is being closed
+        // Leave without clientStop: a reload resumes the session, the
+        // server lets it go if the tab doesn't come back
         if (running) {
-            stopSync();
+            running = false;
+            leaveSession();
+            websocket.close(1000);
         };
     });
 
@@ -28,6 +35,43 @@
     let websocket;
     let mainVideo
 
+    // Compact binary frames, used when the server accepts the "syncreaction.bin" subprotocol
+    const SUBPROTOCOLS = ["syncreaction.bin", "syncreaction.json"];
+    const PROPERTIES = ["pause", "playback-time", "speed", "speedOffset", "addListener", "removeListener", "reportInterval"];
+    const LISTENERS = ["playback-time", "state", "audio"];
+    let binary = false;
+
+    function decodeFrame(data) {
+        const view = new DataView(data);
+        if (view.getUint8(0) == 3) {
+            return {
+                type: "schedule",
+                value: view.getFloat64(1, true),
+                speed: view.getFloat64(9, true),
+                time: view.getFloat64(17, true),
+                delay: view.getFloat64(25, true)
+            };
+        };
+        const property = PROPERTIES[view.getUint8(1) - 1];
+        let value = view.getFloat64(2, true);
+        if (property == "addListener" || property == "removeListener") {
+            value = LISTENERS[value - 1];
+        };
+        return { type: "set", property: property, value: value };
+    };
+
+    function sendSet(property, value) {
+        if (binary) {
+            const view = new DataView(new ArrayBuffer(10));
+            view.setUint8(0, 2);
+            view.setUint8(1, PROPERTIES.indexOf(property) + 1);
+            view.setFloat64(2, value, true);
+            websocket.send(view.buffer);
+        } else {
+            websocket.send(JSON.stringify({ type: "set", property: property, value: value }));
+        };
+    };
+
     function sendState(evt) {
         let v;
         if (evt.type == "pause") {
@@ -36,28 +80,83 @@
         if (evt.type == "playing") {
             v = 1;
         };
-        const msg = {
-            type: "set",
-            property: "pause",
-            //value: data
-            value: v
-        };
-        websocket.send(JSON.stringify(msg));
+        sendSet("pause", v);
     };
 
+    // Playback rate without the drift correction
+    let baseRate = 1;
+
     function sendSpeed() {
-        const msg = {
-            type: "set",
-            property: "speed",
-            value: mainVideo.playbackRate
+        // the drift correction is not a speed change of the user
+        if (mainVideo.playbackRate == baseRate + correction) { return };
+        baseRate = mainVideo.playbackRate;
+        correction = 0;
+        sendSet("speed", mainVideo.playbackRate);
+    };
+
+    // High resolution client clock in seconds, the server estimates its offset
+    function clientNow() {
+        return (performance.timeOrigin + performance.now()) / 1000;
+    };
+
+    // Minimum ms between playback reports, lowered by the server while it corrects drift
+    let reportInterval = 0;
+    let lastReport = 0;
+
+    // Drift correction against the schedule pushed by the server: where mpv
+    // is at a given client time, corrected here on every timeupdate
+    const MAX_DIFF = 2;  // seconds, further off is left to the server
+    const ACCURACY = 0.04;  // seconds off before the rate is corrected
+    const SETTLED = 0.01;  // seconds off once a correction stops
+    const MAX_OFFSET = 0.1;  // largest change of the playback rate
+    let schedule = null;
+    let correction = 0;
+
+    function setSchedule(msg) {
+        schedule = (msg.value == null) ? null : msg;
+        if (!schedule) { setCorrection(0) };
+    };
+
+    // False when the video is too far off the schedule to catch up by its rate
+    function followSchedule() {
+        if (mainVideo.paused || mainVideo.seeking) { return true };
+        const target = schedule.value + schedule.speed * (clientNow() - schedule.time) + schedule.delay;
+        const diff = target - mainVideo.currentTime;
+        if (Math.abs(diff) > MAX_DIFF) {
+            setCorrection(0);
+            return false;
         };
-        websocket.send(JSON.stringify(msg));
+        if (Math.abs(diff) <= (correction ? SETTLED : ACCURACY)) {
+            setCorrection(0);
+        } else {
+            // caught up in about a second
+            const offset = Math.max(-MAX_OFFSET, Math.min(MAX_OFFSET, Math.round(diff * 100) / 100));
+            setCorrection(offset || Math.sign(diff) * 0.01);
+        };
+        return true;
+    };
+
+    function setCorrection(offset) {
+        if (offset == correction) { return };
+        correction = offset;
+        mainVideo.playbackRate = baseRate + offset;
     };
 
-    // Send current playback time
+    // Send current playback time, right away when it left the schedule
     function getTime() {
+        const exception = schedule != null && !followSchedule();
+        if (!exception && performance.now() - lastReport < reportInterval) { return };
+        lastReport = performance.now();
         const currentPlaybackTime = mainVideo.currentTime;
-        const currentTimeSec = Date.now()/1000;
+        const currentTimeSec = clientNow();
+        if (binary) {
+            const view = new DataView(new ArrayBuffer(17));
+            view.setUint8(0, 1);
+            view.setFloat64(1, currentPlaybackTime, true);
+            view.setFloat64(9, currentTimeSec, true);
+            websocket.send(view.buffer);
+            return;
+        };
         const msg = {
             type: "playbackSync",
             property: "playback-time",
@@ -68,12 +167,121 @@
         //console.log(currentTime);
     };
 
-    function stopSync() {
-        running = false;
+    // Loudness envelope of the video, streamed while the server detects the delay
+    const AUDIO_BLOCK = 1024;
+    const AUDIO_CHUNK = 1;  // seconds of envelope per message, the server estimates after each
+    let audioContext;
+    let audioProcessor;
+    let envelope = [];
+    let envelopeStart = 0;
+
+    function flushEnvelope() {
+        if (envelope.length == 0) { return };
+        const msg = {
+            type: "audioEnvelope",
+            time: envelopeStart,
+            rate: audioContext.sampleRate / AUDIO_BLOCK,
+            value: envelope
+        };
+        websocket.send(JSON.stringify(msg));
+        envelope = [];
+    };
+
+    function captureAudio(evt) {
+        if (mainVideo.paused) { return };
+        const samples = evt.inputBuffer.getChannelData(0);
+        let sum = 0;
+        for (let i = 0; i < samples.length; i++) {
+            sum += samples[i] * samples[i];
+        };
+        const duration = AUDIO_BLOCK / audioContext.sampleRate;
+        const start = mainVideo.currentTime - duration;
+        // a seek or stall starts a new chunk
+        if (Math.abs(start - (envelopeStart + envelope.length * duration)) > 2 * duration) {
+            flushEnvelope();
+        };
+        if (envelope.length == 0) {
+            envelopeStart = start;
+        };
+        envelope.push(Math.sqrt(sum / samples.length));
+        if (envelope.length * duration >= AUDIO_CHUNK) {
+            flushEnvelope();
+        };
+    };
+
+    function startAudio() {
+        if (!audioContext) {
+            // the element can only be routed through one context, keep it for the page
+            audioContext = new AudioContext();
+            const source = audioContext.createMediaElementSource(mainVideo);
+            source.connect(audioContext.destination);
+            audioProcessor = audioContext.createScriptProcessor(AUDIO_BLOCK, 1, 1);
+            source.connect(audioProcessor);
+            audioProcessor.connect(audioContext.destination);
+        };
+        envelope = [];
+        audioContext.resume();
+        audioProcessor.onaudioprocess = captureAudio;
+    };
+
+    function stopAudio() {
+        if (audioProcessor) {
+            audioProcessor.onaudioprocess = null;
+        };
+        envelope = [];
+    };
+
+    // Tell the server a seek it asked for has landed and can play
+    function sendReady() {
+        if (mainVideo.readyState < mainVideo.HAVE_FUTURE_DATA) {
+            mainVideo.addEventListener("canplay", sendReady, { once: true });
+            return;
+        };
+        const msg = {
+            type: "notice",
+            value: "ready"
+        };
+        websocket.send(JSON.stringify(msg));
+    };
+
+    function removeListeners() {
+        stopAudio();
         mainVideo.removeEventListener("timeupdate", getTime);
         mainVideo.removeEventListener("playing", sendState);
         mainVideo.removeEventListener("pause", sendState);
         mainVideo.removeEventListener("ratechange", sendSpeed);
+        setSchedule({ value: null });
+    };
+
+    // The resume token of the session, it expires a while after the connection is gone
+    function resumeToken() {
+        const session = JSON.parse(sessionStorage.getItem(RESUME_KEY));
+        if (!session || session.url != window.location.href) { return null };
+        if (session.expires != null && session.expires < Date.now()) { return null };
+        return session.token;
+    };
+
+    function leaveSession() {
+        const session = JSON.parse(sessionStorage.getItem(RESUME_KEY));
+        if (session && session.expires == null) {
+            session.expires = Date.now() + session.grace * 1000;
+            sessionStorage.setItem(RESUME_KEY, JSON.stringify(session));
+        };
+    };
+
+    function sendFocus() {
+        const msg = {
+            type: "notice",
+            value: "focus"
+        };
+        websocket.send(JSON.stringify(msg));
+        console.log("Page in focus")
+    };
+
+    function stopSync() {
+        running = false;
+        sessionStorage.removeItem(RESUME_KEY);
+        removeListeners();
         const msg = {
             type: "notice",
             value: "clientStop"
@@ -84,16 +292,27 @@
 
     function startSync() {
         running = true;
+        const token = resumeToken();
         GM_unregisterMenuCommand(mn);
         mn = GM_registerMenuCommand("UnSync", stopSync);
-        websocket = new WebSocket(`${protocol}://localhost:${PORT}/`);
+        websocket = new WebSocket(`${protocol}://${HOST}:${PORT}/${VIEWER ? "watch" : ""}${token ? "?resume=" + token : ""}`, SUBPROTOCOLS);
+        websocket.binaryType = "arraybuffer";
+        websocket.addEventListener("open", () => {
+            binary = websocket.protocol == "syncreaction.bin";
+            // announces that seeks are reported
+            websocket.send(JSON.stringify({ type: "notice", value: "ready" }));
+            // corrects its own drift when the server sends a schedule
+            websocket.send(JSON.stringify({ type: "notice", value: "schedule" }));
+        });
         mainVideo = document.getElementsByTagName('video')[0];
+        baseRate = mainVideo.playbackRate;
+        correction = 0;
         console.log(document.getElementsByTagName('video'));
 
 
         // Handle messages received from server
         websocket.addEventListener("message", ({ data }) => {
-            const msg = JSON.parse(data);
+            const msg = (data instanceof ArrayBuffer) ? decodeFrame(data) : JSON.parse(data);
             //console.log(msg);
             if (msg.type == "set") {
                 switch (msg.property) {
@@ -109,20 +328,28 @@
                         mainVideo.addEventListener("pause", sendState);
                         break;
                     case "playback-time":
+                        mainVideo.addEventListener("seeked", sendReady, { once: true });
                         mainVideo.currentTime = msg.value;
                         break;
                     case "speed":
+                        baseRate = msg.value;
+                        correction = 0;
                         mainVideo.playbackRate = msg.value;
                         break;
                     case "speedOffset":
                         mainVideo.playbackRate = mainVideo.playbackRate + msg.value;
                         break;
+                    case "reportInterval":
+                        reportInterval = msg.value;
+                        break;
                     case "removeListener":
                         if (msg.value == "state") {
                             mainVideo.removeEventListener("playing", sendState);
                             mainVideo.removeEventListener("pause", sendState);
                         } else if (msg.value == "playback-time") {
                             mainVideo.removeEventListener("timeupdate", getTime);
+                        } else if (msg.value == "audio") {
+                            stopAudio();
                         };
                         break;
                     case "addListener":
@@ -131,6 +358,8 @@
                             mainVideo.addEventListener("pause", sendState);
                         } else if (msg.value == "playback-time") {
                             mainVideo.addEventListener("timeupdate", getTime);
+                        } else if (msg.value == "audio") {
+                            startAudio();
                         };
                         break;
                 };
@@ -153,17 +382,28 @@
                         };
                         break;
                 };
+                answer.id = msg.id;
                 websocket.send(JSON.stringify(answer));
                 //console.log("answering:");
                 //console.log(answer);
+            } else if (msg.type == "schedule") {
+                setSchedule(msg);
+            } else if (msg.type == "session") {
+                const session = { token: msg.value, grace: msg.grace, url: window.location.href, expires: null };
+                sessionStorage.setItem(RESUME_KEY, JSON.stringify(session));
+            } else if (msg.type == "ping") {
+                const answer = {
+                    type: "pong",
+                    value: msg.value,
+                    time: clientNow()
+                };
+                websocket.send(JSON.stringify(answer));
             } else if (msg.type == "notice") {
                 switch (msg.value) {
                     case "stopping server":
                         running = false;
-                        mainVideo.removeEventListener("timeupdate", getTime);
-                        mainVideo.removeEventListener("playing", sendState);
-                        mainVideo.removeEventListener("pause", sendState);
-                        mainVideo.removeEventListener("ratechange", sendSpeed);
+                        removeListeners();
+                        sessionStorage.removeItem(RESUME_KEY);
                         websocket.close(1000);
                         break;
                 };
@@ -175,25 +415,33 @@
 
         mainVideo.addEventListener("ratechange", sendSpeed);
 
-        document.addEventListener("focus", function(){
-            const msg = {
-                type: "notice",
-                value: "focus"
-            };
-            websocket.send(JSON.stringify(msg));
-            console.log("Page in focus")
-        })
+        document.addEventListener("focus", sendFocus);
 
 
         websocket.addEventListener("error", function (e) {
+            // onclose follows, it reconnects or stops
             console.log(e);
-            stopSync();
         });
 
         websocket.onclose = () => {
+            if (running) {
+                // dropped without UnSync
+                removeListeners();
+                leaveSession();
+                if (resumeToken()) {
+                    setTimeout(startSync, RECONNECT_DELAY);
+                    return;
+                };
+                running = false;
+            };
             GM_unregisterMenuCommand(mn);
             mn = GM_registerMenuCommand("Sync", startSync);
         };
     };
 
+    // the tab was reloaded while synced
+    if (resumeToken()) {
+        startSync();
+    };
+
 })();
@@ -0,0 +1,6 @@
+import sys
+
+from pathlib import Path
+
+# the script imports its modules from its own directory, as mpv runs it
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "SyncReaction"))
@@ -0,0 +1,52 @@
+import pytest
+
+import SyncReaction
+from SyncReaction import ClockEstimate
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = {"monotonic": 100.0, "time": 1_700_000_000.0}
+    monkeypatch.setattr(SyncReaction.time, "monotonic", lambda: now["monotonic"])
+    monkeypatch.setattr(SyncReaction.time, "time", lambda: now["time"])
+    return now
+
+
+def test_offset_from_a_symmetric_exchange():
+    clock = ClockEstimate()
+    # client clock 50 s ahead, 20 ms each way
+    clock.add_sample(sent=100.0, client_time=150.02, received=100.04)
+    assert clock.rtt == pytest.approx(0.04)
+    assert clock.offset == pytest.approx(50)
+
+
+def test_trusts_the_lowest_round_trip():
+    clock = ClockEstimate()
+    clock.add_sample(sent=100.0, client_time=150.02, received=100.04)
+    # the reply was delayed on the way back, the sample is off by half the extra time
+    clock.add_sample(sent=101.0, client_time=151.02, received=101.5)
+    assert clock.rtt == pytest.approx(0.04)
+    assert clock.offset == pytest.approx(50)
+
+
+def test_old_samples_leave_the_window():
+    clock = ClockEstimate()
+    clock.add_sample(sent=0.0, client_time=50.0, received=0.0)
+    for i in range(ClockEstimate.window):
+        sent = 10.0 + i
+        clock.add_sample(sent=sent, client_time=sent + 60.1, received=sent + 0.2)
+    assert clock.rtt == pytest.approx(0.2)
+    assert clock.offset == pytest.approx(60)
+
+
+def test_converts_between_the_clocks(clock):
+    estimate = ClockEstimate()
+    estimate.add_sample(sent=99.0, client_time=149.0, received=99.0)
+    assert estimate.to_client(100.0) == pytest.approx(150)
+    assert estimate.elapsed_since(149.5) == pytest.approx(0.5)
+
+
+def test_falls_back_to_the_wall_clock(clock):
+    estimate = ClockEstimate()
+    assert estimate.elapsed_since(clock["time"] - 2) == pytest.approx(2)
+    assert estimate.to_client(clock["monotonic"]) == pytest.approx(clock["time"])
@@ -0,0 +1,51 @@
+import pytest
+
+from delay_map import DelayMap
+
+
+def test_single_segment():
+    delays = DelayMap(3.0)
+    assert len(delays) == 1
+    assert delays.at(0) == delays.at(1000) == 3.0
+    assert delays.index(-1) == 0
+
+
+def test_set_splits_and_looks_up_by_mpv_time():
+    delays = DelayMap(1.0)
+    delays.set(60, 5.0)
+    delays.set(30, 3.0)
+    assert delays.segments() == [(0.0, 1.0), (30, 3.0), (60, 5.0)]
+    assert delays.at(29.9) == 1.0
+    assert delays.at(30) == 3.0
+    assert delays.at(61) == 5.0
+
+
+def test_set_at_a_breakpoint_replaces_its_delay():
+    delays = DelayMap(1.0)
+    delays.set(30, 3.0)
+    delays.set(30, 4.0)
+    assert delays.segments() == [(0.0, 1.0), (30, 4.0)]
+
+
+def test_neighbours_with_the_same_delay_merge():
+    delays = DelayMap(1.0)
+    delays.set(30, 1.0 + DelayMap.merge / 2)
+    assert delays.segments() == [(0.0, 1.0)]
+    delays.set(30, 3.0)
+    delays.set(60, 5.0)
+    delays.shift(45, 2.0)
+    assert delays.segments() == [(0.0, 1.0), (30, 5.0)]
+
+
+def test_from_segments_sorts_and_round_trips():
+    segments = [(60.0, 5.0), (0.0, 1.0), (30.0, 3.0)]
+    delays = DelayMap.from_segments(segments)
+    assert delays.segments() == sorted(segments)
+    assert DelayMap.from_segments(delays.segments()).segments() == delays.segments()
+
+
+def test_shift_moves_only_the_current_segment():
+    delays = DelayMap.from_segments([(0.0, 1.0), (30.0, 3.0)])
+    delays.shift(10, -0.5)
+    assert delays.at(10) == pytest.approx(0.5)
+    assert delays.at(40) == 3.0
@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+from delay_map import DelayMap
+from delay_store import DelayStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DelayStore(tmp_path, 3)
+    yield store
+    store.close()
+
+
+def test_get_missing_raises_key_error(store):
+    with pytest.raises(KeyError):
+        store.get("missing")
+
+
+def test_put_get_returns_a_copy(store):
+    store.put("a", DelayMap(1.5))
+    delays = store.get("a")
+    delays.set(10, 4)
+    assert store.get("a").segments() == [(0.0, 1.5)]
+
+
+def test_least_recently_used_is_evicted(store):
+    for key in "abc":
+        store.put(key, DelayMap(1))
+    store.get("a")
+    store.put("d", DelayMap(1))
+    assert "b" not in store
+    assert {"a", "c", "d"} == set(store.entries)
+    assert len(store) == 3
+
+
+def test_peek_keeps_the_eviction_order(store):
+    for key in "abc":
+        store.put(key, DelayMap(1))
+    assert store.peek("a").at(0) == 1
+    store.put("d", DelayMap(1))
+    assert "a" not in store
+
+
+def test_touch_marks_a_peeked_entry_as_used(store):
+    for key in "abc":
+        store.put(key, DelayMap(1))
+    store.peek("a")
+    store.touch("a")
+    store.put("d", DelayMap(1))
+    assert list(store.entries) == ["c", "a", "d"]
+
+
+def test_persists_segments_and_order(tmp_path):
+    store = DelayStore(tmp_path, 3)
+    store.put("one", DelayMap(1))
+    store.put("split", DelayMap.from_segments([(0.0, 1.0), (30.0, 3.0)]))
+    store.get("one")
+    assert store.close()
+
+    reopened = DelayStore(tmp_path, 3)
+    try:
+        # least recently used first, "one" was read after "split" was written
+        assert list(reopened.entries) == ["split", "one"]
+        assert reopened.get("split").segments() == [(0.0, 1.0), (30.0, 3.0)]
+    finally:
+        reopened.close()
+
+
+def test_evicts_on_open_when_the_size_shrank(tmp_path):
+    store = DelayStore(tmp_path, 3)
+    for key in "abc":
+        store.put(key, DelayMap(1))
+    store.close()
+    smaller = DelayStore(tmp_path, 2)
+    smaller.close()
+    reopened = DelayStore(tmp_path, 3)
+    reopened.close()
+    assert list(reopened.entries) == ["b", "c"]
+
+
+def test_migrates_the_json_cache(tmp_path):
+    legacy = {"old": [2.0, "2024-01-01 10:00"], "new": [-1.0, "2024-02-01 10:00"]}
+    (tmp_path / "SyncReaction_cache.json").write_text(json.dumps(legacy))
+    store = DelayStore(tmp_path, 5)
+    try:
+        assert store.get("old").at(0) == 2.0
+        assert store.entries["new"][1] == "2024-02-01 10:00"
+        assert not (tmp_path / "SyncReaction_cache.json").exists()
+        assert (tmp_path / "SyncReaction_cache.json.migrated").exists()
+    finally:
+        store.close()
+
+
+def test_migration_skips_malformed_entries(tmp_path):
+    legacy = {
+        "ok": [1.0, "2024-01-01 10:00"],
+        "text": ["1.0", "2024-01-01 10:00"],
+        "flag": [True, "2024-01-01 10:00"],
+        "short": [1.0],
+        "nan": [float("nan"), "2024-01-01 10:00"],
+        "plain": 1.0,
+    }
+    (tmp_path / "SyncReaction_cache.json").write_text(json.dumps(legacy))
+    store = DelayStore(tmp_path, 10)
+    store.close()
+    assert list(store.entries) == ["ok"]
+
+
+def test_migration_replaces_an_earlier_migrated_file(tmp_path):
+    (tmp_path / "SyncReaction_cache.json.migrated").write_text("{}")
+    (tmp_path / "SyncReaction_cache.json").write_text(json.dumps({"a": [1.0, "2024-01-01 10:00"]}))
+    store = DelayStore(tmp_path, 3)
+    store.close()
+    assert "a" in store
+    assert json.loads((tmp_path / "SyncReaction_cache.json.migrated").read_text()) == {"a": [1.0, "2024-01-01 10:00"]}
+
+
+def test_close_is_idempotent_and_stops_writing(store):
+    assert store.close()
+    assert store.close()
+    store.put("late", DelayMap(1))  # kept in memory, not written
+    assert "late" in store
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+import hub
+import wire
+from delay_map import DelayMap
+from hub import Viewer, ViewerGroup
+
+
+class FakeSocket:
+    def __init__(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    frames = []
+    monkeypatch.setattr(hub.websockets, "broadcast", lambda sockets, frame: frames.append((set(sockets), frame)))
+    return frames
+
+
+def join(group, subprotocol=None):
+    viewer = Viewer(FakeSocket(subprotocol), group)
+    group.add(viewer)
+    return viewer
+
+
+def test_viewers_are_grouped_by_subprotocol():
+    group = ViewerGroup("video", DelayMap(1.0))
+    first, second, binary = join(group), join(group), join(group, wire.BINARY)
+    assert len(group) == 3
+    group.discard(first)
+    group.discard(first)
+    assert len(group) == 2
+    group.discard(binary)
+    assert set(group.sockets) == {None}
+    assert group.sockets[None] == {second.socket}
+
+
+def test_broadcast_encodes_once_per_subprotocol(sent):
+    group = ViewerGroup("video", DelayMap(1.0))
+    json_viewers = {join(group).socket, join(group).socket}
+    binary_viewer = join(group, wire.BINARY).socket
+    group.set("pause", True)
+    assert len(sent) == 2
+    frames = {frozenset(sockets): frame for sockets, frame in sent}
+    assert json.loads(frames[frozenset(json_viewers)]) == {"type": "set", "property": "pause", "value": True}
+    binary = frames[frozenset({binary_viewer})]
+    assert isinstance(binary, bytes)
+    assert wire.decode(binary)["value"] == 1  # values travel as doubles
+
+
+def test_seek_starts_the_settle_time_of_every_viewer(sent):
+    group = ViewerGroup("video", DelayMap(1.0))
+    viewer = join(group)
+    assert not viewer.settling(hub.time.monotonic())
+    group.seek(42.0)
+    assert viewer.settling(hub.time.monotonic())
+    assert not viewer.settling(hub.time.monotonic() + Viewer.settle)
+    assert json.loads(sent[-1][1])["value"] == 42.0
+
+
+def test_viewer_clock_keeps_the_fastest_ping(sent):
+    viewer = Viewer(FakeSocket(), ViewerGroup("video", DelayMap(1.0)))
+    viewer.add_clock_sample(sent=10.0, client_time=60.05, received=10.1)
+    viewer.add_clock_sample(sent=11.0, client_time=61.3, received=11.5)
+    assert viewer.rtt == pytest.approx(0.1)
+    assert viewer.offset == pytest.approx(50)
+    assert viewer.pings == 2  # the burst continues until Viewer.burst pings
@@ -0,0 +1,55 @@
+from metrics import Histogram, Metrics
+
+
+def make():
+    metrics = Metrics(prefix="test_")
+    metrics.counter("frames_total", "Frames sent")
+    metrics.histogram("drift_seconds", "Drift", (0.1, 1))
+    metrics.gauge("clients", "Clients", lambda: 3)
+    return metrics
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram((0.1, 1))
+    for value in (0.05, 0.1, 0.5, 5):
+        histogram.observe(value)
+    assert histogram.cumulative() == [("0.1", 2), ("1", 3), ("+Inf", 4)]
+    assert histogram.count == 4
+    assert histogram.sum == 5.65
+
+
+def test_prometheus_text():
+    metrics = make()
+    metrics.inc("frames_total", type="set")
+    metrics.inc("frames_total", 2, type="set")
+    metrics.observe("drift_seconds", 0.5)
+    text = metrics.prometheus()
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert "# HELP test_frames_total Frames sent" in lines
+    assert "# TYPE test_frames_total counter" in lines
+    assert 'test_frames_total{type="set"} 3' in lines
+    assert "# TYPE test_clients gauge" in lines
+    assert "test_clients 3" in lines
+    assert 'test_drift_seconds_bucket{le="0.1"} 0' in lines
+    assert 'test_drift_seconds_bucket{le="+Inf"} 1' in lines
+    assert "test_drift_seconds_sum 0.5" in lines
+    assert "test_drift_seconds_count 1" in lines
+
+
+def test_label_values_are_escaped():
+    metrics = make()
+    metrics.inc("frames_total", client='a"b\\c\nd')
+    assert 'test_frames_total{client="a\\"b\\\\c\\nd"} 1' in metrics.prometheus().splitlines()
+
+
+def test_snapshot():
+    metrics = make()
+    metrics.inc("frames_total", client="x")
+    metrics.observe("drift_seconds", 0.05, client="x")
+    snapshot = metrics.snapshot()
+    assert snapshot["counters"]["frames_total"] == [{"labels": {"client": "x"}, "value": 1}]
+    assert snapshot["gauges"] == {"clients": 3}
+    histogram = snapshot["histograms"]["drift_seconds"][0]
+    assert histogram["buckets"] == {"0.1": 1, "1": 1, "+Inf": 1}
+    assert histogram["count"] == 1
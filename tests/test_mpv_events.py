@@ -0,0 +1,104 @@
+import asyncio
+import contextvars
+import threading
+
+from mpv_events import EventChannel
+
+session = contextvars.ContextVar("session", default=None)
+
+
+def run(scenario):
+    async def main():
+        return await scenario(EventChannel(asyncio.get_running_loop()))
+
+    return asyncio.run(main())
+
+
+async def settle(seconds=0.0):
+    await asyncio.sleep(seconds)
+    await asyncio.sleep(0)
+
+
+def test_batch_delivers_the_newest_value_of_a_property():
+    async def scenario(channel):
+        seen = []
+        observer = channel.observer("speed", lambda name, value: seen.append(value))
+        for value in (1, 1.5, 2):
+            observer("speed", value)
+        await settle()
+        return seen
+
+    assert run(scenario) == [2]
+
+
+def test_every_key_press_counts():
+    async def scenario(channel):
+        presses = []
+        binding = channel.key_binding(lambda: presses.append(1))
+        binding()
+        binding()
+        await settle()
+        return len(presses)
+
+    assert run(scenario) == 2
+
+
+def test_handlers_run_on_the_loop_in_the_channel_context():
+    session.set("first")
+
+    async def scenario(channel):
+        seen = []
+
+        def callback(name, value):
+            seen.append((threading.current_thread() is threading.main_thread(), session.get()))
+
+        observer = channel.observer("pause", callback)
+        thread = threading.Thread(target=observer, args=("pause", True))
+        thread.start()
+        thread.join()
+        await settle()
+        return seen
+
+    assert run(scenario) == [(True, "first")]
+
+
+def test_failing_handler_does_not_drop_the_batch(capsys):
+    async def scenario(channel):
+        seen = []
+
+        def fail(name, value):
+            raise RuntimeError(name)
+
+        channel.observer("pause", fail)("pause", True)
+        channel.observer("speed", lambda name, value: seen.append(value))("speed", 2)
+        await settle()
+        return seen
+
+    assert run(scenario) == [2]
+    assert "RuntimeError: pause" in capsys.readouterr().err
+
+
+def test_debounced_flag_reports_a_burst_once():
+    async def scenario(channel):
+        seen = []
+        observer = channel.observer("seeking", lambda name, value: seen.append(value), debounce=0.05)
+        for _ in range(3):
+            observer("seeking", True)
+            await settle()
+            observer("seeking", False)
+            await settle(0.01)
+        assert seen == [True]
+        await settle(0.1)
+        return seen
+
+    assert run(scenario) == [True, False]
+
+
+def test_debounced_flag_ignores_a_release_that_was_never_started():
+    async def scenario(channel):
+        seen = []
+        channel.observer("seeking", lambda name, value: seen.append(value), debounce=0.01)("seeking", False)
+        await settle(0.05)
+        return seen
+
+    assert run(scenario) == []
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from osd_status import OsdStatus
+
+
+def test_messages_replace_the_previous_one_with_the_same_key():
+    osd = OsdStatus(print)
+    osd.show("first")
+    osd.show("second")
+    osd.show("other", key="cache")
+    assert osd.render(0) == "second\nother"
+
+
+def test_expired_lines_are_hidden():
+    osd = OsdStatus(print)
+    osd.show("short", 1)
+    osd.update("a", "tab", state="seeking", duration=2)
+    now = osd.messages["info"][1]
+    assert osd.render(now - 0.5) == "short\ntab   seeking"
+    assert osd.next_expiry(now - 0.5) == pytest.approx(0.5)
+    assert osd.render(now + 0.5) == "tab   seeking"
+    assert osd.render(now + 1.5) == ""
+    assert osd.next_expiry(now + 1.5) is None
+
+
+def test_client_line_keeps_fields_left_as_none():
+    osd = OsdStatus(print)
+    osd.update("a", "tab", delay=75.5, drift=0.25, state="speed: 1.05")
+    osd.update("a", "tab (sub)", drift=-0.1)
+    assert osd.render(0) == "tab (sub)   delay 1:15.500   diff -0.100   speed: 1.05"
+
+
+def test_client_line_without_a_state_is_hidden():
+    osd = OsdStatus(print)
+    osd.update("a", "tab", delay=1)
+    assert osd.render(0) == ""
+    osd.update("b", "other", state="synced")
+    osd.remove("b")
+    assert osd.render(0) == ""
+
+
+def test_burst_of_updates_draws_once_per_frame():
+    frames = []
+
+    async def scenario():
+        osd = OsdStatus(frames.append)
+        renderer = asyncio.create_task(osd.run())
+        for i in range(50):
+            osd.update("a", "tab", drift=i / 100, state="speed: 1.05")
+            await asyncio.sleep(0)
+        await asyncio.sleep(1.5 / OsdStatus.fps)
+        osd.update("a", "tab", drift=0.49, state="speed: 1.05")  # same text
+        await asyncio.sleep(1.5 / OsdStatus.fps)
+        renderer.cancel()
+
+    asyncio.run(scenario())
+    assert len(frames) <= 2
+    assert frames[-1] == "tab   diff +0.490   speed: 1.05"
@@ -0,0 +1,70 @@
+import pytest
+
+import async_mpv
+from async_mpv import PropertyMirror
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(async_mpv.time, "monotonic", lambda: now[0])
+    return now
+
+
+def playing(clock, position=10.0, speed=1):
+    mirror = PropertyMirror()
+    mirror.update("speed", speed)
+    mirror.update("pause", False)
+    mirror.update("core-idle", False)
+    mirror.update("playback-time", position)
+    return mirror
+
+
+def test_extrapolates_while_playing(clock):
+    mirror = playing(clock)
+    clock[0] += 2
+    assert mirror.playback_time() == pytest.approx(12)
+    assert mirror.rate() == 1
+
+
+def test_extrapolates_with_the_speed(clock):
+    mirror = playing(clock, speed=1.5)
+    clock[0] += 2
+    assert mirror.playback_time() == pytest.approx(13)
+
+
+def test_speed_change_rebases_the_position(clock):
+    mirror = playing(clock)
+    clock[0] += 2
+    mirror.update("speed", 2)
+    clock[0] += 1
+    assert mirror.playback_time() == pytest.approx(14)
+
+
+@pytest.mark.parametrize("name", ["pause", "core-idle"])
+def test_holds_the_position_while_stopped(clock, name):
+    mirror = playing(clock)
+    clock[0] += 1
+    mirror.update(name, True)
+    clock[0] += 5
+    assert mirror.playback_time() == pytest.approx(11)
+    assert mirror.rate() == 0
+    mirror.update(name, False)
+    clock[0] += 1
+    assert mirror.playback_time() == pytest.approx(12)
+
+
+def test_reported_position_replaces_the_extrapolation(clock):
+    mirror = playing(clock)
+    clock[0] += 2
+    mirror.update("playback-time", 30.0)
+    assert mirror.playback_time() == 30.0
+    assert mirror["playback-time"] == 30.0
+    assert mirror.stamps["playback-time"] == clock[0]
+
+
+def test_missing_position_counts_as_zero(clock):
+    mirror = PropertyMirror()
+    mirror.update("playback-time", None)
+    assert mirror.playback_time() == 0
+    assert mirror["filename"] is None
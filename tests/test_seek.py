@@ -0,0 +1,153 @@
+import asyncio
+import uuid
+
+import pytest
+
+import SyncReaction
+from SyncReaction import PlayerClient, PlayerStatus, ResumeBarrier, SeekLatency
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(SyncReaction.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_seek_latency_before_any_sample():
+    latency = SeekLatency()
+    assert latency.predict() == SeekLatency.initial
+    assert not latency.in_flight()
+
+
+def test_seek_latency_smooths_the_samples(clock):
+    latency = SeekLatency()
+    latency.seek_sent()
+    clock[0] += 0.45
+    latency.seek_ready(rtt=0.1)  # the notice took half the round trip
+    assert latency.predict() == pytest.approx(0.4)
+    latency.seek_sent()
+    clock[0] += 0.8
+    latency.seek_ready(rtt=0)
+    assert latency.predict() == pytest.approx(0.4 + SeekLatency.gain * 0.4)
+
+
+def test_seek_latency_ignores_stalls_and_unrequested_notices(clock):
+    latency = SeekLatency()
+    latency.seek_ready(rtt=0)
+    latency.seek_sent()
+    clock[0] += SeekLatency.max_sample + 1
+    latency.seek_ready(rtt=0)
+    assert latency.mean is None
+
+
+def test_seek_in_flight_until_the_expected_latency(clock):
+    latency = SeekLatency()
+    latency.seek_sent()
+    clock[0] += 0.9
+    assert latency.in_flight()
+    clock[0] += 0.2
+    assert not latency.in_flight()
+
+
+def test_barrier_opens_when_the_last_player_is_ready():
+    async def scenario():
+        barrier = ResumeBarrier(resume=True)
+        barrier.add("mpv")
+        barrier.add("tab")
+        waiting = asyncio.create_task(barrier.wait())
+        barrier.ready("mpv")
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        barrier.ready("tab")
+        return await asyncio.wait_for(waiting, 1)
+
+    assert asyncio.run(scenario()) == set()
+
+
+def test_barrier_gives_up_on_silent_players(monkeypatch):
+    monkeypatch.setattr(ResumeBarrier, "timeout", 0.01)
+
+    async def scenario():
+        barrier = ResumeBarrier(resume=False)
+        barrier.add("mpv")
+        barrier.add("tab")
+        barrier.ready("mpv")
+        return await barrier.wait()
+
+    assert asyncio.run(scenario()) == {"tab"}
+
+
+class FakeSocket:
+    subprotocol = None
+    remote_address = ("127.0.0.1", 0)
+
+    def __init__(self):
+        self.id = uuid.uuid4()
+
+    async def send(self, frame):
+        pass
+
+
+def with_player(check):
+    async def scenario():
+        player = PlayerClient(FakeSocket())
+        try:
+            check(player)
+        finally:
+            player.close()
+
+    asyncio.run(scenario())
+
+
+def send_pause(player, value):
+    player.send({"type": "set", "property": "pause", "value": value})
+
+
+def test_answer_to_a_sent_pause_is_stale():
+    def check(player):
+        send_pause(player, True)
+        assert player.is_stale(PlayerStatus.PAUSED)
+        assert not player.is_stale(PlayerStatus.PLAYING)
+
+    with_player(check)
+
+
+def test_late_answers_are_stale_until_the_last_one():
+    def check(player):
+        send_pause(player, True)
+        send_pause(player, False)
+        assert player.is_stale(PlayerStatus.PAUSED)  # answers the first value
+        assert player.is_stale(PlayerStatus.PLAYING)
+        assert not player.is_stale(PlayerStatus.PAUSED)  # a user action
+
+    with_player(check)
+
+
+def test_report_sent_before_the_value_arrived_is_stale():
+    def check(player):
+        send_pause(player, False)
+        assert player.is_stale(PlayerStatus.PAUSED)
+        assert player.is_stale(PlayerStatus.PLAYING)
+        assert not player.pushed_pause
+
+    with_player(check)
+
+
+def test_buffering_answers_the_oldest_value():
+    def check(player):
+        send_pause(player, False)
+        assert not player.is_stale(PlayerStatus.BUFFERING)
+        assert not player.is_stale(PlayerStatus.PLAYING)
+
+    with_player(check)
+
+
+def test_unanswered_values_expire():
+    def check(player):
+        send_pause(player, True)
+        value, sent = player.pushed_pause[0]
+        player.pushed_pause[0] = (value, sent - PlayerClient.echo_window - 1)
+        assert not player.is_stale(PlayerStatus.PLAYING)
+
+    with_player(check)
@@ -0,0 +1,98 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+from websockets.datastructures import Headers
+from websockets.http11 import Request
+
+import SyncReaction
+
+
+class FakeConnection:
+    def __init__(self, address="127.0.0.1"):
+        self.remote_address = (address, 50000)
+
+    def respond(self, status, text):
+        return status
+
+
+@pytest.fixture
+def attached(monkeypatch, tmp_path):
+    sockets = []
+    monkeypatch.setattr(SyncReaction, "directory", tmp_path, raising=False)
+    monkeypatch.setattr(SyncReaction, "attach_session", lambda socket, **kwargs: sockets.append(socket))
+    monkeypatch.setattr(SyncReaction, "attach_key", None)
+    SyncReaction.write_attach_key()
+    return sockets
+
+
+def attach(headers, address="127.0.0.1"):
+    request = Request("/attach?socket=mpvB&cache=1", Headers(headers))
+    return SyncReaction.attach_request(FakeConnection(address), request)
+
+
+def key():
+    return SyncReaction.attach_key
+
+
+def test_key_file_is_private(tmp_path, attached):
+    path = tmp_path / "SyncReaction_attach.key"
+    assert path.read_text() == key()
+    assert path.stat().st_mode & 0o777 == 0o600
+
+
+def test_attach_with_the_key(attached):
+    assert attach({"X-SyncReaction-Key": key()}) == HTTPStatus.OK
+    assert attached == ["mpvB"]
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-SyncReaction-Key": "guess"}, {"X-SyncReaction-Key": "é"}])
+def test_attach_without_the_key(attached, headers):
+    assert attach(headers) == HTTPStatus.FORBIDDEN
+    assert attached == []
+
+
+@pytest.mark.parametrize("header", [("Origin", "http://example.com"), ("Sec-Fetch-Site", "cross-site")])
+def test_attach_from_a_browser(attached, header):
+    # a page could only learn the key from the file, rejected all the same
+    assert attach(dict([("X-SyncReaction-Key", key()), header])) == HTTPStatus.FORBIDDEN
+    assert attached == []
+
+
+def test_attach_from_another_machine(attached):
+    assert attach({"X-SyncReaction-Key": key()}, address="192.168.1.2") == HTTPStatus.FORBIDDEN
+
+
+@pytest.fixture
+def stopped(monkeypatch):
+    calls = []
+    monkeypatch.setattr(SyncReaction, "sessions", [])
+    monkeypatch.setattr(SyncReaction, "end_session", lambda **kwargs: calls.append("end_session"))
+    monkeypatch.setattr(SyncReaction, "stop_server", lambda **kwargs: calls.append("stop_server"))
+    return calls
+
+
+def stop(names, live, pressed):
+    """Press stop in the session pressed of names, live ones are still synced."""
+    async def scenario():
+        created = {name: SyncReaction.Session(name, use_cached=False, daemon=False) for name in names}
+        SyncReaction.sessions.extend(created[name] for name in live)
+        SyncReaction.in_session(created[pressed], SyncReaction.stopScript)
+
+    asyncio.run(scenario())
+
+
+def test_stop_ends_only_the_current_session(stopped):
+    stop(["mpvA", "mpvB"], live=["mpvA", "mpvB"], pressed="mpvB")
+    assert stopped == ["end_session"]
+
+
+def test_stop_in_the_last_session_stops_the_server(stopped):
+    stop(["mpvA"], live=["mpvA"], pressed="mpvA")
+    assert stopped == ["stop_server"]
+
+
+def test_stop_of_an_ended_session_leaves_the_others(stopped):
+    # jsonipc calls its quit_callback once end_session closed it
+    stop(["mpvA", "mpvB"], live=["mpvA"], pressed="mpvB")
+    assert stopped == []
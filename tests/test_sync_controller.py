@@ -0,0 +1,93 @@
+import pytest
+
+from sync_controller import LadderController, PIController, SyncAction, SyncController, controllers
+
+MAX_DIFF, MID_DIFF, ACCURACY = 2, 0.2, 0.15
+
+
+def make(kind):
+    return controllers[kind](MAX_DIFF, MID_DIFF, ACCURACY)
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        SyncController(MAX_DIFF, MID_DIFF, ACCURACY)
+
+
+@pytest.mark.parametrize("kind", ["ladder", "pi"])
+def test_far_off_seeks(kind):
+    assert make(kind).update(MAX_DIFF + 1, 0) == (SyncAction.SEEK, 0)
+    assert make(kind).update(-MAX_DIFF - 1, 0) == (SyncAction.SEEK, 0)
+
+
+@pytest.mark.parametrize("kind", ["ladder", "pi"])
+def test_in_sync_is_idle(kind):
+    assert make(kind).update(ACCURACY / 2, 0) == (SyncAction.IDLE, 0)
+
+
+@pytest.mark.parametrize("kind", ["ladder", "pi"])
+def test_behind_and_ahead_correct_in_opposite_directions(kind):
+    action, faster = make(kind).update(0.5, 0)
+    assert action == SyncAction.SPEED and faster > 0
+    action, slower = make(kind).update(-0.5, 0)
+    assert action == SyncAction.SPEED and slower < 0
+
+
+@pytest.mark.parametrize("kind", ["ladder", "pi"])
+def test_ahead_pauses_when_allowed(kind):
+    action, seconds = make(kind).update(-1, 0, can_pause=True)
+    assert action == SyncAction.PAUSE
+    assert seconds == pytest.approx(1)
+
+
+def test_ladder_steps():
+    controller = make("ladder")
+    assert controller.update(0.5, 0) == (SyncAction.SPEED, 0.05)
+    assert controller.update(0.1, 1) == (SyncAction.SPEED, 0.01)
+    assert controller.update(0.01, 2) == (SyncAction.SYNCED, 0.05)
+    assert controller.accuracy == ACCURACY
+
+
+def test_pi_is_bounded_and_holds_an_unchanged_offset():
+    controller = make("pi")
+    action, offset = controller.update(1.5, 0)
+    assert action == SyncAction.SPEED
+    assert abs(offset) <= PIController.max_offset
+    assert controller.update(1.5, 0.25) == (SyncAction.HOLD, offset)
+
+
+def test_pi_converges_on_a_drifting_player():
+    controller = make("pi")
+    diff, now, speed = 0.8, 0.0, 0.0
+    for _ in range(200):
+        action, value = controller.update(diff, now)
+        if action == SyncAction.SPEED:
+            speed = value
+        elif action == SyncAction.SYNCED:
+            speed = 0
+        now += 0.25
+        diff -= speed * 0.25
+    assert abs(diff) <= ACCURACY
+    episodes = controller.stats.episodes
+    assert len(episodes) >= 1
+    assert episodes[0][2] >= 1  # speed changes
+
+
+def test_stats_record_an_episode_per_correction():
+    controller = LadderController(MAX_DIFF, MID_DIFF, ACCURACY)
+    controller.update(0.5, 0)
+    controller.update(0.01, 2)
+    assert controller.stats.last == (2, 0, 1)
+    assert controller.stats.closed == (2, 0, 1)
+    assert controller.stats.summary().startswith("1 episodes")
+
+
+@pytest.mark.parametrize("kind", ["ladder", "pi"])
+def test_synced_without_a_correction_is_not_an_episode(kind):
+    controller = make(kind)
+    controller.tighten()
+    action, _ = controller.update(0.01, 5)
+    assert action in (SyncAction.SYNCED, SyncAction.IDLE)
+    assert controller.stats.last is None
+    assert controller.stats.closed is None
+    assert controller.stats.start is None
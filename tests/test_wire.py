@@ -0,0 +1,65 @@
+import json
+import struct
+
+import pytest
+import wire
+
+
+@pytest.mark.parametrize("subprotocol", [wire.BINARY, wire.JSON, None])
+@pytest.mark.parametrize("property_name", wire.PROPERTIES)
+def test_set_round_trip(subprotocol, property_name):
+    value = "state" if property_name in ("addListener", "removeListener") else 1.25
+    frame = wire.encode({"type": "set", "property": property_name, "value": value}, subprotocol)
+    assert isinstance(frame, bytes if subprotocol == wire.BINARY else str)
+    msg = wire.decode(frame)
+    assert msg["type"] == "set"
+    assert msg["property"] == property_name
+    if subprotocol == wire.BINARY and isinstance(value, str):
+        assert wire.LISTENERS[int(msg["value"]) - 1] == value
+    else:
+        assert msg["value"] == value
+
+
+def test_playback_sync_frame():
+    frame = struct.pack("<Bdd", wire.PLAYBACK_SYNC, 12.5, 1700000000.25)
+    assert wire.decode(frame) == {"type": "playbackSync", "property": "playback-time", "value": 12.5, "time": 1700000000.25}
+
+
+def test_schedule_is_binary_only_with_a_value():
+    msg = {"type": "schedule", "property": None, "value": 10.0, "speed": 1.5, "time": 99.0, "delay": -2.0}
+    frame = wire.encode(msg, wire.BINARY)
+    assert struct.unpack("<Bdddd", frame) == (wire.SCHEDULE, 10.0, 1.5, 99.0, -2.0)
+    cleared = {"type": "schedule", "property": None, "value": None}
+    assert json.loads(wire.encode(cleared, wire.BINARY)) == cleared
+
+
+def test_other_messages_stay_json():
+    msg = {"type": "notice", "property": None, "value": "stopping server"}
+    assert json.loads(wire.encode(msg, wire.BINARY)) == msg
+    assert wire.decode(json.dumps(msg)) == msg
+
+
+def test_encode_rejects_unknown_listener():
+    with pytest.raises(ValueError, match="unknown listener"):
+        wire.encode({"type": "set", "property": "addListener", "value": "volume"}, wire.BINARY)
+
+
+@pytest.mark.parametrize("frame", [
+    b"",
+    b"\x09",
+    b"\x01\x00",
+    struct.pack("<BBd", wire.SET, 0, 1),
+    struct.pack("<BBd", wire.SET, len(wire.PROPERTIES) + 1, 1),
+    "{",
+    "[1, 2]",
+    '{"value": 1}',
+])
+def test_decode_rejects_malformed_frames(frame):
+    with pytest.raises(wire.DecodeError):
+        wire.decode(frame)
+
+
+def test_select_subprotocol_prefers_binary():
+    assert wire.select_subprotocol(None, [wire.JSON, wire.BINARY]) == wire.BINARY
+    assert wire.select_subprotocol(None, [wire.JSON]) == wire.JSON
+    assert wire.select_subprotocol(None, []) is None